@@ -0,0 +1,86 @@
+"""Request handling shared by the Flask routes and the ASGI app
+
+Both front ends build their upload and job responses here, so status
+codes and payloads stay the same whichever one serves a request.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from ingestion.jobs import DONE, FINISHED
+from services import services
+
+
+def sse_format(data: dict):
+    """Format data as SSE event"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def wants_wait(value: Optional[str]) -> bool:
+    """The ``wait`` query parameter of an upload"""
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+def job_accepted(job_id: str, filename: str) -> Tuple[Dict[str, Any], int]:
+    return {
+        "status": "Queued",
+        "job_id": job_id,
+        "filename": filename,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }, 202
+
+
+def job_result(job: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Result of a finished job, raises with its error when it failed"""
+    if job is None:
+        raise Exception("Job not found")
+    if job["status"] != DONE:
+        raise Exception(job["error"])
+    return job["result"]
+
+
+def pdf_uploaded(filename: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "Successfully Uploaded",
+        "filename": filename,
+        "doc_len": result["doc_len"],
+        "chunks": result["chunks"],
+    }
+
+
+def idioms_uploaded(filename: str, source_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "Successfully Uploaded",
+        "filename": filename,
+        "source": source_name,
+        "docs": result["docs"],
+        "chunks": result["chunks"],
+        "final_count": result["total_points"],
+    }
+
+
+def job_events(job_id: str, seq: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+    """One poll of a job for its SSE stream: (events to send, seq seen, stream ended)
+
+    A progress event is sent whenever the job's ``seq`` changed since the
+    last poll, then a done or error event once it finished.
+    """
+    job = services.job_store.get(job_id)
+    if job is None:
+        return [{"event": "error", "msg": "Job not found"}], seq, True
+    events = []
+    if job["seq"] != seq:
+        seq = job["seq"]
+        events.append({
+            "event": "progress",
+            "job_id": job_id,
+            "status": job["status"],
+            "progress": job["progress"],
+        })
+    if job["status"] not in FINISHED:
+        return events, seq, False
+    if job["status"] == DONE:
+        events.append({"event": "done", "job_id": job_id, "result": job["result"]})
+    else:
+        events.append({"event": "error", "job_id": job_id, "msg": job["error"]})
+    return events, seq, True
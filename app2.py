@@ -1,10 +1,13 @@
+import os
+
 from flask import Flask
 from routes import api_bp
 from config import HOST, PORT, DEBUG
 from flask_cors import CORS
 from stream_routes import stream_bp
+from services import services
 
-def create_app():
+def create_app(warm_up: bool = True):
     """Create and configure Flask app"""
     app = Flask(__name__)
     CORS(app, resources={r"/*": {"origins": "*"}})
@@ -14,11 +17,21 @@ def create_app():
     app.register_blueprint(api_bp)
     app.register_blueprint(stream_bp)
 
+    # Clients, models and indexes are built in the background so the port is
+    # bound immediately; /ready reports when they are done
+    if warm_up:
+        services.warm_up()
+
     return app
 
 def start_app():
     """Start the Flask application"""
-    app = create_app()
+    app = create_app(warm_up=False)
+    # With debug on, this process is the reloader that only restarts the
+    # child serving requests; the child alone loads the models, takes the
+    # BM25 writer lock and runs the ingestion queue
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        services.warm_up()
     app.run(host=HOST, port=PORT, debug=DEBUG)
 
 if __name__ == "__main__":
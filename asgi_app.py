@@ -0,0 +1,175 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api_common import (idioms_uploaded, job_accepted, job_events as poll_job_events,
+                        job_result, pdf_uploaded, sse_format, wants_wait)
+from app2 import create_app
+from chat.history import new_session_id
+from config import ASGI_LOG_LEVEL, ASGI_WORKER_THREADS, HOST, INGEST_EVENTS_POLL_INTERVAL, PORT
+from ingestion.jobs import FINISHED
+from services import services
+
+# Blocking work (retrieval, reranking, uploads to MinIO, MLflow logging) runs
+# here; its size caps how many of those run at once, not how many streams are open
+executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix="asgi-worker")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # create_app() below already started the service warm-up
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="RAG API", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call in the bounded worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def _job_accepted(job_id: str, filename: str):
+    payload, status = job_accepted(job_id, filename)
+    return JSONResponse(payload, status_code=status)
+
+
+async def _wait_job(job_id: str):
+    """Final state of a job, polled so waiting holds no worker thread"""
+    while True:
+        job = await run_blocking(services.job_store.get, job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        await asyncio.sleep(INGEST_EVENTS_POLL_INTERVAL)
+
+
+async def _submit(kind: str, file: UploadFile, **params) -> str:
+    return await run_blocking(lambda: services.ingestion_queue.submit(
+        kind, file.file, filename=file.filename, **params))
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    """Unified chat endpoint with search method selection"""
+    data = await request.json()
+    session_id = data.get("session_id") or new_session_id()
+    result = await run_blocking(
+        lambda: services.chat_service.chat_with_history(
+            query=data.get("query", ""),
+            search_type=data.get("search_type", "hybrid"),
+            k=data.get("k"),
+            alpha=data.get("alpha", 0.5),
+            metadata_filter=data.get("metadata_filter"),
+            use_rerank=data.get("use_rerank", True),
+            session_id=session_id
+        ))
+    # The client sends it back to continue the conversation
+    return {**result, "session_id": session_id}
+
+
+@app.post("/chat_stream")
+async def chat_stream(request: Request):
+    """Streaming chat endpoint, tokens are forwarded as they arrive from Ollama"""
+    data = await request.json()
+    session_id = data.get("session_id") or new_session_id()
+
+    async def generate():
+        try:
+            yield sse_format({"event": "start", "msg": "stream_start", "session_id": session_id})
+
+            chat_service = await run_blocking(lambda: services.chat_service)
+            async for chunk in chat_service.achat_with_history_stream(
+                query=data.get("query", ""),
+                search_type=data.get("search_type", "hybrid"),
+                k=data.get("k"),
+                alpha=data.get("alpha", 0.5),
+                metadata_filter=data.get("metadata_filter"),
+                use_rerank=data.get("use_rerank", True),
+                session_id=session_id,
+                executor=executor
+            ):
+                yield sse_format({"text": chunk})
+
+            yield sse_format({"event": "end", "msg": "stream_end"})
+        except Exception as e:
+            yield sse_format({"event": "error", "msg": str(e)})
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Progress of an ingestion job as server-sent events, ends when the job finishes"""
+
+    async def generate():
+        seq = None
+        while True:
+            events, seq, ended = await run_blocking(poll_job_events, job_id, seq)
+            for event in events:
+                yield sse_format(event)
+            if ended:
+                return
+            await asyncio.sleep(INGEST_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+@app.post("/idioms")
+async def idioms_post(request: Request, file: UploadFile = File(None),
+                      source_name: str = Form("idioms")):
+    """Upload an idioms PDF or CSV/TSV/JSONL file and queue its processing (?wait=true blocks until done)"""
+    if not file:
+        return JSONResponse(
+            {"error": "No file part in the request. Make sure to send 'file' as form-data."},
+            status_code=400)
+
+    try:
+        job_id = await _submit("idiom", file, source_name=source_name)
+        if not wants_wait(request.query_params.get("wait")):
+            return _job_accepted(job_id, file.filename)
+
+        result = job_result(await _wait_job(job_id))
+        return idioms_uploaded(file.filename, source_name, result)
+    except Exception as e:
+        return JSONResponse({"error": f"Failed to process idioms: {str(e)}"}, status_code=500)
+
+
+@app.post("/pdf")
+async def pdf_post(request: Request, file: UploadFile = File(None)):
+    """Upload a PDF file and queue its processing (?wait=true blocks until done)"""
+    if not file:
+        return JSONResponse({"error": "No file part in the request"}, status_code=400)
+
+    try:
+        job_id = await _submit("pdf", file)
+        if not wants_wait(request.query_params.get("wait")):
+            return _job_accepted(job_id, file.filename)
+
+        result = job_result(await _wait_job(job_id))
+        return pdf_uploaded(file.filename, result)
+    except Exception as e:
+        return JSONResponse({"error": f"Failed to process PDF: {str(e)}"}, status_code=500)
+
+
+# Everything else (/health, /ready, /files, /jobs, /debug/*, ...) is served by the Flask app,
+# on the worker threads of the WSGI bridge
+app.mount("/", WSGIMiddleware(create_app()))
+
+
+def start_app():
+    """Start the ASGI server"""
+    import uvicorn
+    uvicorn.run(app, host=HOST, port=PORT, log_level=ASGI_LOG_LEVEL)
+
+
+if __name__ == "__main__":
+    start_app()
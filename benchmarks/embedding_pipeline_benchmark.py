@@ -0,0 +1,134 @@
+"""Throughput benchmark for the batched embedding + Qdrant upsert pipeline
+
+Usage (from the project root):
+    python -m benchmarks.embedding_pipeline_benchmark
+    python -m benchmarks.embedding_pipeline_benchmark --chunks 5000 --latency 0.05
+    python -m benchmarks.embedding_pipeline_benchmark --ollama http://localhost:11434 \
+        --qdrant http://localhost:6333
+
+By default embeddings come from a local stub server speaking Ollama's
+/api/embed (fixed latency per request plus per text) and points go to an
+in-memory Qdrant, so only the pipeline itself is measured. Reports
+chunks/sec for each batch size / worker count combination.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+from ingestion.embedding_pipeline import EmbeddingPipeline
+from models import get_embeddings
+
+COLLECTION = "embedding_benchmark"
+
+
+def stub_vector(text: str, dim: int) -> List[float]:
+    """Deterministic pseudo-embedding derived from the text hash"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128.0 for i in range(dim)]
+
+
+def start_stub_server(latency: float, per_text: float, dim: int) -> ThreadingHTTPServer:
+    """Ollama-compatible /api/embed endpoint on a free local port"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts = body.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            time.sleep(latency + per_text * len(texts))
+            payload = json.dumps({"model": body.get("model"),
+                                  "embeddings": [stub_vector(t, dim) for t in texts]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SerializedClient:
+    """In-memory QdrantClient is not thread-safe, serialize its calls"""
+
+    def __init__(self, client: QdrantClient):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+def build_chunks(count: int) -> List[Document]:
+    return [Document(page_content=f"Chunk {i}: the quick brown fox jumps over the lazy dog",
+                     metadata={"file_name": "benchmark.pdf", "chunk": i + 1, "type": "pdf"})
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="1,16,64")
+    parser.add_argument("--workers", default="1,4")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub seconds per request")
+    parser.add_argument("--per-text", type=float, default=0.001, help="stub seconds per text")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--ollama", help="real Ollama URL instead of the stub server")
+    parser.add_argument("--qdrant", help="Qdrant URL instead of an in-memory instance")
+    args = parser.parse_args()
+
+    server = None
+    if args.ollama:
+        base_url = args.ollama
+    else:
+        server = start_stub_server(args.latency, args.per_text, args.dim)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # The embedding cache would hide the pipeline cost
+    embedding = get_embeddings(base_url=base_url, cached=False)
+    dim = len(embedding.embed_query("dimension probe"))
+    client = QdrantClient(url=args.qdrant) if args.qdrant else SerializedClient(QdrantClient(":memory:"))
+
+    print(f"{args.chunks} chunks, embeddings from {base_url}, dim={dim}")
+    print(f"{'batch':>6}{'workers':>9}{'seconds':>10}{'chunks/s':>12}{'embed s':>10}{'upsert s':>10}")
+    try:
+        for batch_size in map(int, args.batch_sizes.split(",")):
+            for workers in map(int, args.workers.split(",")):
+                if client.collection_exists(COLLECTION):
+                    client.delete_collection(COLLECTION)
+                client.create_collection(COLLECTION, vectors_config=VectorParams(
+                    size=dim, distance=Distance.COSINE))
+                pipeline = EmbeddingPipeline(embedding, client, COLLECTION,
+                                             batch_size=batch_size, max_workers=workers)
+                for _ in pipeline.run(build_chunks(args.chunks)):
+                    pass
+                stats = pipeline.last_stats
+                assert client.count(COLLECTION).count == args.chunks
+                print(f"{batch_size:>6}{workers:>9}{stats.elapsed:>10.2f}{stats.chunks_per_sec:>12,.0f}"
+                      f"{stats.embed_seconds:>10.2f}{stats.upsert_seconds:>10.2f}")
+    finally:
+        client.delete_collection(COLLECTION)
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
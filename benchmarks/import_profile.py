@@ -0,0 +1,58 @@
+"""Import-time profile of the server entry point, with an optional budget
+
+Usage (from the project root):
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile --module app2 --top 30
+    python -m benchmarks.import_profile --budget 1.5
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter
+and lists the modules with the largest cumulative import time. Models and
+clients are built by services.warm_up after the port is bound, so heavy
+packages (torch, sentence_transformers, langchain chains, mlflow) showing
+up here are regressions. With --budget the script exits non-zero when the
+total import time exceeds it, so it can guard startup in CI.
+"""
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+
+def profile_imports(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every module imported by ``module``"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{out.stderr[-2000:]}")
+    rows = []
+    for line in out.stderr.splitlines():
+        # import time:  self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app2")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget", type=float, help="fail when the import takes longer (seconds)")
+    args = parser.parse_args()
+
+    rows = profile_imports(args.module)
+    # Top-level entries (no indentation) add up to the whole import
+    total = sum(cum for name, _, cum in rows if not name.startswith("  ")) / 1e6
+    print(f"{'cumulative s':>13}{'self s':>9}  module")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1e6:>13.3f}{self_us / 1e6:>9.3f}  {name.strip()}")
+    print(f"Total import time of {args.module}: {total:.2f}s ({len(rows)} modules)")
+
+    if args.budget is not None and total > args.budget:
+        print(f"! Over the {args.budget:.2f}s import budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
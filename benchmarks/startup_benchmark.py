@@ -0,0 +1,89 @@
+"""Startup cost of the service graph: per-blueprint construction vs the shared container
+
+Usage (from the project root, with Qdrant, MinIO and Ollama running):
+    python -m benchmarks.startup_benchmark
+    python -m benchmarks.startup_benchmark --repeat 3
+
+Each mode runs in a fresh interpreter so imports, model loads and peak
+RSS are measured from scratch:
+    legacy  what routes.py and stream_routes.py used to build at import time,
+            a ChatService and a VectorStoreManager per blueprint
+    shared  the services.py container: chat service plus ingestion queue
+Reports seconds, peak RSS and how many heavy clients/models were created.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+
+MODES = ("legacy", "shared")
+
+
+def count_instances(counts: Counter):
+    """Count constructions of the expensive classes by wrapping their __init__"""
+    from langchain_ollama import OllamaEmbeddings
+    from qdrant_client import QdrantClient
+    from sentence_transformers import CrossEncoder
+    from rag.search.bm25 import BM25Search
+    from storage.minio_client import MinioClient
+
+    for name, cls in (("QdrantClient", QdrantClient), ("MinioClient", MinioClient),
+                      ("OllamaEmbeddings", OllamaEmbeddings), ("CrossEncoder", CrossEncoder),
+                      ("BM25Search", BM25Search)):
+        original = cls.__init__
+
+        def counted(self, *args, _name=name, _original=original, **kwargs):
+            counts[_name] += 1
+            _original(self, *args, **kwargs)
+        cls.__init__ = counted
+
+
+def run_mode(mode: str) -> dict:
+    counts: Counter = Counter()
+    start = time.perf_counter()
+    count_instances(counts)
+    if mode == "legacy":
+        from chat.service import ChatService
+        from vector_store import VectorStoreManager
+        for _ in ("routes", "stream_routes"):
+            ChatService()
+            VectorStoreManager()
+    else:
+        from services import services
+        services.chat_service
+        services.start()
+    return {
+        "mode": mode,
+        "seconds": time.perf_counter() - start,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "instances": dict(counts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child)))
+        return
+
+    names = ("QdrantClient", "MinioClient", "OllamaEmbeddings", "CrossEncoder", "BM25Search")
+    print(f"{'mode':>8}{'seconds':>10}{'peak MB':>10}" + "".join(f"{n:>18}" for n in names))
+    for _ in range(args.repeat):
+        for mode in MODES:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.startup_benchmark",
+                                  "--child", mode], capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{mode:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.0f}"
+                  + "".join(f"{result['instances'].get(n, 0):>18}" for n in names))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,255 @@
+import json
+import sys
+import threading
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
 from langchain_core.messages import HumanMessage, AIMessage
-from typing import List, Dict, Optional
+
+from config import (CHAT_HISTORY_BACKEND, CHAT_HISTORY_MAX_BYTES, CHAT_HISTORY_MAX_TURNS,
+                    CHAT_HISTORY_TTL, REDIS_URL)
+
+Turn = Tuple[str, str]
+
+
+def _turn_size(turn: Turn) -> int:
+    return sys.getsizeof(turn) + sys.getsizeof(turn[0]) + sys.getsizeof(turn[1])
+
 
 class ChatHistory:
-    def __init__(self):
-        self.history: List[HumanMessage | AIMessage] = []
-    
+    """Conversation of one session as a ring buffer of (user, assistant) turns
+
+    Only the last ``max_turns`` turns are kept, older ones fall off, so the
+    history put into prompts stays bounded. Turns are stored as plain string
+    pairs; LangChain messages are built on demand. ``summary`` is the rolling
+    summary of turns folded out of the buffer. ``size`` tracks the bytes
+    held, for the store's memory cap.
+    """
+
+    def __init__(self, max_turns: int = CHAT_HISTORY_MAX_TURNS, turns: Iterable[Turn] = (),
+                 summary: str = ""):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self._pending: Optional[str] = None
+        self.summary = ""
+        self.size = 0
+        for user, assistant in turns:
+            self.add_turn(user, assistant)
+        self.set_summary(summary)
+
+    def add_turn(self, user: str, assistant: str):
+        if len(self.turns) == self.turns.maxlen:
+            self.size -= _turn_size(self.turns[0])
+        turn = (user, assistant)
+        self.turns.append(turn)
+        self.size += _turn_size(turn)
+
+    def set_summary(self, summary: str):
+        self.size += sys.getsizeof(summary) - sys.getsizeof(self.summary)
+        self.summary = summary
+
+    def fold(self, turns: int, summary: str):
+        """Replace the ``turns`` oldest turns with ``summary``, which covers them"""
+        for _ in range(turns):
+            self.size -= _turn_size(self.turns.popleft())
+        self.set_summary(summary)
+
     def add_human_message(self, content: str):
-        self.history.append(HumanMessage(content=content))
-    
+        self._pending = content
+
     def add_ai_message(self, content: str):
-        self.history.append(AIMessage(content=content))
-    
+        # A reply without a preceding question is kept with an empty user side
+        self.add_turn(self._pending or "", content)
+        self._pending = None
+
     def clear(self):
-        self.history = []
-       
+        self.turns.clear()
+        self._pending = None
+        self.summary = ""
+        self.size = 0
+
     def get_messages(self) -> List[HumanMessage | AIMessage]:
-        return self.history
-    
+        messages = []
+        for user, assistant in self.turns:
+            messages.append(HumanMessage(content=user))
+            messages.append(AIMessage(content=assistant))
+        return messages
+
     def get_formatted(self) -> List[Dict]:
         formatted = []
-        for i, message in enumerate(self.history):
+        for i, message in enumerate(self.get_messages()):
             formatted.append({
                 "type": "human" if isinstance(message, HumanMessage) else "ai",
                 "content": message.content,
                 "index": i
             })
         return formatted
-    
-    # Add this method to get history in the format expected by build_prompt_with_history
+
     def get_conversation_pairs(self) -> List[Dict[str, str]]:
-        """Convert message history to user/assistant pairs"""
-        pairs = []
-        i = 0
-        while i < len(self.history) - 1:
-            if isinstance(self.history[i], HumanMessage) and isinstance(self.history[i + 1], AIMessage):
-                pairs.append({
-                    "user": self.history[i].content,
-                    "assistant": self.history[i + 1].content
-                })
-                i += 2
-            else:
-                i += 1
-        return pairs
-    
+        """User/assistant pairs, the format expected by build_prompt_with_history"""
+        return [{"user": user, "assistant": assistant} for user, assistant in self.turns]
+
     def __len__(self):
-        return len(self.history)
\ No newline at end of file
+        # Counted in messages, as before the ring buffer
+        return 2 * len(self.turns)
+
+
+class SessionHistoryStore:
+    """In-process histories by session id, bounded in turns and in total memory
+
+    Every session keeps at most ``max_turns`` turns. When all sessions
+    together hold more than ``max_bytes``, the least recently used ones are
+    dropped until they fit again.
+    """
+
+    def __init__(self, max_turns: int = CHAT_HISTORY_MAX_TURNS,
+                 max_bytes: int = CHAT_HISTORY_MAX_BYTES):
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, ChatHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> ChatHistory:
+        """Snapshot of a session's history (empty for an unknown session)"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                return ChatHistory(self.max_turns)
+            self._sessions.move_to_end(session_id)
+            return ChatHistory(self.max_turns, list(history.turns), history.summary)
+
+    def add_turn(self, session_id: str, user: str, assistant: str) -> int:
+        """Append a turn, returns the session's number of turns"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = self._sessions[session_id] = ChatHistory(self.max_turns)
+            self._sessions.move_to_end(session_id)
+            before = history.size
+            history.add_turn(user, assistant)
+            self.total_bytes += history.size - before
+            self._evict(keep=session_id)
+            return len(history.turns)
+
+    def fold(self, session_id: str, turns: int, first_turn: Turn, summary: str) -> bool:
+        """Replace the ``turns`` oldest turns with ``summary``
+
+        Refused (False) when the session's oldest turn is no longer
+        ``first_turn``, i.e. the summary was made from turns since dropped.
+        """
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None or len(history.turns) < turns or history.turns[0] != first_turn:
+                return False
+            before = history.size
+            history.fold(turns, summary)
+            self.total_bytes += history.size - before
+            return True
+
+    def _evict(self, keep: str):
+        while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id, history = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            del self._sessions[session_id]
+            self.total_bytes -= history.size
+            self.evictions += 1
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            history = self._sessions.pop(session_id, None)
+            if history is not None:
+                self.total_bytes -= history.size
+            return history is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class RedisHistoryStore:
+    """Histories in Redis so several workers share sessions
+
+    A session is a list of JSON turns trimmed to ``max_turns`` on every
+    write, plus its summary, both expiring ``ttl`` seconds after the last
+    turn; Redis's own maxmemory policy caps the total.
+    """
+
+    def __init__(self, client, max_turns: int = CHAT_HISTORY_MAX_TURNS,
+                 ttl: int = CHAT_HISTORY_TTL, prefix: str = "chat:history:"):
+        self.client = client
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _summary_key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}:summary"
+
+    def get(self, session_id: str) -> ChatHistory:
+        pipe = self.client.pipeline()
+        pipe.lrange(self.prefix + session_id, -self.max_turns, -1)
+        pipe.get(self._summary_key(session_id))
+        raw, summary = pipe.execute()
+        turns = [tuple(json.loads(item)) for item in raw]
+        return ChatHistory(self.max_turns, turns, summary.decode("utf-8") if summary else "")
+
+    def add_turn(self, session_id: str, user: str, assistant: str) -> int:
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps([user, assistant], ensure_ascii=False))
+        pipe.ltrim(key, -self.max_turns, -1)
+        pipe.expire(key, self.ttl)
+        pipe.expire(self._summary_key(session_id), self.ttl)
+        length = pipe.execute()[0]
+        return min(length, self.max_turns)
+
+    def fold(self, session_id: str, turns: int, first_turn: Turn, summary: str) -> bool:
+        import redis
+        key = self.prefix + session_id
+        expected = json.dumps(list(first_turn), ensure_ascii=False).encode("utf-8")
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.lindex(key, 0) != expected:
+                    return False
+                pipe.multi()
+                pipe.ltrim(key, turns, -1)
+                pipe.set(self._summary_key(session_id), summary, ex=self.ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                # A turn was added or trimmed meanwhile, the next summary retries
+                return False
+
+    def clear(self, session_id: str) -> bool:
+        return bool(self.client.delete(self.prefix + session_id, self._summary_key(session_id)))
+
+    def stats(self) -> Dict[str, int]:
+        return {"backend": "redis", "ttl": self.ttl}
+
+
+def new_session_id() -> str:
+    """Session of a chat request that did not send one, so clients never share a history"""
+    return uuid.uuid4().hex
+
+
+def get_history_store(backend: str = CHAT_HISTORY_BACKEND):
+    """History store configured by CHAT_HISTORY_BACKEND, in-process when Redis is unreachable"""
+    if backend == "redis":
+        try:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+            client.ping()
+            print(f"✓ Chat history in Redis at {REDIS_URL}")
+            return RedisHistoryStore(client)
+        except Exception as e:
+            print(f"! Redis unavailable for chat history, keeping it in memory: {e}")
+    return SessionHistoryStore()
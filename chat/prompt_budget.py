@@ -0,0 +1,126 @@
+import math
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional, Sequence, Tuple
+
+from config import (CHARS_PER_TOKEN, LLM_CONTEXT_TOKENS, LLM_TOKENIZER, PROMPT_ANSWER_TOKENS,
+                    PROMPT_HISTORY_TOKENS, PROMPT_SUMMARY_TOKENS, PROMPT_TOKEN_CACHE_SIZE)
+
+# A context doc is cut to fit only if at least this many tokens are left for it
+MIN_DOC_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def get_prompt_counter() -> Callable[[str], int]:
+    """Token counter of the chat model, a character estimate when its tokenizer is unavailable"""
+    from ingestion.tokens import get_token_counter
+    return get_token_counter(LLM_TOKENIZER, PROMPT_TOKEN_CACHE_SIZE) or estimate_tokens
+
+
+@dataclass
+class PromptBudget:
+    """Token limits of one prompt"""
+    context_tokens: int = LLM_CONTEXT_TOKENS
+    answer_tokens: int = PROMPT_ANSWER_TOKENS
+    history_tokens: int = PROMPT_HISTORY_TOKENS
+    summary_tokens: int = PROMPT_SUMMARY_TOKENS
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.context_tokens - self.answer_tokens
+
+
+@dataclass
+class PackedPrompt:
+    """A prompt and what had to be left out to fit the budget"""
+    prompt: str
+    tokens: int
+    budget: int
+    context_docs: int
+    context_docs_dropped: int
+    truncated_doc: bool
+    history_turns: int
+    history_turns_dropped: int
+    summary_tokens: int
+
+    def to_dict(self) -> dict:
+        stats = asdict(self)
+        del stats["prompt"]
+        return stats
+
+
+def fit_text(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Longest prefix of ``text`` (cut at a space when possible) within ``max_tokens``"""
+    if max_tokens <= 0:
+        return ""
+    tokens = count(text)
+    while tokens > max_tokens:
+        cut = int(len(text) * max_tokens / tokens * 0.95)
+        space = text.rfind(" ", 0, cut)
+        text = text[:space if space > cut // 2 else cut]
+        tokens = count(text)
+    return text
+
+
+def pack_prompt(render: Callable[[str, str, str], str], query: str, docs: Sequence[str],
+                turns: Sequence[Tuple[str, str]], summary: str = "",
+                budget: Optional[PromptBudget] = None,
+                count: Optional[Callable[[str], int]] = None) -> PackedPrompt:
+    """Fill ``render(context_text, history_text, query)`` up to the prompt budget
+
+    History comes first, limited to ``history_tokens``: the session summary
+    (capped at ``summary_tokens``), then the newest turns that still fit,
+    older ones are dropped. Context docs keep their retrieval order and fill
+    what is left; the first one that does not fit is cut, the rest dropped.
+    """
+    budget = budget or PromptBudget()
+    count = count or get_prompt_counter()
+    available = budget.prompt_tokens - count(render("", "", query))
+    history_budget = max(0, min(budget.history_tokens, available))
+
+    history_lines = []
+    used = 0
+    summary_tokens = 0
+    if summary:
+        summary_text = fit_text(summary, min(budget.summary_tokens, history_budget), count)
+        if summary_text:
+            history_lines.append(f"Summary of the earlier conversation: {summary_text}")
+            used = summary_tokens = count(history_lines[0]) + 1
+    recent = []
+    for user, assistant in reversed(turns):
+        line = f"User: {user}\nAssistant: {assistant}"
+        tokens = count(line) + 1
+        if used + tokens > history_budget:
+            break
+        recent.append(line)
+        used += tokens
+    history_lines.extend(reversed(recent))
+
+    remaining = available - used
+    kept = []
+    truncated = False
+    for doc in docs:
+        tokens = count(doc) + 1
+        if tokens <= remaining:
+            kept.append(doc)
+            remaining -= tokens
+            continue
+        if remaining >= MIN_DOC_TOKENS:
+            kept.append(fit_text(doc, remaining - 1, count))
+            truncated = True
+        break
+
+    prompt = render("\n".join(kept), "\n".join(history_lines), query)
+    return PackedPrompt(
+        prompt=prompt,
+        tokens=count(prompt),
+        budget=budget.prompt_tokens,
+        context_docs=len(kept),
+        context_docs_dropped=len(docs) - len(kept),
+        truncated_doc=truncated,
+        history_turns=len(recent),
+        history_turns_dropped=len(turns) - len(recent),
+        summary_tokens=summary_tokens,
+    )
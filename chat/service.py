@@ -1,28 +1,43 @@
 
+import asyncio
 import time
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
+from functools import partial
 from typing import Dict, Any, Optional, List
-from langchain.schema import Document
-import mlflow
-from MLOps.train import MLflowTracker
+from langchain_core.documents import Document
 from rag.handler import RAGHandler
-from models import build_prompt_with_history, get_llm, get_llm_stream, get_rag_prompt, get_retriever_prompt, build_prompt_with_history_longdoc
+from models import pack_prompt_with_history, build_prompt_with_history, get_llm, get_llm_stream, get_rag_prompt, get_retriever_prompt, build_prompt_with_history_longdoc
 from vector_store import VectorStoreManager
 # import vector_store
 
-from .history import ChatHistory
+from config import CHAT_SUMMARY_ENABLED, DEFAULT_SESSION_ID, SIMILARITY_SEARCH_K
+
+from .history import get_history_store
+from .summarizer import HistorySummarizer
 
 class ChatService:
-    def __init__(self):
-        self.llm = get_llm()
+    def __init__(self, vector_manager: Optional[VectorStoreManager] = None,
+                 rag_handler: Optional[RAGHandler] = None, llm=None, history_store=None,
+                 summarizer: Optional[HistorySummarizer] = None):
+        self.llm = llm or get_llm()
         self.llm_stream = get_llm_stream()
-        self.vector_manager = VectorStoreManager()
-        self.chat_history = ChatHistory()
-        self.rag_handler = RAGHandler()
-        self.mlflow_tracker = MLflowTracker(experiment_name="chatbot_inference")
+        self.vector_manager = vector_manager or VectorStoreManager()
+        # Conversation turns by session id, bounded per session and in total
+        self.history_store = history_store or get_history_store()
+        # Older turns are folded into a per-session summary after the reply
+        if summarizer is None and CHAT_SUMMARY_ENABLED:
+            summarizer = HistorySummarizer(self.llm, self.history_store)
+        self.summarizer = summarizer
+        self.rag_handler = rag_handler or RAGHandler()
+        self._mlflow_tracker = None
         # self.retriever = vector_store.as_retriever(search_kwargs={"k": 1})
+    @property
+    def mlflow_tracker(self):
+        """MLflow tracker, created on the first logged request (mlflow and pandas import slowly)"""
+        if self._mlflow_tracker is None:
+            from MLOps.train import MLflowTracker
+            self._mlflow_tracker = MLflowTracker(experiment_name="chatbot_inference")
+        return self._mlflow_tracker
+
     def simple_chat(self, query: str) -> str:
         """Simple chat without RAG"""
         print(f"Query: {query}")
@@ -34,7 +49,8 @@ class ChatService:
             print(f"Error in simple chat: {e}")
             return f"Lỗi khi xử lý câu hỏi: {str(e)}"
 
-    def rag_chat(self, query: str) -> Dict[str, Any]:
+    def rag_chat(self, query: str, session_id: str = DEFAULT_SESSION_ID,
+                 record: bool = True) -> Dict[str, Any]:
         """RAG-based chat with history-aware retrieval"""
         print(f"Query: {query}")
         
@@ -49,16 +65,17 @@ class ChatService:
                 return self._retriever_error_response()
 
             # Create and execute chain
-            result = self._execute_rag_chain(query, retriever)
+            result = self._execute_rag_chain(query, retriever, session_id)
             
             # Update history
-            self.chat_history.add_human_message(query)
-            self.chat_history.add_ai_message(result["answer"])
+            if record:
+                self._remember(session_id, query, result["answer"])
             
             return {
                 "answer": result["answer"],
                 "sources": self._extract_sources(result),
-                "chat_history_length": len(self.chat_history)
+                "session_id": session_id,
+                "chat_history_length": len(self.history_store.get(session_id))
             }
             
         except Exception as e:
@@ -90,7 +107,9 @@ class ChatService:
     def hybrid_chat(self, query: str, k: Optional[int] = None,
                    alpha: float = 0.5,
                    metadata_filter: Optional[Dict] = None,
-                   use_rerank: bool = True) -> Dict[str, Any]:
+                   use_rerank: bool = True,
+                   session_id: str = DEFAULT_SESSION_ID,
+                   record: bool = True) -> Dict[str, Any]:
         """Chat using hybrid search (BM25 + Vector)"""
         print(f"Hybrid chat query: {query}")
         
@@ -104,13 +123,14 @@ class ChatService:
             )
             
             # Update chat history
-            self.chat_history.add_human_message(query)
-            self.chat_history.add_ai_message(result["answer"])
+            if record:
+                self._remember(session_id, query, result["answer"])
             
             return {
                 "answer": result["answer"],
                 "sources": result["sources"],
-                "chat_history_length": len(self.chat_history)
+                "session_id": session_id,
+                "chat_history_length": len(self.history_store.get(session_id))
             }
             
         except Exception as e:
@@ -118,12 +138,12 @@ class ChatService:
             return self._error_response(str(e))
 
     def chat_with_history(self, query: str, search_type: str = "hybrid",
-                         **kwargs) -> Dict[str, Any]:
+                         session_id: str = DEFAULT_SESSION_ID, **kwargs) -> Dict[str, Any]:
         """Enhanced chat with choice of search method"""
         if search_type == "hybrid":
-            result = self.hybrid_chat(query, **kwargs)
+            result = self.hybrid_chat(query, session_id=session_id, **kwargs)
         elif search_type == "rag":
-            result = self.rag_chat(query)
+            result = self.rag_chat(query, session_id=session_id)
         elif search_type == "simple":
             result = {"answer": self.simple_chat(query), "sources": []}
         else:
@@ -155,16 +175,25 @@ class ChatService:
             collection_info = self.vector_manager.get_collection_info()
             return {
                 "vector_store": collection_info,
-                "chat_history_length": len(self.chat_history),
+                "chat_sessions": self.history_store.stats(),
                 "has_documents": collection_info.get('points_count', 0) > 0 if collection_info else False
             }
         except Exception as e:
             return {
                 "error": str(e),
-                "chat_history_length": len(self.chat_history),
+                "chat_sessions": self.history_store.stats(),
                 "has_documents": False
             }
 
+    def _remember(self, session_id: str, query: str, answer: str):
+        turns = self.history_store.add_turn(session_id, query, answer)
+        if self.summarizer:
+            self.summarizer.schedule(session_id, turns)
+
+    def clear_history(self, session_id: str = DEFAULT_SESSION_ID) -> bool:
+        """Forget one session's conversation, False if it had none"""
+        return self.history_store.clear(session_id)
+
     # Helper methods
     def _verify_documents(self) -> bool:
         collection_info = self.vector_manager.get_collection_info()
@@ -176,10 +205,16 @@ class ChatService:
             self.rag_handler.vector_store = vector_store
         return self.rag_handler.create_retriever(vector_store)
 
-    def _execute_rag_chain(self, query: str, retriever) -> Dict[str, Any]:
+    def _execute_rag_chain(self, query: str, retriever,
+                           session_id: str = DEFAULT_SESSION_ID) -> Dict[str, Any]:
+        # LangChain's chain modules are only needed by this legacy path
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+        from langchain.chains.history_aware_retriever import create_history_aware_retriever
+        from langchain.chains.retrieval import create_retrieval_chain
+
         retriever_prompt = get_retriever_prompt()
          # DEBUG: in chat history format + length
-        msgs = self.chat_history.get_messages()
+        msgs = self.history_store.get(session_id).get_messages()
         try:
             print("=== RAG DEBUG START ===")
             print("Query:", query)
@@ -307,8 +342,94 @@ class ChatService:
     def chat_with_history_stream(
         self, query: str, search_type: str = "hybrid",
         k: int = None, alpha: float = 0.5,
-        metadata_filter=None, use_rerank: bool = True
+        metadata_filter=None, use_rerank: bool = True,
+        session_id: str = DEFAULT_SESSION_ID
     ):
+        # === Retrieval phase ===
+        start_time = time.time()
+        context = self._stream_context(query, search_type, k, alpha, metadata_filter, use_rerank,
+                                       session_id)
+        if context is None:
+            yield f"[ERROR] Unknown search type: {search_type}"
+            return
+        docs, packed = context
+
+        # === Streaming phase ===
+        full_response = ""
+        for chunk in self.llm_stream.stream(
+            messages=[{"role": "user", "content": packed.prompt}],
+        ):
+            full_response += chunk
+            yield chunk
+
+        self._record_stream(query, search_type, k, alpha, use_rerank, session_id, docs,
+                            packed, full_response, time.time() - start_time)
+
+    async def achat_with_history_stream(
+        self, query: str, search_type: str = "hybrid",
+        k: int = None, alpha: float = 0.5,
+        metadata_filter=None, use_rerank: bool = True,
+        session_id: str = DEFAULT_SESSION_ID, executor=None
+    ):
+        """Async version of chat_with_history_stream for the ASGI server
+
+        Retrieval and logging block, so they run in ``executor``; tokens are
+        read from Ollama with async I/O and hold no thread while waiting.
+        """
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+        context = await loop.run_in_executor(executor, partial(
+            self._stream_context, query, search_type, k, alpha, metadata_filter, use_rerank,
+            session_id))
+        if context is None:
+            yield f"[ERROR] Unknown search type: {search_type}"
+            return
+        docs, packed = context
+
+        full_response = ""
+        async for chunk in self.llm_stream.astream(
+            messages=[{"role": "user", "content": packed.prompt}],
+        ):
+            full_response += chunk
+            yield chunk
+
+        await loop.run_in_executor(executor, partial(
+            self._record_stream, query, search_type, k, alpha, use_rerank, session_id, docs,
+            packed, full_response, time.time() - start_time))
+
+    def _stream_context(self, query, search_type, k, alpha, metadata_filter, use_rerank,
+                        session_id):
+        """(docs, PackedPrompt) the streamed answer is generated from, None for an unknown search type"""
+        # Only retrieval runs here, the answer itself is the streamed one
+        if search_type == "hybrid":
+            docs = self.rag_handler.retrieve_hybrid(query, k=k, alpha=alpha,
+                                                    metadata_filter=metadata_filter,
+                                                    use_rerank=use_rerank)
+        elif search_type == "rag":
+            docs = self.vector_manager.load_vector_store().similarity_search(
+                query, k=k or SIMILARITY_SEARCH_K)
+        elif search_type == "simple":
+            docs = []
+        else:
+            return None
+
+        # Context and history are packed into the model's token budget, older
+        # turns only through the session summary
+        history = self.history_store.get(session_id)
+        packed = pack_prompt_with_history(
+            query, docs, history=history.get_conversation_pairs(), summary=history.summary
+        )
+        print(f"Prompt: {packed.tokens}/{packed.budget} tokens, "
+              f"{packed.context_docs} docs ({packed.context_docs_dropped} dropped), "
+              f"{packed.history_turns} turns ({packed.history_turns_dropped} dropped), "
+              f"summary {packed.summary_tokens} tokens")
+        return docs, packed
+
+    def _record_stream(self, query, search_type, k, alpha, use_rerank, session_id, docs,
+                       packed, full_response: str, response_time: float):
+        """Append a finished stream to the session's history and log it to MLflow"""
+        self._remember(session_id, query, full_response.strip())
+
         run_name = f"chat_stream_{int(time.time())}"
         with self.mlflow_tracker.start_run(run_name=run_name):
             params = {
@@ -319,40 +440,13 @@ class ChatService:
             }
             self.mlflow_tracker.log_params(params)
 
-            # === Retrieval phase ===
-            start_time = time.time()
-            if search_type == "hybrid":
-                result = self.hybrid_chat(query, k=k, alpha=alpha,
-                                        metadata_filter=metadata_filter,
-                                        use_rerank=use_rerank)
-            elif search_type == "rag":
-                result = self.rag_chat(query)
-            elif search_type == "simple":
-                result = {"answer": self.simple_chat(query), "sources": []}
-            else:
-                yield f"[ERROR] Unknown search type: {search_type}"
-                return
-
-            docs = result.get("sources", [])[:k] if k else result.get("sources", [])
-
-            final_prompt = build_prompt_with_history(
-                query, docs, history=self.chat_history.get_messages()
-            )
-
-            # === Streaming phase ===
-            full_response = ""
-            for chunk in self.llm_stream.stream(
-                messages=[{"role": "user", "content": final_prompt}],
-            ):
-                full_response += chunk
-                yield chunk
-
-            end_time = time.time()
-
             # === Logging metrics ===
             metrics = {
-                "response_time": end_time - start_time,
-                "chat_history_length": len(self.chat_history)
+                "response_time": response_time,
+                "chat_history_length": len(self.history_store.get(session_id)),
+                "prompt_tokens": packed.tokens,
+                "context_docs_dropped": packed.context_docs_dropped,
+                "history_turns_dropped": packed.history_turns_dropped
             }
             self.mlflow_tracker.log_metrics(metrics)
 
@@ -377,7 +471,3 @@ class ChatService:
             import mlflow
             mlflow.set_tag("component", "chat_with_history_stream")
             mlflow.set_tag("mode", search_type)
-
-            # Update history
-            self.chat_history.add_human_message(query)
-            self.chat_history.add_ai_message(full_response.strip())
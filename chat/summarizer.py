@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CHAT_SUMMARY_BATCH_TURNS, CHAT_SUMMARY_KEEP_TURNS
+from models import build_summary_prompt
+
+
+class HistorySummarizer:
+    """Folds the oldest turns of a session into its rolling summary, in the background
+
+    Once a session has ``keep_turns + batch_turns`` turns, everything but
+    the last ``keep_turns`` is summarized by the LLM together with the
+    previous summary and removed from the buffer. It runs off the request
+    path, so the reply that triggered it is not delayed; at most one
+    summary per session is in flight.
+    """
+
+    def __init__(self, llm, store, keep_turns: int = CHAT_SUMMARY_KEEP_TURNS,
+                 batch_turns: int = CHAT_SUMMARY_BATCH_TURNS, workers: int = 1):
+        self.llm = llm
+        self.store = store
+        self.keep_turns = keep_turns
+        self.batch_turns = batch_turns
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="history-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, session_id: str, turns: int):
+        """Called after each turn with the session's number of turns"""
+        if turns < self.keep_turns + self.batch_turns:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._summarize, session_id)
+
+    def _summarize(self, session_id: str):
+        try:
+            history = self.store.get(session_id)
+            fold = len(history.turns) - self.keep_turns
+            if fold < self.batch_turns:
+                return
+            turns = list(history.turns)[:fold]
+            summary = self.llm.invoke(build_summary_prompt(history.summary, turns)).strip()
+            if self.store.fold(session_id, fold, turns[0], summary):
+                print(f"✓ Folded {fold} turns of session {session_id} into its summary")
+        except Exception as e:
+            print(f"! Could not summarize session {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
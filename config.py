@@ -30,6 +30,20 @@ import os
 # Model configurations
 OLLAMA_MODEL = "qwen2.5:3b"
 EMBEDDING_MODEL = "mxbai-embed-large:latest"
+# Ollama server for embeddings, point it at a stub server for benchmarks
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Chunks per embedding request and concurrent embed+upsert workers at ingestion
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 4))
+# On-disk cache of embeddings keyed by (model, SHA-256 of normalized text)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+# Tokenizer of EMBEDDING_MODEL (Hugging Face repo id or tokenizer.json path) and
+# its context window; longer inputs are silently truncated by the model
+EMBEDDING_TOKENIZER = os.getenv("EMBEDDING_TOKENIZER", "mixedbread-ai/mxbai-embed-large-v1")
+EMBEDDING_MAX_TOKENS = 512
+TOKEN_COUNT_CACHE_SIZE = 65536
 
 # Directory configurations
 DB_FOLDER = "db"
@@ -40,10 +54,36 @@ QDRANT_URL = "http://localhost:6333"  # URL của Qdrant server
 QDRANT_COLLECTION_NAME = "pdf_documents"
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
+# Points per page when streaming the collection with scroll (BM25 bootstrap)
+QDRANT_SCROLL_BATCH_SIZE = 256
+
+# PDF text extraction: worker processes, pages per shard, seconds per page
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_EXTRACT_SHARD_PAGES = 16
+PDF_PAGE_TIMEOUT = 30
+# Uploads are kept in memory up to this size, larger ones spill to a temp file
+UPLOAD_SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+# Background ingestion: worker threads and the persistent job status database
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_JOB_DB = os.getenv("INGEST_JOB_DB", "jobs/ingestion_jobs.sqlite3")
+# Seconds a process holds its jobs without renewing; jobs of a dead process are taken over after it
+INGEST_JOB_LEASE = int(os.getenv("INGEST_JOB_LEASE", 60))
+# Seconds between checks for jobs queued or abandoned by other processes
+INGEST_TAKEOVER_INTERVAL = 2
+# Seconds between job status polls of the SSE progress endpoint
+INGEST_EVENTS_POLL_INTERVAL = 0.5
 
 # Text splitter configurations
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
+# Chunks shorter than this are merged into a neighbour on the same page
+CHUNK_MIN_SIZE = 100
+# "chars" uses the sizes above, "tokens" measures chunks with EMBEDDING_TOKENIZER
+# and the CHUNK_TOKEN_* budget (falls back to chars if the tokenizer is unavailable)
+CHUNK_LENGTH_UNIT = os.getenv("CHUNK_LENGTH_UNIT", "tokens")
+CHUNK_TOKEN_SIZE = 384
+CHUNK_TOKEN_OVERLAP = 48
+CHUNK_TOKEN_MIN_SIZE = 48
 
 # Vector store configurations
 SIMILARITY_SEARCH_K = 10
@@ -53,7 +93,59 @@ SIMILARITY_THRESHOLD = 0.0  # Giảm threshold để dễ tìm thấy kết qu
 HOST = "0.0.0.0"
 PORT = 8080
 DEBUG = True
+# ASGI server (asgi_app.py): threads for blocking work such as retrieval and
+# uploads; LLM tokens are streamed on the event loop and hold no thread
+ASGI_WORKER_THREADS = int(os.getenv("ASGI_WORKER_THREADS", 16))
+ASGI_LOG_LEVEL = os.getenv("ASGI_LOG_LEVEL", "info")
+
+# Chat history: turns kept per session and memory cap of all in-process sessions
+# (least recently used evicted first); "redis" shares sessions between workers
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "memory")
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 10))
+CHAT_HISTORY_MAX_BYTES = int(os.getenv("CHAT_HISTORY_MAX_BYTES", 64 * 1024 * 1024))
+# Seconds a Redis session lives after its last turn
+CHAT_HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", 24 * 3600))
+# Session of ChatService calls made without a session_id; HTTP requests without
+# one get a session of their own (chat.history.new_session_id), never this one
+DEFAULT_SESSION_ID = "default"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Rolling summary: the last CHAT_SUMMARY_KEEP_TURNS turns stay verbatim, older ones are
+# folded into the session's summary by the LLM in the background, CHAT_SUMMARY_BATCH_TURNS
+# at a time (keep + batch must stay below CHAT_HISTORY_MAX_TURNS)
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "1") == "1"
+CHAT_SUMMARY_KEEP_TURNS = 4
+CHAT_SUMMARY_BATCH_TURNS = 4
+
+# Prompt budget of OLLAMA_MODEL: context window (also sent to Ollama as num_ctx) and
+# tokenizer (Hugging Face repo id or tokenizer.json path); context docs and history
+# are packed into what is left after the template, the question and the answer
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "Qwen/Qwen2.5-3B-Instruct")
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", 4096))
+PROMPT_ANSWER_TOKENS = 512
+PROMPT_HISTORY_TOKENS = 1024
+PROMPT_SUMMARY_TOKENS = 256
+# Token estimate when the tokenizer cannot be loaded (conservative for Vietnamese)
+CHARS_PER_TOKEN = 3
+# Counted texts are whole docs, turns and prompts, so keep fewer of them than for chunks
+PROMPT_TOKEN_CACHE_SIZE = 2048
 
 # Create directories if they don't exist
 # os.makedirs(DB_FOLDER, exist_ok=True)
-os.makedirs(PDF_FOLDER, exist_ok=True)
\ No newline at end of file
+os.makedirs(PDF_FOLDER, exist_ok=True)
+
+# BM25 configurations
+# Metadata fields indexed for pre-filtering BM25 candidates
+BM25_METADATA_FIELDS = ("type", "source", "file_name", "page")
+# Directory holding the memory-mapped BM25 index segments
+BM25_INDEX_DIR = "bm25_index"
+# Number of same-sized BM25 segments merged together in the background
+BM25_MERGE_FACTOR = 4
+# LRU sizes of the BM25 query caches: top-k results per (tokens, filter, k)
+# and IDF-weighted postings per term, both dropped when the index changes
+BM25_QUERY_CACHE_SIZE = 1024
+BM25_TERM_CACHE_SIZE = 4096
+# Lexical tokenizer options per Qdrant collection (rag/utils/tokenizer.py),
+# collections not listed use the default NFKC/lowercase/punctuation pipeline
+BM25_TOKENIZERS = {
+    QDRANT_COLLECTION_NAME: {"fold_diacritics": True, "join_syllables": True},
+}
@@ -1,3 +1,6 @@
+import time
+import uuid
+
 import streamlit as st
 import requests
 
@@ -5,6 +8,7 @@ from typing import Dict, Any
 
 # Constants
 API_URL = "http://127.0.0.1:8080"  
+JOB_POLL_INTERVAL = 1.0
 
 def send_chat_request(query: str, search_type: str = "hybrid", **kwargs) -> Dict[str, Any]:
     """Send chat request to backend API"""
@@ -40,6 +44,35 @@ def upload_idioms(file, source_name="idioms"):
     except Exception as e:
         return {"error": str(e)}
 
+def wait_for_job(accepted: Dict[str, Any], on_progress=None) -> Dict[str, Any]:
+    """Poll an ingestion job queued by /pdf or /idioms until it finishes, returns its result"""
+    if "error" in accepted or "job_id" not in accepted:
+        return accepted
+    try:
+        while True:
+            response = requests.get(f"{API_URL}/jobs/{accepted['job_id']}")
+            if response.status_code != 200:
+                return response.json()
+            job = response.json()
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                return {"error": job["error"]}
+            if on_progress and job.get("progress"):
+                on_progress(job["progress"])
+            time.sleep(JOB_POLL_INTERVAL)
+    except Exception as e:
+        return {"error": str(e)}
+
+def describe_progress(progress: Dict[str, Any]) -> str:
+    stage = progress.get("stage", "")
+    if stage == "extract":
+        return f"Extracting page {progress.get('page')}..."
+    if stage == "embed":
+        total = f"/{progress['total']}" if progress.get("total") else ""
+        return f"Embedding chunks {progress.get('done')}{total}..."
+    return f"{stage.capitalize()}..."
+
 def check_api_connection():
     """Check if backend API is running"""
     try:
@@ -81,7 +114,10 @@ def main():
             if pdf_file:
                 if st.button("Upload PDF"):
                     with st.spinner("Uploading and processing PDF..."):
-                        result = upload_pdf(pdf_file)
+                        status = st.empty()
+                        result = wait_for_job(upload_pdf(pdf_file),
+                                              lambda p: status.caption(describe_progress(p)))
+                        status.empty()
                         if "error" in result:
                             st.error(result["error"])
                         else:
@@ -95,7 +131,10 @@ def main():
             if idioms_file:
                 if st.button("Upload Idioms"):
                     with st.spinner("Uploading and processing idioms..."):
-                        result = upload_idioms(idioms_file, source_name)
+                        status = st.empty()
+                        result = wait_for_job(upload_idioms(idioms_file, source_name),
+                                              lambda p: status.caption(describe_progress(p)))
+                        status.empty()
                         if "error" in result:
                             st.error(result["error"])
                         else:
@@ -103,7 +142,7 @@ def main():
                                 Idioms uploaded successfully!
                                 - Documents: {result['docs']}
                                 - Chunks: {result['chunks']}
-                                - Total in database: {result['final_count']}
+                                - Total in database: {result['total_points']}
                             """)
 
         # Search Settings
@@ -135,6 +174,9 @@ def main():
     # Main chat interface
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    # Server-side history is kept per session id, one per browser session
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
     # Display chat messages
     for message in st.session_state.messages:
@@ -171,10 +213,12 @@ def main():
                         alpha=alpha,
                         k=k,
                         use_rerank=use_rerank,
-                        metadata_filter=metadata_filter  # Add this
+                        metadata_filter=metadata_filter,  # Add this
+                        session_id=st.session_state.session_id
                     )
                 else:
-                    response = send_chat_request(prompt, search_type=search_type)
+                    response = send_chat_request(prompt, search_type=search_type,
+                                                 session_id=st.session_state.session_id)
 
                 if "error" in response:
                     st.error(response["error"])
@@ -0,0 +1,206 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import (CHUNK_LENGTH_UNIT, CHUNK_MIN_SIZE, CHUNK_OVERLAP, CHUNK_SIZE,
+                    CHUNK_TOKEN_MIN_SIZE, CHUNK_TOKEN_OVERLAP, CHUNK_TOKEN_SIZE,
+                    EMBEDDING_MAX_TOKENS)
+from ingestion.tokens import TokenCounter, get_token_counter
+
+TEXT = "text"
+TABLE = "table"
+MIXED = "mixed"
+
+# Column gaps as pypdf extracts them: tabs, pipes or runs of 3+ spaces
+_COLUMN_GAP = re.compile(r"\t| {3,}")
+
+
+def is_table_row(line: str) -> bool:
+    line = line.strip()
+    return line.count("|") >= 2 or len(_COLUMN_GAP.split(line)) >= 3
+
+
+# Upper bounds of the histogram buckets, as fractions of the chunk size
+_HISTOGRAM_BOUNDS = (0.125, 0.25, 0.5, 0.75, 1.0)
+
+
+@dataclass
+class ChunkStats:
+    """Chunk count and size distribution of one ingested document
+
+    ``truncated`` counts chunks longer than the embedding model's context
+    window (``wasted_tokens`` is what the model never sees); both need a
+    token counter and stay 0 without one.
+    """
+    chunk_size: int
+    unit: str = "chars"
+    chunks: int = 0
+    total_size: int = 0
+    min_size: Optional[int] = None
+    max_size: int = 0
+    merged_fragments: int = 0
+    truncated: int = 0
+    wasted_tokens: int = 0
+    by_kind: Dict[str, int] = field(default_factory=dict)
+    histogram: List[int] = field(default_factory=lambda: [0] * (len(_HISTOGRAM_BOUNDS) + 1))
+
+    def add(self, size: int, kind: str):
+        self.chunks += 1
+        self.total_size += size
+        self.min_size = size if self.min_size is None else min(self.min_size, size)
+        self.max_size = max(self.max_size, size)
+        self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+        for i, bound in enumerate(_HISTOGRAM_BOUNDS):
+            if size <= bound * self.chunk_size:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"<={int(b * self.chunk_size)}" for b in _HISTOGRAM_BOUNDS]
+        labels.append(f">{self.chunk_size}")
+        return {
+            "unit": self.unit,
+            "chunks": self.chunks,
+            "total_size": self.total_size,
+            "mean_size": round(self.total_size / self.chunks, 1) if self.chunks else 0,
+            "min_size": self.min_size or 0,
+            "max_size": self.max_size,
+            "merged_fragments": self.merged_fragments,
+            "truncated": self.truncated,
+            "wasted_tokens": self.wasted_tokens,
+            "by_kind": dict(self.by_kind),
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class LayoutChunker:
+    """Page-by-page chunker that keeps tables together and avoids tiny chunks
+
+    Each page is split into runs of prose and table rows (two or more
+    consecutive lines with column separators). Prose goes through a
+    recursive splitter with ``chunk_size`` / ``chunk_overlap``; table rows
+    are grouped up to ``chunk_size``, repeating the header row at the top
+    of every group. Pieces shorter than ``min_chunk_size`` are merged into
+    a neighbour on the same page when the result still fits.
+
+    Sizes are measured with ``length_function`` (characters by default, or
+    a TokenCounter for token budgets). With a ``token_counter`` every chunk
+    is also checked against the model's ``max_tokens``.
+    ``stats`` accumulates the size histogram of everything chunked so far.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 min_chunk_size: int = CHUNK_MIN_SIZE,
+                 length_function: Callable[[str], int] = len,
+                 token_counter: Optional[TokenCounter] = None,
+                 max_tokens: int = EMBEDDING_MAX_TOKENS):
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.length_function = length_function
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=length_function,
+            separators=["\n\n", "\n", " ", ""],
+        )
+        unit = "tokens" if isinstance(length_function, TokenCounter) else "chars"
+        self.stats = ChunkStats(chunk_size, unit)
+
+    def _blocks(self, text: str) -> Iterator[Tuple[str, List[str]]]:
+        """(kind, lines) runs of a page, a single row-like line stays prose"""
+        lines = text.splitlines()
+        rows = [is_table_row(line) if line.strip() else False for line in lines]
+        start = 0
+        while start < len(lines):
+            end = start
+            while end < len(lines) and rows[end] == rows[start]:
+                end += 1
+            kind = TABLE if rows[start] and end - start >= 2 else TEXT
+            yield kind, lines[start:end]
+            start = end
+
+    def _table_pieces(self, rows: List[str]) -> Iterator[str]:
+        rows = [row.strip() for row in rows]
+        header = rows[0]
+        # A header taking most of the budget is not worth repeating
+        repeat_header = self.length_function(header) <= self.chunk_size // 4
+        group: List[str] = []
+        for row in rows:
+            if self.length_function(row) > self.chunk_size:
+                if group:
+                    yield "\n".join(group)
+                    group = []
+                yield from self.text_splitter.split_text(row)
+                continue
+            candidate = "\n".join(group + [row])
+            if group and self.length_function(candidate) > self.chunk_size:
+                yield "\n".join(group)
+                group = [header] if repeat_header else []
+            group.append(row)
+        if group:
+            yield "\n".join(group)
+
+    def _pieces(self, text: str) -> Iterator[Tuple[str, str]]:
+        prose: List[str] = []
+        for kind, lines in self._blocks(text):
+            if kind == TEXT:
+                prose.extend(lines)
+                continue
+            if prose:
+                yield from ((TEXT, p) for p in self.text_splitter.split_text("\n".join(prose)))
+                prose = []
+            yield from ((TABLE, p) for p in self._table_pieces(lines))
+        if prose:
+            yield from ((TEXT, p) for p in self.text_splitter.split_text("\n".join(prose)))
+
+    def _merge_fragments(self, pieces: Iterator[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+        pending: Optional[Tuple[str, str]] = None
+        for kind, text in pieces:
+            if pending is not None:
+                pending_kind, pending_text = pending
+                tiny = min(self.length_function(pending_text), self.length_function(text))
+                merged = f"{pending_text}\n{text}"
+                if tiny < self.min_chunk_size and self.length_function(merged) <= self.chunk_size:
+                    pending = (pending_kind if pending_kind == kind else MIXED, merged)
+                    self.stats.merged_fragments += 1
+                    continue
+                yield pending
+            pending = (kind, text)
+        if pending is not None:
+            yield pending
+
+    def chunk_page(self, text: str, metadata: Dict) -> List[Document]:
+        """Chunks of one page, each with a copy of ``metadata`` and its ``layout``"""
+        if isinstance(self.length_function, TokenCounter):
+            # The splitter measures lines and paragraphs first, count them in one batch
+            self.length_function.count_batch(line for line in text.splitlines() if line.strip())
+
+        pieces = [(kind, piece.strip()) for kind, piece in self._merge_fragments(self._pieces(text))]
+        pieces = [(kind, piece) for kind, piece in pieces if piece]
+        tokens = self.token_counter.count_batch(p for _, p in pieces) if self.token_counter else None
+
+        chunks = []
+        for i, (kind, piece) in enumerate(pieces):
+            self.stats.add(self.length_function(piece), kind)
+            if tokens is not None:
+                overflow = tokens[i] + self.token_counter.special_tokens - self.max_tokens
+                if overflow > 0:
+                    self.stats.truncated += 1
+                    self.stats.wasted_tokens += overflow
+            chunks.append(Document(page_content=piece, metadata={**metadata, "layout": kind}))
+        return chunks
+
+
+def build_chunker() -> LayoutChunker:
+    """Chunker configured by CHUNK_LENGTH_UNIT, token budgets need the embedding tokenizer"""
+    counter = get_token_counter()
+    if CHUNK_LENGTH_UNIT == "tokens" and counter is not None:
+        return LayoutChunker(CHUNK_TOKEN_SIZE, CHUNK_TOKEN_OVERLAP, CHUNK_TOKEN_MIN_SIZE,
+                             length_function=counter, token_counter=counter)
+    return LayoutChunker(token_counter=counter)
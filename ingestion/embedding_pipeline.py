@@ -0,0 +1,167 @@
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from config import EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS
+
+
+# Added by QdrantVectorStore when reading points back, never stored in the payload
+_READ_ONLY_METADATA = ("_id", "_collection_name")
+
+# Fixed namespace so the same file always maps to the same point ids
+_POINT_ID_NAMESPACE = uuid.UUID("8d3c4f0e-2b6a-5e7d-9c1f-6a0b3e5d7c21")
+
+
+def chunk_point_id(file_name: str, file_hash: str, chunk_index: int) -> str:
+    """Deterministic Qdrant point id of a chunk from (file name, content hash, chunk index)
+
+    The name is part of the key: the same bytes uploaded under two names
+    are two files, each with its own points.
+    """
+    return str(uuid.uuid5(_POINT_ID_NAMESPACE, f"{file_name}:{file_hash}:{chunk_index}"))
+
+
+def _payload_metadata(metadata: dict) -> dict:
+    return {k: v for k, v in metadata.items() if k not in _READ_ONLY_METADATA}
+
+
+@dataclass
+class EmbeddedBatch:
+    """One batch of chunks that is embedded and stored in Qdrant"""
+    documents: List[Any]
+    ids: List[str]
+    embed_seconds: float
+    upsert_seconds: float
+
+
+@dataclass
+class IngestStats:
+    chunks: int = 0
+    batches: int = 0
+    embed_seconds: float = 0.0
+    upsert_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add(self, batch: EmbeddedBatch):
+        self.chunks += len(batch.documents)
+        self.batches += 1
+        self.embed_seconds += batch.embed_seconds
+        self.upsert_seconds += batch.upsert_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "seconds": round(self.elapsed, 3),
+            "chunks_per_sec": round(self.chunks_per_sec, 1),
+            "embed_seconds": round(self.embed_seconds, 3),
+            "upsert_seconds": round(self.upsert_seconds, 3),
+        }
+
+
+class EmbeddingPipeline:
+    """Embed chunks in batches and upsert them into Qdrant with a bounded worker pool
+
+    Each worker embeds one batch and upserts it, so while one batch is being
+    written another is already being embedded. At most ``max_pending``
+    batches are in flight: the input iterable is only consumed as batches
+    complete, which keeps memory bounded for long documents. Batches are
+    yielded in input order as soon as they are stored.
+
+    Points use the same payload layout as QdrantVectorStore
+    ({"page_content", "metadata"}), so they are searchable through it.
+    A document that already carries metadata["_id"] is upserted under that
+    id, so ingesting it again overwrites the point instead of adding one.
+    """
+
+    def __init__(self, embedding, client: QdrantClient, collection_name: str,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_workers: int = EMBEDDING_WORKERS,
+                 max_pending: Optional[int] = None):
+        self.embedding = embedding
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending or self.max_workers * 2
+        self.last_stats: Optional[IngestStats] = None
+
+    def _batches(self, documents: Iterable[Any]) -> Iterator[List[Any]]:
+        it = iter(documents)
+        while True:
+            batch = list(islice(it, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _process(self, documents: List[Any]) -> EmbeddedBatch:
+        start = time.perf_counter()
+        vectors = self.embedding.embed_documents([doc.page_content for doc in documents])
+        embedded = time.perf_counter()
+
+        ids = [str(doc.metadata.get("_id") or uuid.uuid4()) for doc in documents]
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[
+                PointStruct(id=point_id, vector=list(vector),
+                            payload={"page_content": doc.page_content,
+                                     "metadata": _payload_metadata(doc.metadata)})
+                for point_id, vector, doc in zip(ids, vectors, documents)
+            ],
+            wait=True,
+        )
+        return EmbeddedBatch(documents, ids, embedded - start, time.perf_counter() - embedded)
+
+    def run(self, documents: Iterable[Any]) -> Iterator[EmbeddedBatch]:
+        """Stream stored batches in input order, stats are kept in ``last_stats``"""
+        stats = self.last_stats = IngestStats()
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="embedding-pipeline") as pool:
+            try:
+                for batch in self._batches(documents):
+                    pending.append(pool.submit(self._process, batch))
+                    # Backpressure: wait for the oldest batch before reading more input
+                    if len(pending) >= self.max_pending:
+                        result = pending.popleft().result()
+                        stats.add(result)
+                        yield result
+                while pending:
+                    result = pending.popleft().result()
+                    stats.add(result)
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+                stats.finished_at = time.perf_counter()
+
+    def ingest(self, documents: Iterable[Any],
+               progress: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+        """Run the pipeline to completion, setting metadata["_id"] on every document
+
+        ``progress`` is called with the running stats after each stored batch.
+        """
+        for batch in self.run(documents):
+            for doc, point_id in zip(batch.documents, batch.ids):
+                doc.metadata["_id"] = point_id
+            if progress:
+                progress(self.last_stats)
+        stats = self.last_stats
+        print(f"✓ Embedded {stats.chunks} chunks in {stats.batches} batches, "
+              f"{stats.chunks_per_sec:.1f} chunks/sec")
+        return stats
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import os
+from typing import Dict, Iterator, Optional, TextIO, Tuple, Union
+
+from langchain_core.documents import Document
+
+# File extension -> row format of structured idiom lists
+IDIOM_TABLE_FORMATS = {".csv": "csv", ".tsv": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Accepted column names per field, compared lowercased
+_COLUMNS = {
+    "idiom": ("idiom", "phrase", "thanh_ngu", "thành ngữ"),
+    "meaning": ("meaning", "definition", "nghia", "nghĩa"),
+    "example": ("example", "vi_du", "ví dụ"),
+}
+
+
+def idiom_table_format(filename: str) -> Optional[str]:
+    """Row format of a structured idiom file, None for anything else (e.g. PDF)"""
+    return IDIOM_TABLE_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def _open_text(source: Union[str, bytes]) -> TextIO:
+    # utf-8-sig drops the BOM spreadsheet exports like to add
+    if isinstance(source, bytes):
+        return io.TextIOWrapper(io.BytesIO(source), encoding="utf-8-sig", newline="")
+    return open(source, "r", encoding="utf-8-sig", newline="")
+
+
+def _normalize_row(row: Dict) -> Dict[str, str]:
+    lowered = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    fields = {}
+    for field, names in _COLUMNS.items():
+        for name in names:
+            value = lowered.get(name)
+            if value is not None and str(value).strip():
+                fields[field] = str(value).strip()
+                break
+    return fields
+
+
+def iter_idiom_rows(source: Union[str, bytes], fmt: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (row number from 1, {"idiom", "meaning"[, "example"]}) one row at a time
+
+    Rows without an idiom or a meaning, and unreadable JSON lines, are
+    yielded as an empty dict so callers can count them.
+    """
+    with _open_text(source) as f:
+        if fmt == "jsonl":
+            for row_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield row_num, {}
+                    continue
+                yield row_num, _normalize_row(row) if isinstance(row, dict) else {}
+        else:
+            reader = csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ",")
+            for row_num, row in enumerate(reader, start=1):
+                yield row_num, _normalize_row(row)
+
+
+def idiom_document(fields: Dict[str, str], row_num: int, filename: str,
+                   source_name: str) -> Document:
+    """Same layout as idioms parsed from a PDF, plus the example when there is one"""
+    content = f"{fields['idiom']} - {fields['meaning']}"
+    metadata = {
+        "file_name": filename,
+        "row": row_num,
+        "idiom": fields["idiom"],
+        "meaning": fields["meaning"],
+        "type": "idiom",
+        "source": source_name,
+    }
+    if fields.get("example"):
+        content = f"{content}\n{fields['example']}"
+        metadata["example"] = fields["example"]
+    return Document(page_content=content, metadata=metadata)
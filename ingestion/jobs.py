@@ -0,0 +1,343 @@
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (INGEST_EVENTS_POLL_INTERVAL, INGEST_JOB_DB, INGEST_JOB_LEASE,
+                    INGEST_TAKEOVER_INTERVAL, INGEST_WORKERS)
+from ingestion.upload import SpooledUpload
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+
+class JobStore:
+    """Persistent ingestion job status in SQLite
+
+    Every update bumps the job's ``seq`` so readers (the SSE endpoint, other
+    processes) can tell when something changed by polling.
+
+    Each unfinished job has an ``owner`` (the IngestionQueue of one process)
+    holding it until ``lease_until``. Owners renew their leases while alive;
+    ownership only changes through conditional UPDATEs, so when several
+    processes share the database exactly one of them runs a job.
+    """
+
+    def __init__(self, path: str = INGEST_JOB_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, filename TEXT NOT NULL,"
+            " params TEXT NOT NULL, status TEXT NOT NULL, progress TEXT, result TEXT,"
+            " error TEXT, created REAL NOT NULL, updated REAL NOT NULL, seq INTEGER NOT NULL,"
+            " owner TEXT, lease_until REAL)"
+        )
+        # Databases created before job leases
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for key in ("params", "progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def create(self, kind: str, filename: str, params: Optional[Dict] = None,
+               owner: Optional[str] = None, lease: float = INGEST_JOB_LEASE) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, filename, params, status, created, updated, seq,"
+                " owner, lease_until) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (job_id, kind, filename, json.dumps(params or {}), QUEUED, now, now,
+                 owner, now + lease)
+            )
+            self._conn.commit()
+        return job_id
+
+    def _execute(self, sql: str, params) -> int:
+        with self._lock:
+            changed = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+        return changed
+
+    def claim(self, job_id: str, owner: str, lease: float = INGEST_JOB_LEASE) -> bool:
+        """Start a queued job of ``owner``, False when it is running or was taken over"""
+        now = time.time()
+        return self._execute(
+            "UPDATE jobs SET status = ?, progress = ?, lease_until = ?, updated = ?, seq = seq + 1"
+            " WHERE id = ? AND status = ? AND owner IS ?",
+            (RUNNING, json.dumps({"stage": "start"}), now + lease, now, job_id, QUEUED, owner)
+        ) == 1
+
+    def renew(self, owner: str, lease: float = INGEST_JOB_LEASE) -> int:
+        """Extend the lease of every unfinished job of ``owner``"""
+        return self._execute(
+            "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+            (time.time() + lease, owner, QUEUED, RUNNING)
+        )
+
+    def take_over(self, job: Dict[str, Any], owner: str, lease: float = INGEST_JOB_LEASE) -> bool:
+        """Queue an abandoned job again under ``owner``
+
+        Only succeeds if the job still has the owner and status it was read
+        with, so of several processes taking over the same job one wins.
+        """
+        now = time.time()
+        return self._execute(
+            "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated = ?, seq = seq + 1"
+            " WHERE id = ? AND status = ? AND owner IS ?",
+            (QUEUED, owner, now + lease, now, job["id"], job["status"], job["owner"])
+        ) == 1
+
+    def update(self, job_id: str, **fields):
+        """Set status / progress / result / error of a job"""
+        columns, values = [], []
+        for key, value in fields.items():
+            columns.append(f"{key} = ?")
+            values.append(json.dumps(value, ensure_ascii=False)
+                          if key in ("progress", "result") else value)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(columns)}, updated = ?, seq = seq + 1 WHERE id = ?",
+                [*values, time.time(), job_id]
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+def _new_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """False only when ``owner`` is a process of this host that no longer exists
+
+    Owners on other hosts cannot be checked, their lease decides.
+    """
+    try:
+        host, pid, _ = owner.split(":")
+        if host != socket.gethostname():
+            return True
+        os.kill(int(pid), 0)
+        return True
+    except (AttributeError, ValueError):
+        return False
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class IngestionQueue:
+    """Background ingestion of uploaded files by a pool of worker threads
+
+    The upload itself is received during the request (teed into MinIO and a
+    local spooled buffer), then parsing, embedding and indexing run in a
+    worker. A worker claims its job before running it, so a job is never
+    run twice. Jobs of a process that died (its lease expired, or its pid is
+    gone on this host) are taken over, reading the file back from MinIO.
+
+    Jobs write the BM25 index, so they only run in the process holding its
+    writer lock; other processes queue their uploads without an owner for
+    the writer to take over.
+    """
+
+    def __init__(self, vector_manager, store: Optional[JobStore] = None,
+                 workers: int = INGEST_WORKERS, lease: float = INGEST_JOB_LEASE):
+        self.vector_manager = vector_manager
+        self.store = store or JobStore()
+        self.workers = workers
+        self.lease = lease
+        self.owner = _new_owner()
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._uploads: Dict[str, SpooledUpload] = {}
+        self._finished: Dict[str, threading.Event] = {}
+        self._threads: List[threading.Thread] = []
+        self._handlers: Dict[str, Callable] = {
+            "pdf": self._run_pdf,
+            "idiom": self._run_idiom,
+        }
+
+    def start(self):
+        """Start the workers and take over abandoned jobs (idempotent)"""
+        if self._threads:
+            return
+        self.take_over_abandoned()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingestion-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._keep_leases, name="ingestion-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def take_over_abandoned(self) -> int:
+        """Queue here the unfinished jobs whose owner is gone, returns how many"""
+        if not self.vector_manager.can_write_index():
+            return 0
+        now = time.time()
+        taken = 0
+        for job in self.store.unfinished():
+            if job["owner"] == self.owner:
+                continue
+            if (job["lease_until"] or 0) >= now and owner_alive(job["owner"]):
+                continue
+            if self.store.take_over(job, self.owner, self.lease):
+                print(f"Resuming ingestion job {job['id']} ({job['filename']})")
+                self._enqueue(job["id"])
+                taken += 1
+        return taken
+
+    def _keep_leases(self):
+        # Renew well before expiry, and pick up jobs queued by followers or
+        # left by processes that died meanwhile
+        renewed = time.monotonic()
+        while True:
+            time.sleep(min(INGEST_TAKEOVER_INTERVAL, self.lease / 3))
+            try:
+                if time.monotonic() - renewed >= self.lease / 3:
+                    self.store.renew(self.owner, self.lease)
+                    renewed = time.monotonic()
+                self.take_over_abandoned()
+            except Exception as e:
+                print(f"! Error renewing ingestion job leases: {e}")
+
+    def _enqueue(self, job_id: str, upload: Optional[SpooledUpload] = None):
+        if upload is not None:
+            self._uploads[job_id] = upload
+        self._finished.setdefault(job_id, threading.Event())
+        self._queue.put(job_id)
+
+    def submit(self, kind: str, file, filename: Optional[str] = None, **params) -> str:
+        """Receive an upload and queue its ingestion, returns the job id
+
+        ``filename`` stores and indexes the upload under another name than
+        the client's, e.g. to replace an existing file.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown ingestion job kind: {kind}")
+        filename = filename or file.filename
+        upload = self.vector_manager.receive_upload(file, filename)
+        if not self.vector_manager.can_write_index():
+            # Stored in MinIO already, the writer process reads it back from there
+            upload.close()
+            return self.store.create(kind, filename, params, owner=None, lease=0)
+        job_id = self.store.create(kind, filename, params, owner=self.owner, lease=self.lease)
+        self._enqueue(job_id, upload)
+        return job_id
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until the job finished, returns its final state"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = self._finished.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        # Run by another process (or lost to one), only the job store tells
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(INGEST_EVENTS_POLL_INTERVAL)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        upload = self._uploads.pop(job_id, None)
+        try:
+            if not self.store.claim(job_id, self.owner, self.lease):
+                # Taken over by another process after our lease lapsed
+                print(f"! Ingestion job {job_id} is owned by another process, skipping")
+                return
+            job = self.store.get(job_id)
+            if upload is None:
+                # Resumed after a restart, the original upload is in MinIO
+                content = self.vector_manager.storage.get_file(job["filename"])
+                if content is None:
+                    raise Exception("File is no longer in storage")
+                upload = SpooledUpload()
+                upload.write(content)
+
+            last_update = [0.0]
+
+            def progress(event: Dict[str, Any]):
+                # Page-level events are frequent, persist at most every 0.2s
+                now = time.monotonic()
+                if now - last_update[0] >= 0.2 or event.get("stage") != "extract":
+                    last_update[0] = now
+                    self.store.update(job_id, progress=event)
+
+            result = self._handlers[job["kind"]](job, upload, progress)
+            self.store.update(job_id, status=DONE, progress={"stage": "done"}, result=result)
+            print(f"✓ Ingestion job {job_id} finished")
+        except Exception as e:
+            print(f"! Ingestion job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e))
+        finally:
+            if upload is not None:
+                upload.close()
+            event = self._finished.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    def _run_pdf(self, job, upload: SpooledUpload, progress) -> Dict[str, Any]:
+        chunk_stats: Dict[str, Any] = {}
+
+        def track(event: Dict[str, Any]):
+            if event.get("stage") == "chunk":
+                chunk_stats.update(event["stats"])
+            progress(event)
+
+        doc_len, chunks_len = self.vector_manager.ingest_pdf(upload, job["filename"], progress=track)
+        return {"doc_len": doc_len, "chunks": chunks_len, "chunk_stats": chunk_stats}
+
+    def _run_idiom(self, job, upload: SpooledUpload, progress) -> Dict[str, Any]:
+        return self.vector_manager.ingest_idiom(
+            upload, job["filename"], source_name=job["params"].get("source_name", "idioms"),
+            progress=progress
+        )
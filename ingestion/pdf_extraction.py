@@ -0,0 +1,145 @@
+import io
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+from pypdf import PdfReader
+
+from config import PDF_EXTRACT_WORKERS, PDF_EXTRACT_SHARD_PAGES, PDF_PAGE_TIMEOUT
+
+
+class PageTimeout(BaseException):
+    """Not an Exception, so pypdf's own error handling cannot swallow it"""
+
+
+# A PDF file path, or its content for documents kept in memory
+PdfSource = Union[str, bytes]
+
+
+def _raise_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def _open_reader(source: PdfSource) -> PdfReader:
+    return PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _source_name(source: PdfSource) -> str:
+    return "in-memory PDF" if isinstance(source, bytes) else os.path.basename(source)
+
+
+def _extract_shard(source: PdfSource, start: int, end: int,
+                   page_timeout: float) -> List[Tuple[int, str]]:
+    """Text of pages [start, end) as (page number from 1, text), runs in a worker process
+
+    A page taking longer than ``page_timeout`` seconds (or failing) yields
+    an empty text instead of stalling the whole document.
+    """
+    reader = _open_reader(source)
+    # Pool workers run tasks on their main thread, so SIGALRM can interrupt pypdf
+    use_alarm = page_timeout > 0 and hasattr(signal, "setitimer")
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout) if use_alarm else None
+
+    pages = []
+    try:
+        for i in range(start, end):
+            try:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                try:
+                    text = reader.pages[i].extract_text() or ""
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+            except PageTimeout:
+                print(f"! Page {i + 1} of {_source_name(source)} timed out after {page_timeout}s, skipped")
+                text = ""
+                # The interrupted parse may leave the reader half-updated
+                reader = _open_reader(source)
+            except Exception as e:
+                print(f"! Error extracting page {i + 1} of {_source_name(source)}: {e}")
+                text = ""
+            pages.append((i + 1, text))
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous_handler)
+    return pages
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by all uploads, started on first use"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Not forked from the server: its threads (queue workers, clients,
+            # torch) may hold locks that a forked child would inherit held
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def count_pages(source: PdfSource) -> int:
+    return len(_open_reader(source).pages)
+
+
+def extract_pages(source: PdfSource, workers: int = PDF_EXTRACT_WORKERS,
+                  shard_pages: int = PDF_EXTRACT_SHARD_PAGES,
+                  page_timeout: float = PDF_PAGE_TIMEOUT) -> Iterator[Tuple[int, str]]:
+    """Yield (page number from 1, text) of a PDF in page order
+
+    Pages are split into shards of ``shard_pages`` extracted by a pool of
+    ``workers`` processes. At most two shards per worker are in flight and
+    pages are yielded as soon as their shard and every earlier one is done,
+    so the splitter can start on the first pages while later ones are
+    still being extracted. In-memory sources are sent to the workers with
+    each shard, so large files should be passed by path.
+
+    Even a single shard goes through the pool: the per-page timeout relies
+    on SIGALRM, which only the main thread of a process receives, and
+    ingestion runs on worker threads.
+    """
+    page_count = count_pages(source)
+    shards = [(start, min(start + shard_pages, page_count))
+              for start in range(0, page_count, max(1, shard_pages))]
+    workers = max(1, workers)
+
+    pool = _get_pool(workers)
+    # Upper bound for a shard, the per-page alarm normally fires long before
+    shard_timeout = page_timeout * shard_pages + 60 if page_timeout > 0 else None
+    pending: Deque[Future] = deque()
+    next_shard = 0
+    try:
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < workers * 2:
+                start, end = shards[next_shard]
+                pending.append(pool.submit(_extract_shard, source, start, end, page_timeout))
+                next_shard += 1
+            yield from pending.popleft().result(timeout=shard_timeout)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
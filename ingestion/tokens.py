@@ -0,0 +1,66 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from config import EMBEDDING_TOKENIZER, TOKEN_COUNT_CACHE_SIZE
+from rag.search.query_cache import LRUCache
+
+
+class TokenCounter:
+    """Token length of texts under the embedding model's tokenizer
+
+    Counts exclude special tokens. They are cached per text, since the
+    splitter measures the same pieces over and over while merging them,
+    and ``count_batch`` encodes all uncached texts in one batch call.
+    """
+
+    def __init__(self, tokenizer, cache_size: int = TOKEN_COUNT_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        # e.g. [CLS] and [SEP], added by the model on top of the counted tokens
+        self.special_tokens = len(tokenizer.encode("", add_special_tokens=True).ids)
+        self._cache = LRUCache(cache_size)
+
+    def __call__(self, text: str) -> int:
+        count = self._cache.get(text)
+        if count is None:
+            count = len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+            self._cache.put(text, count)
+        return count
+
+    def count_batch(self, texts: Iterable[str]) -> List[int]:
+        texts = list(texts)
+        counts = [self._cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, c in zip(texts, counts) if c is None))
+        if missing:
+            encoded = self.tokenizer.encode_batch(missing, add_special_tokens=False)
+            found = {text: len(enc.ids) for text, enc in zip(missing, encoded)}
+            for text, count in found.items():
+                self._cache.put(text, count)
+            counts = [found[t] if c is None else c for t, c in zip(texts, counts)]
+        return counts
+
+    def stats(self):
+        return self._cache.stats()
+
+
+_counters: Dict[str, Optional[TokenCounter]] = {}
+_counter_lock = threading.Lock()
+
+
+def get_token_counter(name: str = EMBEDDING_TOKENIZER,
+                      cache_size: int = TOKEN_COUNT_CACHE_SIZE) -> Optional[TokenCounter]:
+    """Shared counter for a tokenizer (a Hugging Face repo id or a tokenizer.json
+    path), None when it cannot be loaded"""
+    with _counter_lock:
+        if name not in _counters:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(name) if os.path.isfile(name) \
+                    else Tokenizer.from_pretrained(name)
+                _counters[name] = TokenCounter(tokenizer, cache_size)
+                print(f"✓ Loaded tokenizer {name}")
+            except Exception as e:
+                # Offline or missing tokenizer: callers fall back to character counts
+                print(f"! Could not load tokenizer {name}: {e}")
+                _counters[name] = None
+        return _counters[name]
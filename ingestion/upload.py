@@ -0,0 +1,99 @@
+import hashlib
+import io
+import os
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+from config import UPLOAD_SPOOL_MAX_MEMORY
+
+
+class SpooledUpload:
+    """Local copy of an uploaded file, in memory until it grows past ``max_memory``
+
+    Above the threshold the content spills to a named temporary file, so
+    extraction worker processes can open it by path. ``source`` is the path
+    once spilled, otherwise the bytes themselves. The SHA-256 of the content
+    is computed while writing (``sha256``).
+    """
+
+    def __init__(self, max_memory: int = UPLOAD_SPOOL_MAX_MEMORY, suffix: str = ".pdf"):
+        self.max_memory = max_memory
+        self.suffix = suffix
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer: Union[io.BytesIO, BinaryIO] = io.BytesIO()
+        self._hash = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        if self.path is None and self.size + len(data) > self.max_memory:
+            self._spill()
+        self._buffer.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def _spill(self):
+        spilled = tempfile.NamedTemporaryFile(delete=False, suffix=self.suffix)
+        spilled.write(self._buffer.getbuffer())
+        self._buffer = spilled
+        self.path = spilled.name
+
+    @property
+    def source(self) -> Union[str, bytes]:
+        if self.path is not None:
+            self._buffer.flush()
+            return self.path
+        return self._buffer.getvalue()
+
+    def close(self):
+        self._buffer.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TeeReader:
+    """Readable stream that copies every chunk read from ``source`` into ``sink``
+
+    Handing it to an uploader stores the upload and fills the local copy in
+    a single pass over the incoming stream.
+    """
+
+    def __init__(self, source: BinaryIO, sink):
+        self.source = source
+        self.sink = sink
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        if data:
+            self.sink.write(data)
+        return data
+
+    def drain(self, chunk_size: int = 1024 * 1024):
+        """Copy whatever the consumer did not read"""
+        while self.read(chunk_size):
+            pass
+
+
+def stream_length(file_obj: BinaryIO) -> int:
+    """Remaining bytes of a seekable stream, -1 when unknown"""
+    try:
+        position = file_obj.tell()
+        end = file_obj.seek(0, os.SEEK_END)
+        file_obj.seek(position)
+        return end - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return -1
@@ -1,32 +1,42 @@
+from typing import List, Optional, Tuple
+
 from langchain_ollama import OllamaLLM, OllamaEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
 import ollama
+from storage.embedding_cache import CachedEmbeddings, get_embedding_cache
+from chat.prompt_budget import PackedPrompt, PromptBudget, pack_prompt
 from config import (
     OLLAMA_MODEL, 
     EMBEDDING_MODEL, 
-    CHUNK_SIZE, 
-    CHUNK_OVERLAP
+    OLLAMA_BASE_URL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    LLM_CONTEXT_TOKENS
 )
 
 class OllamaWrapper:
     def __init__(self, model: str = OLLAMA_MODEL):
         self.model = model
+        # Same context window as the prompt budget (and get_llm, so Ollama does not reload)
+        self.options = {"num_ctx": LLM_CONTEXT_TOKENS}
+        self._async_client = None
 
     def chat(self, messages):
         """
         Gọi non-stream, trả về full text.
         messages: list[dict] [{"role": "user", "content": "..."}]
         """
-        resp = ollama.chat(model=self.model, messages=messages)
+        resp = ollama.chat(model=self.model, messages=messages, options=self.options)
         return resp["message"]["content"]
 
     def stream(self, messages):
         """
         Gọi stream, yield từng chunk text.
         """
-        stream = ollama.chat(model=self.model, messages=messages, stream=True)
+        stream = ollama.chat(model=self.model, messages=messages, stream=True,
+                             options=self.options)
         for chunk in stream:
             # Debug log để xem Ollama trả về gì
             print("OLLAMA RAW:", chunk, flush=True)
@@ -40,25 +50,35 @@ class OllamaWrapper:
             elif chunk.get("done"):
                 break
 
+    async def astream(self, messages):
+        """
+        Như stream() nhưng dùng async I/O: không giữ thread nào trong lúc chờ token.
+        """
+        if self._async_client is None:
+            self._async_client = ollama.AsyncClient()
+        stream = await self._async_client.chat(model=self.model, messages=messages, stream=True,
+                                               options=self.options)
+        async for chunk in stream:
+            if "message" in chunk and chunk["message"].get("content"):
+                yield chunk["message"]["content"]
+            elif chunk.get("done"):
+                break
+
 def get_llm_stream():
     return OllamaWrapper(model=OLLAMA_MODEL)
 
 # Initialize LLM
 def get_llm():
-    return OllamaLLM(model=OLLAMA_MODEL)
+    return OllamaLLM(model=OLLAMA_MODEL, num_ctx=LLM_CONTEXT_TOKENS)
 
 # Initialize embeddings
-def get_embeddings():
-    return OllamaEmbeddings(model=EMBEDDING_MODEL)
-
-# Initialize text splitter
-def get_text_splitter():
-    return RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-        is_separator_regex=False,
-    )
+def get_embeddings(base_url: str = OLLAMA_BASE_URL, cached: bool = EMBEDDING_CACHE_ENABLED):
+    embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=base_url)
+    if not cached:
+        return embeddings
+    # Identical chunk text (re-uploads, repeated queries) is embedded only once
+    cache = get_embedding_cache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    return CachedEmbeddings(embeddings, cache, EMBEDDING_MODEL)
 
 # Prompt template for RAG
 # def get_rag_prompt():
@@ -136,54 +156,26 @@ def get_retriever_prompt():
     #     ("human", "{input}"),
     #     ("human", "Given the conversation above, please answer the question based on the provided context."),
     # ])
-def build_prompt_with_history(query: str, context_docs, history=None) -> str:
-    """
-    Build final RAG prompt với optional chat history (không dùng LangChain PromptTemplate).
-   
-    Args:
-        query (str): câu hỏi của user
-        context_docs (List): danh sách documents từ retriever (BM25/Vector)
-        history (List[Dict] hoặc List[HumanMessage|AIMessage]): lịch sử hội thoại
-    Returns:
-        str: prompt hoàn chỉnh để gửi sang model (ollama.chat)
-    """
-    # Ghép context lại
-    context_text = "\n".join([
-        doc.page_content if hasattr(doc, "page_content") else str(doc)
-        for doc in context_docs
-    ])
-    
-    # Ghép lịch sử hội thoại (nếu có)
-    history_text = ""
-    if history:
-        # Check if history is list of LangChain messages or dict pairs
-        if history and isinstance(history[0], (HumanMessage, AIMessage)):
-            # Convert LangChain messages to conversation pairs
-            pairs = []
-            i = 0
-            while i < len(history) - 1:
-                if isinstance(history[i], HumanMessage) and isinstance(history[i + 1], AIMessage):
-                    pairs.append({
-                        "user": history[i].content,
-                        "assistant": history[i + 1].content
-                    })
-                    i += 2
-                else:
-                    i += 1
-            
-            history_text = "\n".join([
-                f"User: {h['user']}\nAssistant: {h['assistant']}"
-                for h in pairs
-            ])
+def _history_pairs(history) -> List[Tuple[str, str]]:
+    """(user, assistant) pairs from LangChain messages or {"user", "assistant"} dicts"""
+    if not history:
+        return []
+    if not isinstance(history[0], (HumanMessage, AIMessage)):
+        return [(h["user"], h["assistant"]) for h in history]
+    pairs = []
+    i = 0
+    while i < len(history) - 1:
+        if isinstance(history[i], HumanMessage) and isinstance(history[i + 1], AIMessage):
+            pairs.append((history[i].content, history[i + 1].content))
+            i += 2
         else:
-            # Already in dict format
-            history_text = "\n".join([
-                f"User: {h['user']}\nAssistant: {h['assistant']}"
-                for h in history
-            ])
-    
+            i += 1
+    return pairs
+
+
+def _idiom_prompt(context_text: str, history_text: str, query: str) -> str:
     # Prompt template thuần
-    prompt = f"""
+    return f"""
 <s>[INST] <<SYS>>
 You are a technical assistant that answers strictly based on the given context.
 The context contains a list of English idioms with their Vietnamese meanings.
@@ -214,54 +206,11 @@ Question: {query}
 
 Answer (one line only):
 [/INST]""".strip()
-    
-    return prompt
 
 
-def build_prompt_with_history_longdoc(query: str, context_docs, history=None) -> str:
-    """
-    Build RAG prompt với optional chat history cho document dài.
-   
-    Args:
-        query (str): câu hỏi của user
-        context_docs (List): danh sách documents từ retriever (BM25/Vector)
-        history (List[Dict] hoặc List[HumanMessage|AIMessage]): lịch sử hội thoại
-    Returns:
-        str: prompt hoàn chỉnh để gửi sang model (ollama.chat)
-    """
-    # Ghép context lại
-    context_text = "\n".join([
-        doc.page_content if hasattr(doc, "page_content") else str(doc)
-        for doc in context_docs
-    ])
-    
-    # Ghép lịch sử hội thoại (nếu có)
-    history_text = ""
-    if history:
-        if isinstance(history[0], (HumanMessage, AIMessage)):
-            pairs = []
-            i = 0
-            while i < len(history) - 1:
-                if isinstance(history[i], HumanMessage) and isinstance(history[i + 1], AIMessage):
-                    pairs.append({
-                        "user": history[i].content,
-                        "assistant": history[i + 1].content
-                    })
-                    i += 2
-                else:
-                    i += 1
-            history_text = "\n".join([
-                f"User: {h['user']}\nAssistant: {h['assistant']}"
-                for h in pairs
-            ])
-        else:
-            history_text = "\n".join([
-                f"User: {h['user']}\nAssistant: {h['assistant']}"
-                for h in history
-            ])
-    
+def _longdoc_prompt(context_text: str, history_text: str, query: str) -> str:
     # Prompt template cho long documents
-    prompt = f"""
+    return f"""
 <s>[INST] <<SYS>>
 You are a helpful assistant that answers strictly based on the provided context.
 The context may contain long articles, reports, or documents.
@@ -285,5 +234,75 @@ Question: {query}
 
 Answer:
 [/INST]""".strip()
-    
-    return prompt
+
+
+def pack_prompt_with_history(query: str, context_docs, history=None, summary: str = "",
+                             longdoc: bool = False,
+                             budget: Optional[PromptBudget] = None) -> PackedPrompt:
+    """
+    Build RAG prompt trong giới hạn token của OLLAMA_MODEL.
+
+    Context docs và lịch sử hội thoại được cắt bớt cho vừa budget (xem
+    chat.prompt_budget.pack_prompt); kết quả kèm số token của prompt.
+    """
+    docs = [
+        doc.page_content if hasattr(doc, "page_content") else str(doc)
+        for doc in context_docs
+    ]
+    render = _longdoc_prompt if longdoc else _idiom_prompt
+    return pack_prompt(render, query, docs, _history_pairs(history), summary, budget)
+
+
+def build_prompt_with_history(query: str, context_docs, history=None, summary: str = "") -> str:
+    """
+    Build final RAG prompt với optional chat history (không dùng LangChain PromptTemplate).
+   
+    Args:
+        query (str): câu hỏi của user
+        context_docs (List): danh sách documents từ retriever (BM25/Vector)
+        history (List[Dict] hoặc List[HumanMessage|AIMessage]): lịch sử hội thoại
+        summary (str): tóm tắt các lượt hội thoại cũ hơn history
+    Returns:
+        str: prompt hoàn chỉnh để gửi sang model (ollama.chat), trong giới hạn token
+    """
+    return pack_prompt_with_history(query, context_docs, history, summary).prompt
+
+
+def build_prompt_with_history_longdoc(query: str, context_docs, history=None,
+                                      summary: str = "") -> str:
+    """
+    Build RAG prompt với optional chat history cho document dài.
+   
+    Args:
+        query (str): câu hỏi của user
+        context_docs (List): danh sách documents từ retriever (BM25/Vector)
+        history (List[Dict] hoặc List[HumanMessage|AIMessage]): lịch sử hội thoại
+        summary (str): tóm tắt các lượt hội thoại cũ hơn history
+    Returns:
+        str: prompt hoàn chỉnh để gửi sang model (ollama.chat), trong giới hạn token
+    """
+    return pack_prompt_with_history(query, context_docs, history, summary, longdoc=True).prompt
+
+
+def build_summary_prompt(summary: str, turns: List[Tuple[str, str]]) -> str:
+    """Prompt that folds ``turns`` into the running ``summary`` of a conversation"""
+    conversation = "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+    return f"""
+<s>[INST] <<SYS>>
+You maintain a short running summary of a conversation between a user and an assistant.
+<</SYS>>
+
+Update the summary with the new turns below.
+- Keep the idioms, topics, names and facts the user asked about and the answers given.
+- Write at most 120 words, in the language of the conversation.
+- Output only the updated summary.
+
+Current summary:
+{summary or "(empty)"}
+
+New turns:
+{conversation}
+
+Updated summary:
+[/INST]""".strip()
+
@@ -1,7 +1,14 @@
-from .handler import RAGHandler
+def __getattr__(name):
+    # Imported on first access: the handler pulls in the reranker and LangChain,
+    # which submodules like rag.search.bm25 must not pay for
+    if name == "RAGHandler":
+        from .handler import RAGHandler
+        return RAGHandler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def create_hybrid_rag():
     """Create a new RAGHandler instance"""
+    from .handler import RAGHandler
     return RAGHandler()
 
 def quick_hybrid_query(query, alpha=0.5, k=None):
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from .search.bm25 import BM25Search
 from .search.vector import VectorSearch
 from .search.hybrid import HybridSearch
@@ -8,24 +8,30 @@ from .utils.context import ContextFormatter
 from config import SIMILARITY_SEARCH_K
 
 class RAGHandler:
-    def __init__(self):
-        self.vector_search = VectorSearch()
-        self.bm25_search = BM25Search()
+    def __init__(self, vector_search: Optional[VectorSearch] = None,
+                 bm25_search: Optional[BM25Search] = None,
+                 reranker: Optional[CrossEncoderReranker] = None,
+                 retriever: Optional[DocumentRetriever] = None):
+        self.vector_search = vector_search or VectorSearch()
+        self.bm25_search = bm25_search or BM25Search()
         self.hybrid_search = HybridSearch(self.bm25_search, self.vector_search)
-        self.reranker = CrossEncoderReranker()
-        self.retriever = DocumentRetriever()
+        self.reranker = reranker or CrossEncoderReranker()
+        self.retriever = retriever or DocumentRetriever()
         self.context_formatter = ContextFormatter()
         self._initialize_indexes()
 
     def _initialize_indexes(self):
         """Initialize search indexes"""
         try:
-            # Get all documents from vector store
-            documents = self.vector_search.get_all_documents()
-            if documents:
-                print(f"Found {len(documents)} documents in vector store")
-                # Build BM25 index
-                self.bm25_search.build_index(documents)
+            # Reuse the on-disk BM25 snapshot, catching up with Qdrant if needed
+            doc_count = self.bm25_search.warm_start(
+                self.vector_search.get_collection_marker(),
+                point_id_pages=self.vector_search.iter_point_id_pages,
+                fetch_pages=self.vector_search.iter_document_pages_by_ids,
+                all_pages=self.vector_search.iter_document_pages,
+            )
+            if doc_count:
+                print(f"Found {doc_count} documents in vector store")
             else:
                 print("No documents found in vector store")
         except Exception as e:
@@ -39,39 +45,45 @@ class RAGHandler:
                 self.bm25_search.add_documents(documents)
             else:
                 print("Rebuilding BM25 index with all docs...")
-                all_docs = self.vector_search.get_all_documents()
-                self.bm25_search.build_index(all_docs)
+                self.bm25_search.build_index_from_pages(
+                    self.vector_search.iter_document_pages()
+                )
             return True
         except Exception as e:
             print(f"Error updating indexes: {e}")
             return False
 
 
+    def retrieve_hybrid(self, query: str, k: Optional[int] = None, alpha: float = 0.5,
+                        metadata_filter: Optional[Dict] = None,
+                        use_rerank: bool = True) -> List[Any]:
+        """Top-k Documents of the hybrid search, reranked; no LLM call"""
+        k = k or SIMILARITY_SEARCH_K
+
+        # Get candidate documents
+        candidates = self.hybrid_search.search(
+            query=query,
+            k=k * 2,
+            alpha=alpha,
+            metadata_filter=metadata_filter
+        )
+        documents = [doc for doc, _ in candidates]
+
+        # Rerank if needed
+        if use_rerank:
+            return self.reranker.rerank(query, documents, top_k=k)
+        return documents[:k]
+
     def rag_query_hybrid(self, query: str, k: Optional[int] = None, 
                         alpha: float = 0.5, include_sources: bool = True,
                         metadata_filter: Optional[Dict] = None, 
                         use_rerank: bool = True) -> Dict[str, Any]:
         """RAG pipeline with hybrid search"""
-        k = k or SIMILARITY_SEARCH_K
-
         try:
-            # Get candidate documents
-            candidates = self.hybrid_search.search(
-                query=query,
-                k=k * 2,
-                alpha=alpha,
-                metadata_filter=metadata_filter
-            )
-            documents = [doc for doc, _ in candidates]
-
-            # Rerank if needed
-            if use_rerank:
-                documents = self.reranker.rerank(query, documents, top_k=k)
-            else:
-                documents = documents[:k]
+            documents = self.retrieve_hybrid(query, k, alpha, metadata_filter, use_rerank)
 
             # Format context and get response
-            context = self.context_formatter.format_documents(documents)
+            context = self.context_formatter.format_parts(documents)
             response = self.retriever.get_llm_response(query, context)
             
             return {
@@ -88,7 +100,8 @@ class RAGHandler:
     def clear_search_indexes(self):
         """Clear all search indexes and caches"""
         try:
-            self.bm25_search.clear_index()
+            if not self.bm25_search.clear_cache():
+                raise RuntimeError("Could not clear the BM25 index")
             status = self.bm25_search.get_status()
             return {
                 "status": "success", 
@@ -1,9 +1,25 @@
+import threading
 from typing import List, Any
-from sentence_transformers import CrossEncoder
 
 class CrossEncoderReranker:
     def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
-        self.reranker = CrossEncoder(model_name)
+        self.model_name = model_name
+        self._reranker = None
+        self._lock = threading.Lock()
+
+    @property
+    def reranker(self):
+        """CrossEncoder model, loaded on first use (sentence-transformers imports torch)"""
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = CrossEncoder(self.model_name)
+        return self._reranker
+
+    def warm_up(self):
+        """Load the model now instead of on the first query"""
+        self.reranker
 
     def rerank(self, query: str, docs: List[Any], top_k: int = 10) -> List[Any]:
         """
@@ -1,19 +1,27 @@
-from typing import Dict, Any
+from typing import List, Union
+from chat.prompt_budget import pack_prompt
 from models import get_llm, get_rag_prompt
 
 class DocumentRetriever:
-    def __init__(self):
-        self.llm = get_llm()
+    def __init__(self, llm=None):
+        self.llm = llm or get_llm()
         self.rag_prompt = get_rag_prompt()
 
-    def get_llm_response(self, query: str, context: str) -> Dict[str, Any]:
-        """Get LLM response using RAG prompt"""
+    def _render(self, context_text: str, history_text: str, query: str) -> str:
+        return self.rag_prompt.format(input=query, context=context_text)
+
+    def get_llm_response(self, query: str, context: Union[str, List[str]]) -> str:
+        """Get LLM response using RAG prompt, the context cut to the model's token budget
+
+        ``context`` may be given as one part per document, whole documents
+        are then dropped before the last kept one is cut.
+        """
         try:
-            prompt = self.rag_prompt.format(
-                input=query,
-                context=context
-            )
-            response = self.llm.invoke(prompt)
+            parts = [context] if isinstance(context, str) else context
+            packed = pack_prompt(self._render, query, parts, [])
+            print(f"Prompt: {packed.tokens}/{packed.budget} tokens, "
+                  f"{packed.context_docs} docs ({packed.context_docs_dropped} dropped)")
+            response = self.llm.invoke(packed.prompt)
             
             return response.content if hasattr(response, "content") else str(response)
             
@@ -1,31 +1,120 @@
-from rank_bm25 import BM25Okapi
-from ..utils.preprocessing import preprocess_text
-from ..utils.cache import CacheManager
-from typing import List, Tuple, Dict, Any, Optional
-import os
+from .query_cache import GenerationCache, LRUCache
+from .scoring import top_k
+from .segment import SegmentStore
+from .segmented_index import SegmentedIndex
+from ..utils.tokenizer import Tokenizer, get_tokenizer
+from config import (BM25_METADATA_FIELDS, BM25_INDEX_DIR, BM25_MERGE_FACTOR, QDRANT_COLLECTION_NAME,
+                    BM25_QUERY_CACHE_SIZE, BM25_TERM_CACHE_SIZE)
+from typing import List, Tuple, Dict, Any, Callable, Hashable, Iterable, Optional
+
+import numpy as np
 
 class BM25Search:
-    def __init__(self, cache_manager: Optional[CacheManager] = None):
-        self.cache_manager = cache_manager or CacheManager()
-        self.bm25 = None
-        self.documents = []
+    def __init__(self, segment_store: Optional[SegmentStore] = None,
+                 tokenizer: Optional[Tokenizer] = None):
+        self.segment_store = segment_store or SegmentStore(BM25_INDEX_DIR)
+        self.index = SegmentedIndex(
+            self.segment_store, BM25_METADATA_FIELDS, merge_factor=BM25_MERGE_FACTOR,
+            tokenizer=tokenizer or get_tokenizer(QDRANT_COLLECTION_NAME),
+            term_cache_size=BM25_TERM_CACHE_SIZE
+        )
+        # query text -> tokens, independent of the index contents
+        self._token_cache = LRUCache(BM25_QUERY_CACHE_SIZE)
+        # (sorted tokens, filter, k) -> top-k (doc ids, scores) of one index generation
+        self._result_cache = GenerationCache(BM25_QUERY_CACHE_SIZE)
         # self._initialize_index()
 
+    @property
+    def documents(self):
+        """All indexed documents, addressed by BM25 doc id"""
+        return self.index.documents
+
     def _initialize_index(self):
-        """Initialize BM25 index from cache or prepare for new build"""
+        """Initialize BM25 index from the on-disk segments or prepare for new build"""
         try:
             print("Initializing BM25 index...")
-            self.bm25, self.documents = self.cache_manager.load_bm25_cache()
-            
-            if self.bm25 and self.documents:
-                print(f"✓ BM25 index loaded from cache with {len(self.documents)} documents")
+            self.index.open()
+
+            if self.index.segments:
+                print(f"✓ BM25 index loaded from {len(self.index.segments)} segments "
+                      f"with {self.index.live_count} documents")
+                self.index.start_merging()
             else:
-                print("! No valid cache found - will build new index when documents are added")
-                
+                print("! No valid segment found - will build new index when documents are added")
+
         except Exception as e:
-            print(f"! Error loading BM25 cache: {str(e)}")
-            self.bm25 = None
-            self.documents = []
+            print(f"! Error loading BM25 segments: {str(e)}")
+
+    def _snapshot_state(self, marker: Dict[str, Any]) -> Dict[str, Any]:
+        # Live documents only, merges drop tombstoned ones without changing the index
+        return {**marker, "doc_count": self.index.live_count, "tokenizer": self.index.tokenizer_name}
+
+    def snapshot_matches(self, marker: Optional[Dict[str, Any]]) -> bool:
+        """True when the on-disk index was last synced with the collection in state ``marker``"""
+        return bool(marker) and self.segment_store.read_state() == self._snapshot_state(marker)
+
+    def save_snapshot_marker(self, marker: Optional[Dict[str, Any]]):
+        """Record that the index is in sync with the collection in state ``marker``"""
+        if marker and self.index.writer:
+            self.segment_store.write_state(self._snapshot_state(marker))
+
+    def invalidate_snapshot_marker(self):
+        """Called before the collection and the index change, until the new marker is saved
+
+        A process dying in between leaves no marker, so the next warm start
+        compares the index with the collection instead of trusting the snapshot.
+        """
+        if self.index.writer:
+            self.segment_store.write_state({})
+
+    def warm_start(self, marker: Optional[Dict[str, Any]],
+                   point_id_pages: Callable[[], Iterable[List[str]]],
+                   fetch_pages: Callable[[List[str]], Iterable[List[Any]]],
+                   all_pages: Callable[[], Iterable[List[Any]]]) -> int:
+        """Open the on-disk index and bring it in line with the vector store
+
+        marker: collection state (e.g. point count) saved with the snapshot,
+            None when the vector store is unreachable (the snapshot is used as is)
+        point_id_pages: streams the point ids of the collection
+        fetch_pages: streams the documents of the given point ids
+        all_pages: streams every document, used for a full rebuild
+
+        A matching marker loads the snapshot without touching the vector
+        store. Otherwise only points missing from the index are fetched and
+        added; the index is rebuilt when points were deleted, documents have
+        no point id or the tokenizer changed. Returns the document count.
+        """
+        self._initialize_index()
+        if not self.index.writer:
+            # The writer process keeps the index in line with the vector store
+            print("! BM25 index is written by another process, following it read-only")
+            return self.index.doc_count
+        if not marker:
+            return self.index.doc_count
+        if self.snapshot_matches(marker):
+            print("✓ BM25 snapshot matches the vector store, skipping rebuild")
+            return self.index.doc_count
+
+        indexed = self.index.point_ids()
+        indexed_set = set(indexed)
+        rebuild = (not indexed or "" in indexed_set or len(indexed_set) != len(indexed)
+                   or any(s.tokenizer != self.index.tokenizer_name for s in self.index.segments))
+        if not rebuild:
+            current = [point_id for page in point_id_pages() for point_id in page]
+            rebuild = not indexed_set.issubset(current)
+
+        if rebuild:
+            self.build_index_from_pages(all_pages())
+        else:
+            missing = [point_id for point_id in current if point_id not in indexed_set]
+            print(f"Catching up BM25 index with {len(missing)} new points...")
+            for page in fetch_pages(missing):
+                if page:
+                    self.index.add_documents(page)
+            self.index.start_merging()
+
+        self.save_snapshot_marker(marker)
+        return self.index.doc_count
 
     def build_index(self, documents: List[Any]):
         """Build BM25 index from documents"""
@@ -35,56 +124,68 @@ class BM25Search:
                 return
 
             print(f"Building BM25 index with {len(documents)} documents...")
-            self.documents = documents
-            
-            # Tokenize and build index
-            tokenized_docs = [preprocess_text(doc.page_content) for doc in documents]
-            self.bm25 = BM25Okapi(tokenized_docs)
-            
-            # Try to cache
-            cache_success = self.cache_manager.save_bm25_cache(self.bm25, self.documents)
-            if cache_success:
-                print("✓ BM25 index built and cached successfully")
-            else:
-                print("! Warning: Index built but caching failed")
+
+            # Write the whole corpus as a single segment, text that is already
+            # indexed reuses its stored tokens instead of being tokenized again
+            self.index.reset(documents)
+            self.index.start_merging()
+            print("✓ BM25 index built and saved successfully")
 
         except Exception as e:
             print(f"! Error building BM25 index: {str(e)}")
-            self.bm25 = None
-            self.documents = []
             raise e
 
-    def search(self, query: str, k: int = 10, 
+    def build_index_from_pages(self, pages: Iterable[List[Any]]) -> int:
+        """Build BM25 index from a stream of document pages, one segment per page
+
+        Returns the number of indexed documents.
+        """
+        try:
+            print("Building BM25 index from document pages...")
+            doc_count = self.index.rebuild(pages)
+            self.index.start_merging()
+            print(f"✓ BM25 index built with {doc_count} documents in {len(self.index.segments)} segments")
+            return doc_count
+
+        except Exception as e:
+            print(f"! Error building BM25 index: {str(e)}")
+            raise e
+
+    def search(self, query: str, k: int = 10,
               metadata_filter: Optional[Dict] = None) -> List[Tuple[Any, float]]:
         """BM25 search with detailed logging"""
         try:
             # print(f"\nBM25 Search:")
+            # Another instance (e.g. the ingestion side) may have added or deleted documents
+            self.index.refresh()
+            documents = self.index.documents
+            # Deleted documents keep their rows until a merge, only live ones count
+            live_count = self.index.live_count
             print(f"Query: {query}")
-            print(f"Index status: {'Available' if self.bm25 else 'Not initialized'}")
-            print(f"Documents: {len(self.documents)}")
+            print(f"Index status: {'Available' if live_count else 'Not initialized'}")
+            print(f"Documents: {live_count}")
 
-            if not self.bm25 or not self.documents:
+            if not live_count:
                 print("! Error: BM25 index not initialized")
                 return []
 
             # Tokenize and search
-            tokenized_query = preprocess_text(query)
+            tokenized_query = self._tokenize_query(query)
             print(f"Tokenized query: {tokenized_query}")
-            
-            scores = self.bm25.get_scores(tokenized_query)
-            print(f"Got scores for {len(scores)} documents")
-            
-            # Apply scoring and filtering
-            scored_docs = []
-            for i, score in enumerate(scores):
-                if i < len(self.documents):
-                    doc = self.documents[i]
-                    if self._matches_filter(doc, metadata_filter):
-                        scored_docs.append((doc, float(score)))
-            
-            scored_docs.sort(key=lambda x: x[1], reverse=True)
-            results = scored_docs[:k]
-            
+
+            # BM25 ignores token order, so reordered queries share an entry
+            cache_key = self._cache_key(tokenized_query, metadata_filter, k)
+            cached = self._result_cache.get(documents.generation, cache_key) if cache_key else None
+            if cached is not None:
+                doc_ids, scores = cached
+                print("Result cache hit")
+            else:
+                doc_ids, scores = self._score(tokenized_query, k, metadata_filter, documents)
+                if cache_key:
+                    self._result_cache.put(documents.generation, cache_key, (doc_ids, scores))
+
+            results = [(documents[i], float(score)) for i, score in zip(doc_ids, scores)]
+
             print(f"✓ Returning {len(results)} results")
             return results
 
@@ -92,6 +193,41 @@ class BM25Search:
             print(f"! Error during BM25 search: {str(e)}")
             return []
 
+    def _tokenize_query(self, query: str) -> Tuple[str, ...]:
+        tokens = self._token_cache.get(query)
+        if tokens is None:
+            tokens = tuple(self.index.tokenize(query))
+            self._token_cache.put(query, tokens)
+        return tokens
+
+    def _cache_key(self, tokens: Tuple[str, ...], metadata_filter: Optional[Dict],
+                   k: int) -> Optional[Hashable]:
+        """Cache key of a query, None when the filter values are not hashable"""
+        try:
+            filter_key = tuple(sorted(metadata_filter.items())) if metadata_filter else ()
+            hash(filter_key)
+        except TypeError:
+            return None
+        return tuple(sorted(tokens)), filter_key, k
+
+    def _score(self, tokens: Tuple[str, ...], k: int, metadata_filter: Optional[Dict],
+               documents) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (doc ids, scores) of a query on one index snapshot"""
+        # Indexed filter fields are resolved to candidate masks per segment,
+        # only candidate documents sharing a term with the query get a score
+        doc_ids, scores, remaining_filter = self.index.score(list(tokens), metadata_filter, documents)
+        print(f"Got scores for {len(scores)} documents")
+
+        # Fields without a metadata index are checked per scored document
+        if remaining_filter:
+            keep = np.fromiter(
+                (self._matches_filter(documents[i], remaining_filter) for i in doc_ids),
+                dtype=bool, count=len(doc_ids)
+            )
+            doc_ids, scores = doc_ids[keep], scores[keep]
+
+        return top_k(doc_ids, scores, k)
+
     def _matches_filter(self, doc: Any, metadata_filter: Optional[Dict]) -> bool:
         """Check if document matches metadata filter"""
         if not metadata_filter:
@@ -104,40 +240,64 @@ class BM25Search:
     #         print("Clearing BM25 index...")
     #         self.bm25 = None
     #         self.documents = []
-            
+
     #         if self.cache_manager:
     #             cache_cleared = self.cache_manager.clear_cache()
     #             if cache_cleared:
     #                 print("✓ BM25 index and cache cleared successfully")
     #             else:
     #                 print("! Warning: Failed to clear cache files")
-            
+
     #     except Exception as e:
     #         print(f"! Error clearing index: {str(e)}")
     def clear_cache(self) -> bool:
-        try:
-            self.client.delete("bm25_model")
-            self.client.delete("bm25_docs")
-            print("Redis cache cleared successfully")
-            return True
-        except Exception as e:
-            print(f"Error clearing Redis cache: {e}")
-            return False
+        return self.index.clear()
 
 
     def get_status(self) -> Dict[str, Any]:
         """Get current status of BM25 index"""
+        segments = self.index.segments
         return {
-            "initialized": self.bm25 is not None,
-            "document_count": len(self.documents),
-            "cache_files_exist": (
-                os.path.exists(self.cache_manager.bm25_cache_path),
-                os.path.exists(self.cache_manager.docs_cache_path)
-            )
+            "initialized": bool(segments),
+            "document_count": self.index.live_count,
+            "deleted_count": sum(s.doc_count - s.live_count for s in segments),
+            "segment_count": len(segments),
+            "segment_sizes": [s.doc_count for s in segments],
+            "index_dir": self.segment_store.root,
+            "generation": self.index.generation,
+            "result_cache": self._result_cache.stats(),
+            "term_cache": self.index.cache_stats(),
         }
     def add_documents(self, documents):
-        self.documents.extend(documents)
-        tokenized = [doc.page_content.split() for doc in self.documents]
-        self.bm25 = BM25Okapi(tokenized)
-        # Lưu lại cache để lần sau load không bị mất
-        self.cache_manager.save_bm25_cache(self.bm25, self.documents)
\ No newline at end of file
+        """Add new documents as a new segment without rebuilding the corpus
+
+        Documents already indexed unchanged under their Qdrant point are
+        skipped, so an idempotent re-ingest does not duplicate them. A point
+        whose text or metadata changed (re-chunked, renamed file) replaces
+        its old document.
+        """
+        self.index.refresh()
+        documents = [doc for doc in documents or [] if not self.index.is_indexed(doc)]
+        if not documents:
+            return
+        self.index.add_documents(documents, replace=True)
+        # Small segments are merged in the background
+        self.index.start_merging()
+
+    def can_write(self) -> bool:
+        """True if this process writes the index, other processes only read it"""
+        return self.index.acquire_writer()
+
+    def delete_points(self, point_ids: Iterable[str]) -> int:
+        """Remove the documents of the given Qdrant points, returns how many were removed"""
+        deleted = self.index.delete_points(point_ids)
+        if deleted:
+            print(f"✓ Removed {deleted} documents from BM25 index")
+        return deleted
+
+    def delete_file(self, file_name: str, keep_points: Iterable[str] = ()) -> int:
+        """Remove every document of a file except those of ``keep_points``, returns how many were removed"""
+        deleted = self.index.delete_matching({"file_name": file_name}, keep_points=keep_points)
+        if deleted or not keep_points:
+            print(f"✓ Removed {deleted} documents of {file_name} from BM25 index")
+        return deleted
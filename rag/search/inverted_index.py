@@ -0,0 +1,50 @@
+from collections import Counter
+from typing import Dict, List, Iterable
+
+
+class InvertedIndex:
+    """Incremental inverted index (term -> postings), the builder of a BM25 segment
+
+    Documents are appended with ids 0..N-1 in insertion order, so adding new
+    documents only touches their own postings and never rebuilds the corpus.
+    Scoring happens on the frozen segments (SegmentedIndex.score).
+    """
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        # Postings per term id: parallel lists of doc ids and term frequencies
+        self.postings_docs: List[List[int]] = []
+        self.postings_tfs: List[List[int]] = []
+        # Token sequence of every document as term ids, kept so merges and
+        # rebuilds never need to tokenize the same text again
+        self.doc_terms: List[List[int]] = []
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_lengths)
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = len(self.postings_docs)
+            self.vocabulary[term] = term_id
+            self.postings_docs.append([])
+            self.postings_tfs.append([])
+        return term_id
+
+    def add_documents(self, tokenized_docs: Iterable[List[str]]) -> range:
+        """Append tokenized documents, returns the range of assigned doc ids"""
+        start = self.doc_count
+        for tokens in tokenized_docs:
+            doc_id = len(self.doc_lengths)
+            term_ids = [self._term_id(term) for term in tokens]
+            for term_id, tf in Counter(term_ids).items():
+                self.postings_docs[term_id].append(doc_id)
+                self.postings_tfs[term_id].append(tf)
+            self.doc_terms.append(term_ids)
+            self.doc_lengths.append(len(tokens))
+            self.total_length += len(tokens)
+        return range(start, self.doc_count)
+
@@ -0,0 +1,58 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class MetadataIndex:
+    """Inverted metadata index (field -> value -> sorted doc ids)
+
+    Lets a metadata filter be resolved to a candidate bitmap before scoring,
+    instead of checking ``doc.metadata`` for every scored document.
+    """
+
+    def __init__(self, fields: Sequence[str] = ("type", "source", "file_name", "page")):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[Any, List[int]]] = {field: {} for field in self.fields}
+        self.doc_count = 0
+
+    def add_documents(self, documents: Iterable[Any]):
+        """Index metadata of documents appended after the current ones"""
+        for doc in documents:
+            doc_id = self.doc_count
+            metadata = getattr(doc, "metadata", None) or {}
+            for field in self.fields:
+                if field not in metadata:
+                    continue
+                try:
+                    self.postings[field].setdefault(metadata[field], []).append(doc_id)
+                except TypeError:
+                    # Unhashable values (lists, dicts) are not indexed
+                    continue
+            self.doc_count += 1
+
+    def resolve(self, metadata_filter: Optional[Dict],
+                doc_count: int) -> Tuple[Optional[np.ndarray], Dict]:
+        """Turn a filter into a candidate mask
+
+        Returns (mask, remaining) where mask is a boolean array over doc ids
+        (None when no indexed field is filtered) and remaining holds the
+        filter keys that are not indexed and must be checked per document.
+        """
+        if not metadata_filter:
+            return None, {}
+
+        mask = None
+        remaining = {}
+        for field, value in metadata_filter.items():
+            if field not in self.postings:
+                remaining[field] = value
+                continue
+            try:
+                doc_ids = self.postings[field].get(value, [])
+            except TypeError:
+                remaining[field] = value
+                continue
+            field_mask = np.zeros(doc_count, dtype=bool)
+            field_mask[np.asarray(doc_ids, dtype=np.int64)] = True
+            mask = field_mask if mask is None else mask & field_mask
+        return mask, remaining
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping with hit/miss counters"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, key: Hashable, default: Any) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._get(key, default)
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses}
+
+
+class GenerationCache(LRUCache):
+    """LRU cache holding entries of a single index generation
+
+    The index bumps its generation whenever the set of live segments changes.
+    The first lookup or insert with a newer generation drops every entry, and
+    results computed on an older snapshot are never stored.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        super().__init__(maxsize)
+        self.generation: Optional[int] = None
+
+    def _advance(self, generation: int) -> bool:
+        """Move to ``generation``, False if it is older than the cached one"""
+        if self.generation is None or generation > self.generation:
+            self._data.clear()
+            self.generation = generation
+        return generation == self.generation
+
+    def get(self, generation: int, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if not self._advance(generation):
+                self.misses += 1
+                return default
+            return self._get(key, default)
+
+    def put(self, generation: int, key: Hashable, value: Any):
+        with self._lock:
+            if self._advance(generation):
+                self._put(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "generation": self.generation}
@@ -0,0 +1,89 @@
+from itertools import chain
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .inverted_index import InvertedIndex
+
+
+class BM25Matrix:
+    """Term-document matrix in CSR layout (term frequencies per posting)
+
+    Row t holds the postings of term t: ``indices[indptr[t]:indptr[t+1]]`` are
+    doc ids and ``tfs`` the matching term frequencies, so a query only touches
+    the rows of its own terms instead of every document in the corpus.
+    BM25 weights are computed on those rows with corpus-wide statistics, which
+    lets several matrices (segments) be scored as one index.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], indptr: np.ndarray, indices: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.indices = indices
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.doc_count = len(doc_lengths)
+
+    @classmethod
+    def from_index(cls, index: InvertedIndex) -> "BM25Matrix":
+        """Freeze an InvertedIndex into CSR arrays"""
+        dfs = np.fromiter((len(p) for p in index.postings_docs), dtype=np.int64,
+                          count=len(index.postings_docs))
+        indptr = np.zeros(len(dfs) + 1, dtype=np.int64)
+        np.cumsum(dfs, out=indptr[1:])
+        total = int(indptr[-1])
+
+        indices = np.fromiter(chain.from_iterable(index.postings_docs), dtype=np.int32, count=total)
+        tfs = np.fromiter(chain.from_iterable(index.postings_tfs), dtype=np.int32, count=total)
+        doc_lengths = np.asarray(index.doc_lengths, dtype=np.int32)
+        return cls(index.vocabulary, indptr, indices, tfs, doc_lengths)
+
+    def postings(self, term: str,
+                 mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Row slice of a term as (doc_ids, tfs), restricted to ``mask`` if given"""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        doc_ids, tfs = self.indices[start:end], self.tfs[start:end]
+        if mask is not None:
+            keep = mask[doc_ids]
+            doc_ids, tfs = doc_ids[keep], tfs[keep]
+        return doc_ids, tfs
+
+
+def bm25_weights(tfs: np.ndarray, doc_lengths: np.ndarray, idf: float, avgdl: float,
+                 k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Vectorized BM25 term weight for a slice of postings"""
+    tfs = tfs.astype(np.float32)
+    norm = k1 * (1 - b + b * doc_lengths / (avgdl or 1.0))
+    return (idf * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+
+def bm25_idf(df: int, doc_count: int) -> float:
+    """BM25 idf, kept positive so it does not depend on corpus-wide averages"""
+    return float(np.log1p((doc_count - df + 0.5) / (df + 0.5)))
+
+
+def sum_postings(ids: list, weights: list) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum weights of postings sharing a doc id"""
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if len(ids) == 1:
+        return ids[0], weights[0]
+    doc_ids, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(weights))
+    return doc_ids, scores.astype(np.float32)
+
+
+def top_k(doc_ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Select the k best scores with argpartition, sorted descending"""
+    if k <= 0 or len(scores) == 0:
+        return doc_ids[:0], scores[:0]
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    order = part[np.argsort(-scores[part], kind="stable")]
+    return doc_ids[order], scores[order]
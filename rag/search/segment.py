@@ -0,0 +1,472 @@
+import copy
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import uuid
+from collections.abc import Sequence
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .inverted_index import InvertedIndex
+from .metadata_index import MetadataIndex
+from .scoring import BM25Matrix
+
+# Bump whenever the on-disk layout changes, older segments are then ignored
+SEGMENT_VERSION = 3
+
+CURRENT_FILE = "CURRENT"
+STATE_FILE = "STATE"
+LOCK_FILE = "LOCK"
+META_FILE = "meta.json"
+DOCS_FILE = "documents.bin"
+
+
+class SegmentDocuments(Sequence):
+    """Read-only list of Documents decoded lazily from a memory-mapped file"""
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self.offsets = offsets
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        record = json.loads(self.raw(i))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def raw(self, i: int) -> bytes:
+        """Encoded JSON record of a document"""
+        return self.raw_range(i, i + 1)
+
+    def raw_range(self, start: int, end: int) -> bytes:
+        """Encoded JSON records of documents start..end-1, back to back"""
+        return self._data[int(self.offsets[start]):int(self.offsets[end])]
+
+
+class Segment:
+    """Immutable BM25 index segment opened from disk with numpy memmaps
+
+    Layout of a segment directory (version 3):
+        meta.json           version, stats, tokenizer, vocabulary and metadata values
+        indptr.npy          CSR row pointers per term id
+        indices.npy         doc ids of all postings
+        tfs.npy             term frequencies of all postings
+        doc_lengths.npy     token count per doc id
+        doc_indptr.npy      CSR row pointers per doc id into doc_terms
+        doc_terms.npy       token sequence of every document as term ids
+        doc_hashes.npy      content hash per doc id, to reuse tokens on rebuild
+        point_ids.npy       doc id -> Qdrant point id
+        doc_offsets.npy     byte offsets of each document in documents.bin
+        documents.bin       JSON records (page_content, metadata)
+        meta_<field>_*.npy  metadata index as CSR (value id -> doc ids)
+
+    Arrays are opened read-only with ``mmap_mode="r"`` so every worker
+    process shares the same page cache instead of holding its own copy.
+
+    Files never change once written. Deleted documents are tombstoned in
+    the manifest instead (``deleted``) and dropped when the segment is merged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != SEGMENT_VERSION:
+            raise ValueError(f"Unsupported segment version: {meta.get('version')}")
+
+        self.doc_count = meta["doc_count"]
+        self.total_length = meta["total_length"]
+        # Corpus statistics of the live documents, set by with_deletes
+        self.live_count = self.doc_count
+        self.live_length = self.total_length
+        self.tokenizer = meta["tokenizer"]
+        self.terms: List[str] = meta["terms"]
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+
+        self.indptr = self._load("indptr")
+        self.indices = self._load("indices")
+        self.tfs = self._load("tfs")
+        self.doc_lengths = self._load("doc_lengths")
+        self.doc_indptr = self._load("doc_indptr")
+        self.doc_terms = self._load("doc_terms")
+        self.doc_hashes = self._load("doc_hashes")
+        self._hash_lookup: Optional[Dict[int, int]] = None
+        self._point_lookup: Optional[Dict[bytes, int]] = None
+        # Tombstoned doc ids as a boolean mask, None when nothing is deleted
+        self.deleted: Optional[np.ndarray] = None
+        self.point_ids = self._load("point_ids")
+        self.documents = SegmentDocuments(os.path.join(path, DOCS_FILE), self._load("doc_offsets"))
+
+        self.metadata_index = MetadataIndex(meta["metadata_fields"])
+        for field, values in meta["metadata_values"].items():
+            indptr = self._load(f"meta_{field}_indptr")
+            ids = self._load(f"meta_{field}_ids")
+            self.metadata_index.postings[field] = {
+                value: ids[indptr[i]:indptr[i + 1]] for i, value in enumerate(values)
+            }
+        self.metadata_index.doc_count = self.doc_count
+
+        self.matrix = BM25Matrix(self.vocabulary, self.indptr, self.indices, self.tfs,
+                                 self.doc_lengths)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    @property
+    def deleted_ids(self) -> List[int]:
+        return np.flatnonzero(self.deleted).tolist() if self.deleted is not None else []
+
+    def live_mask(self) -> np.ndarray:
+        return ~self.deleted if self.deleted is not None else np.ones(self.doc_count, dtype=bool)
+
+    def with_deletes(self, doc_ids: Iterable[int]) -> "Segment":
+        """Copy sharing the same arrays with exactly ``doc_ids`` tombstoned"""
+        segment = copy.copy(self)
+        deleted = np.zeros(self.doc_count, dtype=bool)
+        deleted[np.fromiter(doc_ids, dtype=np.int64)] = True
+        segment.deleted = deleted if deleted.any() else None
+        segment.live_count = self.doc_count - int(deleted.sum())
+        segment.live_length = self.total_length - int(self.doc_lengths[deleted].sum())
+        segment._point_lookup = None
+        return segment
+
+    def get_point_id(self, doc_id: int) -> Optional[str]:
+        point_id = self.point_ids[doc_id].decode("utf-8")
+        return point_id or None
+
+    def tokens(self, doc_id: int) -> List[str]:
+        """Stored token sequence of a document"""
+        start, end = self.doc_indptr[doc_id], self.doc_indptr[doc_id + 1]
+        return [self.terms[t] for t in self.doc_terms[start:end].tolist()]
+
+    def has_point(self, point_id: str) -> bool:
+        return self.find_point(point_id) is not None
+
+    def find_point(self, point_id: str) -> Optional[int]:
+        """Local doc id of the live document of a Qdrant point, if any"""
+        if self._point_lookup is None:
+            live = np.flatnonzero(self.live_mask())
+            self._point_lookup = {bytes(p): int(i) for i, p in zip(live, self.point_ids[live])}
+        return self._point_lookup.get(point_id.encode("utf-8"))
+
+    def find_by_hash(self, content_hash: int) -> Optional[int]:
+        """Local doc id of a document with the given content hash, if any"""
+        if self._hash_lookup is None:
+            # Built once per segment, segments never change after being written
+            self._hash_lookup = {int(h): i for i, h in enumerate(self.doc_hashes)}
+        return self._hash_lookup.get(content_hash)
+
+
+def _save(path: str, name: str, array: np.ndarray):
+    np.save(os.path.join(path, f"{name}.npy"), array)
+
+
+def _point_id_array(point_ids: List[bytes]) -> np.ndarray:
+    return np.array(point_ids, dtype=f"S{max(map(len, point_ids), default=1) or 1}")
+
+
+def _write_metadata(path: str, postings: Dict[str, Dict[Any, Any]]) -> Dict[str, list]:
+    metadata_values = {}
+    for field, field_postings in postings.items():
+        values = list(field_postings)
+        indptr = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(field_postings[v]) for v in values], out=indptr[1:])
+        ids = np.concatenate([np.asarray(field_postings[v], dtype=np.int32) for v in values]) \
+            if values else np.empty(0, dtype=np.int32)
+        _save(path, f"meta_{field}_indptr", indptr)
+        _save(path, f"meta_{field}_ids", ids)
+        metadata_values[field] = values
+    return metadata_values
+
+
+def _write_meta(path: str, doc_count: int, total_length: int, tokenizer: str,
+                terms: List[str], metadata_fields, metadata_values: Dict[str, list]):
+    meta = {
+        "version": SEGMENT_VERSION,
+        "doc_count": doc_count,
+        "total_length": total_length,
+        "tokenizer": tokenizer,
+        "terms": terms,
+        "metadata_fields": list(metadata_fields),
+        "metadata_values": metadata_values,
+    }
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def encode_document(doc: Any) -> bytes:
+    """JSON record of a document as stored in documents.bin"""
+    return json.dumps(
+        {"page_content": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+
+def write_segment(path: str, index: InvertedIndex, documents: List[Any],
+                  metadata_index: MetadataIndex, doc_hashes: List[int], tokenizer: str):
+    """Write an index and its documents as a segment directory"""
+    os.makedirs(path)
+    matrix = BM25Matrix.from_index(index)
+    _save(path, "indptr", matrix.indptr)
+    _save(path, "indices", matrix.indices)
+    _save(path, "tfs", matrix.tfs)
+    _save(path, "doc_lengths", matrix.doc_lengths)
+
+    doc_indptr = np.zeros(index.doc_count + 1, dtype=np.int64)
+    np.cumsum(matrix.doc_lengths, out=doc_indptr[1:])
+    _save(path, "doc_indptr", doc_indptr)
+    _save(path, "doc_terms", np.fromiter(chain.from_iterable(index.doc_terms), dtype=np.int32,
+                                         count=int(doc_indptr[-1])))
+    _save(path, "doc_hashes", np.asarray(doc_hashes, dtype=np.uint64))
+
+    # langchain-qdrant stores the point id of retrieved documents in metadata["_id"]
+    point_ids = [str(doc.metadata.get("_id") or "").encode("utf-8") for doc in documents]
+    _save(path, "point_ids", _point_id_array(point_ids))
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    with open(os.path.join(path, DOCS_FILE), "wb") as f:
+        for i, doc in enumerate(documents):
+            record = encode_document(doc)
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    _save(path, "doc_offsets", offsets)
+
+    metadata_values = _write_metadata(path, metadata_index.postings)
+    terms = sorted(index.vocabulary, key=index.vocabulary.get)
+    _write_meta(path, index.doc_count, index.total_length, tokenizer, terms,
+                metadata_index.fields, metadata_values)
+
+
+def merge_segments(path: str, segments: List[Segment]):
+    """Write adjacent segments as one segment, keeping doc order
+
+    Tombstoned documents are left out, so doc ids after the first deleted
+    document shift down.
+    """
+    os.makedirs(path)
+
+    # Old local doc id -> merged doc id (-1 for deleted documents)
+    live_masks, remaps = [], []
+    base = 0
+    for segment in segments:
+        live = segment.live_mask()
+        remap = np.full(segment.doc_count, -1, dtype=np.int64)
+        remap[live] = np.arange(base, base + int(live.sum()))
+        live_masks.append(live)
+        remaps.append(remap)
+        base += int(live.sum())
+
+    # Map every segment term onto a merged vocabulary, then stable-sort the
+    # postings by merged term id so doc ids stay ascending within each row
+    vocabulary: Dict[str, int] = {}
+    term_ids, indices, tfs, doc_terms = [], [], [], []
+    for segment, live, remap in zip(segments, live_masks, remaps):
+        local_to_merged = np.fromiter(
+            (vocabulary.setdefault(term, len(vocabulary)) for term in segment.terms),
+            dtype=np.int64, count=len(segment.terms)
+        )
+        seg_indices = np.asarray(segment.indices)
+        keep = live[seg_indices]
+        term_ids.append(np.repeat(local_to_merged, np.diff(segment.indptr))[keep])
+        indices.append(remap[seg_indices[keep]].astype(np.int32))
+        tfs.append(np.asarray(segment.tfs)[keep])
+        token_keep = np.repeat(live, np.asarray(segment.doc_lengths))
+        doc_terms.append(local_to_merged[np.asarray(segment.doc_terms)[token_keep]].astype(np.int32))
+
+    term_ids = np.concatenate(term_ids) if term_ids else np.empty(0, dtype=np.int64)
+    order = np.argsort(term_ids, kind="stable")
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=indptr[1:])
+    _save(path, "indptr", indptr)
+    _save(path, "indices", np.concatenate(indices)[order])
+    _save(path, "tfs", np.concatenate(tfs)[order])
+    doc_lengths = np.concatenate([np.asarray(s.doc_lengths)[live]
+                                  for s, live in zip(segments, live_masks)])
+    _save(path, "doc_lengths", doc_lengths)
+    doc_indptr = np.zeros(len(doc_lengths) + 1, dtype=np.int64)
+    np.cumsum(doc_lengths, out=doc_indptr[1:])
+    _save(path, "doc_indptr", doc_indptr)
+    _save(path, "doc_terms", np.concatenate(doc_terms))
+    _save(path, "doc_hashes", np.concatenate([np.asarray(s.doc_hashes)[live]
+                                              for s, live in zip(segments, live_masks)]))
+    _save(path, "point_ids", _point_id_array(
+        [bytes(p) for s, live in zip(segments, live_masks) for p in s.point_ids[live]]
+    ))
+
+    # Document records are copied as raw bytes, no decode/encode round trip
+    offsets = [np.zeros(1, dtype=np.int64)]
+    written = 0
+    with open(os.path.join(path, DOCS_FILE), "wb") as f:
+        for segment, live in zip(segments, live_masks):
+            seg_offsets = np.asarray(segment.documents.offsets, dtype=np.int64)
+            if segment.deleted is None:
+                f.write(segment.documents.raw_range(0, segment.doc_count))
+            else:
+                for doc_id in np.flatnonzero(live).tolist():
+                    f.write(segment.documents.raw(doc_id))
+            lengths = np.diff(seg_offsets)[live]
+            offsets.append(np.cumsum(lengths) + written)
+            written += int(lengths.sum())
+    _save(path, "doc_offsets", np.concatenate(offsets))
+
+    fields = segments[0].metadata_index.fields if segments else ()
+    postings: Dict[str, Dict[Any, list]] = {field: {} for field in fields}
+    for segment, remap in zip(segments, remaps):
+        for field, field_postings in segment.metadata_index.postings.items():
+            merged = postings.setdefault(field, {})
+            for value, ids in field_postings.items():
+                ids = remap[np.asarray(ids, dtype=np.int64)]
+                merged.setdefault(value, []).append(ids[ids >= 0].astype(np.int32))
+    postings = {
+        field: {value: np.concatenate(parts) for value, parts in field_postings.items()
+                if sum(map(len, parts))}
+        for field, field_postings in postings.items()
+    }
+    metadata_values = _write_metadata(path, postings)
+
+    terms = sorted(vocabulary, key=vocabulary.get)
+    _write_meta(path, base, int(doc_lengths.sum()), segments[0].tokenizer,
+                terms, fields, metadata_values)
+
+
+class SegmentStore:
+    """Directory of BM25 segments with an atomically updated manifest
+
+    CURRENT holds the ordered list of live segment names and the
+    tombstoned doc ids per segment; a new manifest is written to a
+    temporary file and swapped in with ``os.replace``. STATE holds what the
+    index was last synced with (see BM25Search.warm_start). LOCK is flocked
+    by the one process allowed to write the directory.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock_file = None
+
+    def _read_json(self, name: str, default: Any) -> Any:
+        try:
+            with open(os.path.join(self.root, name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return default
+
+    def _write_json(self, name: str, value: Any):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+
+    def read_manifest(self) -> Tuple[List[str], Dict[str, List[int]]]:
+        """(live segment names, segment name -> deleted doc ids)"""
+        manifest = self._read_json(CURRENT_FILE, [])
+        if isinstance(manifest, list):
+            # Written before deletes were supported
+            return manifest, {}
+        return manifest.get("segments", []), manifest.get("deletes", {})
+
+    def segment_names(self) -> List[str]:
+        return self.read_manifest()[0]
+
+    def manifest_version(self) -> Tuple[int, int, int]:
+        """Changes whenever a manifest is published, from a single stat
+
+        Every publish replaces CURRENT with a new file, so its inode changes
+        even when two publishes fall within one mtime tick.
+        """
+        try:
+            st = os.stat(os.path.join(self.root, CURRENT_FILE))
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return 0, 0, 0
+
+    def lock_writer(self) -> bool:
+        """Take the exclusive writer lock of the directory without waiting, True if held
+
+        The lock is released when the process exits, however it exits.
+        """
+        if self._lock_file is not None:
+            return True
+        os.makedirs(self.root, exist_ok=True)
+        lock_file = open(os.path.join(self.root, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def unlock_writer(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def new_segment_path(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f"segment_{uuid.uuid4().hex}")
+
+    def publish(self, names: List[str], deletes: Optional[Dict[str, List[int]]] = None):
+        """Atomically replace the list of live segments and their tombstones"""
+        self._write_json(CURRENT_FILE, {"segments": names, "deletes": deletes or {}})
+
+    def read_state(self) -> Dict[str, Any]:
+        return self._read_json(STATE_FILE, {})
+
+    def write_state(self, state: Dict[str, Any]):
+        self._write_json(STATE_FILE, state)
+
+    def load(self, loaded: Optional[Dict[str, Segment]] = None) -> List[Segment]:
+        """Open the live segments, reusing already ``loaded`` ones by name"""
+        loaded = loaded or {}
+        names, deletes = self.read_manifest()
+        segments = []
+        for name in names:
+            try:
+                segment = loaded.get(name) or Segment(os.path.join(self.root, name))
+                if segment.deleted_ids != deletes.get(name, []):
+                    segment = segment.with_deletes(deletes.get(name, []))
+                segments.append(segment)
+            except Exception as e:
+                print(f"Error loading BM25 segment {name}: {e}")
+                return []
+        return segments
+
+    def remove(self, names: List[str]):
+        # Processes that already mapped a segment keep their pages until they close it
+        for name in names:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def remove_unreferenced(self):
+        """Delete segment directories that are not in the manifest (failed writes, old merges)"""
+        if not os.path.isdir(self.root):
+            return
+        live = set(self.segment_names())
+        self.remove([n for n in os.listdir(self.root) if n.startswith("segment_") and n not in live])
+
+    def clear(self) -> bool:
+        try:
+            # LOCK stays, another process must not take it over while it is held
+            for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+                path = os.path.join(self.root, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif name != LOCK_FILE:
+                    os.remove(path)
+            print("BM25 segments cleared successfully")
+            return True
+        except Exception as e:
+            print(f"Error clearing BM25 segments: {e}")
+            return False
@@ -0,0 +1,516 @@
+import bisect
+import hashlib
+import json
+import math
+import threading
+from collections import Counter
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence as SequenceType, Tuple
+
+import numpy as np
+
+from .inverted_index import InvertedIndex
+from .metadata_index import MetadataIndex
+from .query_cache import GenerationCache
+from .scoring import bm25_idf, bm25_weights, sum_postings
+from .segment import Segment, SegmentStore, encode_document, merge_segments, write_segment
+from ..utils.tokenizer import DEFAULT_TOKENIZER, Tokenizer
+
+
+def content_hash(text: str) -> int:
+    """64-bit content hash used to recognise already tokenized documents"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _comparable(record: Dict[str, Any]) -> Dict[str, Any]:
+    metadata = {k: v for k, v in record["metadata"].items() if not k.startswith("_")}
+    return {"page_content": record["page_content"], "metadata": metadata}
+
+
+class SegmentedDocuments(Sequence):
+    """Documents of all live segments addressed by global doc id
+
+    Also serves as the snapshot a query runs against: ``generation`` names
+    the segment set the documents belong to.
+    """
+
+    def __init__(self, segments: Tuple[Segment, ...], bases: List[int], generation: int = 0):
+        self.segments = segments
+        self.bases = bases
+        self.generation = generation
+
+    def __len__(self) -> int:
+        return self.bases[-1] + self.segments[-1].doc_count if self.segments else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        s = bisect.bisect_right(self.bases, i) - 1
+        if s < 0 or i >= len(self):
+            raise IndexError(i)
+        return self.segments[s].documents[i - self.bases[s]]
+
+
+class ReadOnlyIndexError(RuntimeError):
+    """A write on an index whose directory is written by another process"""
+
+
+class SegmentedIndex:
+    """Log-structured BM25 index made of immutable on-disk segments
+
+    Every add_documents call writes its documents as a new small segment and
+    publishes it by swapping the segment tuple, so readers never wait on
+    writers and see new chunks as soon as the segment is written. A
+    background thread merges runs of similarly sized adjacent segments into
+    larger ones, keeping document order.
+
+    Deleting documents only tombstones them in the manifest; they are
+    left out of scoring and of the corpus statistics (N, avgdl, df) and
+    dropped for good by the next merge of their segment. Global doc ids
+    are only meaningful within one generation.
+
+    All documents and queries go through the same ``tokenizer``. Segments
+    store each document's tokens as term ids together with a content hash,
+    so a rebuild only tokenizes text that is not indexed yet.
+
+    Every change of the live segment set bumps ``generation``; per-term
+    BM25 weights are cached for the current generation only.
+
+    One process writes an index directory: the first to open (or write) it
+    takes the store's exclusive writer lock and keeps it until it exits.
+    Indexes of other processes are read-only followers that pick up each
+    published manifest in refresh(); their writes raise ReadOnlyIndexError.
+    """
+
+    def __init__(self, store: SegmentStore, metadata_fields: SequenceType[str],
+                 k1: float = 1.5, b: float = 0.75, merge_factor: int = 4,
+                 tokenizer: Optional[Tokenizer] = None, term_cache_size: int = 4096):
+        self.store = store
+        self.metadata_fields = tuple(metadata_fields)
+        self.tokenizer = tokenizer or DEFAULT_TOKENIZER
+        self.tokenizer_name = self.tokenizer.name
+        self.k1 = k1
+        self.b = b
+        self.merge_factor = merge_factor
+        # (segments, bases, generation) is replaced as a whole, readers take
+        # one snapshot per query
+        self._view: Tuple[Tuple[Segment, ...], List[int], int] = ((), [], 0)
+        # term -> (idf, per-segment (doc_ids, weights)) of the current generation
+        self._term_cache = GenerationCache(term_cache_size)
+        self._write_lock = threading.Lock()
+        self._manifest_version = (0, 0, 0)
+        self.writer = False
+        self._merge_event = threading.Event()
+        self._merge_thread: Optional[threading.Thread] = None
+
+    # ---- views -------------------------------------------------------------
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self._view[0]
+
+    @property
+    def generation(self) -> int:
+        return self._view[2]
+
+    @property
+    def doc_count(self) -> int:
+        segments, bases, _ = self._view
+        return bases[-1] + segments[-1].doc_count if segments else 0
+
+    @property
+    def live_count(self) -> int:
+        return sum(s.live_count for s in self.segments)
+
+    @property
+    def documents(self) -> SegmentedDocuments:
+        return SegmentedDocuments(*self._view)
+
+    def _set_view(self, segments: List[Segment]):
+        bases, base = [], 0
+        for segment in segments:
+            bases.append(base)
+            base += segment.doc_count
+        self._view = (tuple(segments), bases, self.generation + 1)
+
+    def _manifest(self, segments) -> Tuple[List[str], Dict[str, List[int]]]:
+        return ([s.name for s in segments],
+                {s.name: s.deleted_ids for s in segments if s.deleted is not None})
+
+    def _publish(self, segments: List[Segment]):
+        self.store.publish(*self._manifest(segments))
+        self._set_view(segments)
+
+    def _sync_with_store(self):
+        """Adopt the manifest if another instance published since our last write
+
+        Called with the write lock held, so a write never drops segments
+        published by another BM25Search on the same directory.
+        """
+        names, deletes = self.store.read_manifest()
+        if (names, deletes) == self._manifest(self.segments):
+            return
+        segments = self.store.load({s.name: s for s in self.segments})
+        if names and not segments:
+            raise RuntimeError("BM25 manifest lists segments that cannot be loaded")
+        self._set_view(segments)
+
+    def refresh(self) -> bool:
+        """Pick up segments and deletes published by another instance
+
+        Only a stat of the manifest when nothing changed, so it is cheap
+        enough to call before every query. Returns True if the view was synced.
+        """
+        version = self.store.manifest_version()
+        if version == self._manifest_version:
+            return False
+        try:
+            with self._write_lock:
+                self._sync_with_store()
+            self._manifest_version = version
+            return True
+        except Exception as e:
+            print(f"! Error refreshing BM25 segments: {e}")
+            return False
+
+    def has_point(self, point_id: str) -> bool:
+        """True if a live document of this Qdrant point is indexed"""
+        return any(s.has_point(point_id) for s in self.segments)
+
+    def point_ids(self) -> List[str]:
+        """Qdrant point id of every live document ("" when unknown), in doc id order"""
+        return [p.decode("utf-8") for s in self.segments for p in s.point_ids[s.live_mask()]]
+
+    # ---- writes ------------------------------------------------------------
+
+    def open(self) -> int:
+        """Load the live segments listed in the manifest, as writer if no other process is"""
+        with self._write_lock:
+            self.writer = self.store.lock_writer()
+            self._manifest_version = self.store.manifest_version()
+            self._set_view(self.store.load())
+            if self.writer:
+                # Only the writer creates segments, nothing unreferenced is still being written
+                self.store.remove_unreferenced()
+        self._merge_event.set()
+        return self.doc_count
+
+    def acquire_writer(self) -> bool:
+        """True if this index may write; a follower becomes the writer once the previous one exited"""
+        if not self.writer:
+            self.writer = self.store.lock_writer()
+        return self.writer
+
+    def _require_writer(self):
+        if not self.acquire_writer():
+            raise ReadOnlyIndexError(
+                f"BM25 index {self.store.root} is written by another process, this one only reads it")
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.tokenizer.tokenize(text)
+
+    def _tokenize_documents(self, documents: List[Any], hashes: List[int]) -> List[List[str]]:
+        """Tokens per document, reusing stored tokens of identical indexed text"""
+        segments = [s for s in self.segments if s.tokenizer == self.tokenizer_name]
+        tokenized: List[Optional[List[str]]] = [None] * len(documents)
+        for i, h in enumerate(hashes):
+            for segment in segments:
+                doc_id = segment.find_by_hash(h)
+                if doc_id is not None:
+                    tokenized[i] = segment.tokens(doc_id)
+                    break
+
+        # Everything not indexed yet is tokenized in one batch
+        missing = [i for i, tokens in enumerate(tokenized) if tokens is None]
+        batch = self.tokenizer.tokenize_batch(documents[i].page_content for i in missing)
+        for i, tokens in zip(missing, batch):
+            tokenized[i] = tokens
+        if len(missing) < len(documents):
+            print(f"Reused stored tokens for {len(documents) - len(missing)}/{len(documents)} documents")
+        return tokenized
+
+    def _write(self, documents: List[Any]) -> Segment:
+        hashes = [content_hash(doc.page_content) for doc in documents]
+        index = InvertedIndex()
+        index.add_documents(self._tokenize_documents(documents, hashes))
+        metadata_index = MetadataIndex(self.metadata_fields)
+        metadata_index.add_documents(documents)
+        path = self.store.new_segment_path()
+        write_segment(path, index, documents, metadata_index, hashes, self.tokenizer_name)
+        return Segment(path)
+
+    def reset(self, documents: List[Any]):
+        """Replace the whole index with a single segment"""
+        self.rebuild([documents])
+
+    def rebuild(self, batches: Iterable[List[Any]]) -> int:
+        """Replace the whole index with one segment per batch
+
+        Only one batch is in memory at a time. The old segments stay live
+        until every batch is written, a failure leaves the index untouched.
+        """
+        self._require_writer()
+        written: List[Segment] = []
+        try:
+            for documents in batches:
+                if documents:
+                    written.append(self._write(documents))
+        except Exception:
+            self.store.remove([s.name for s in written])
+            raise
+        with self._write_lock:
+            self._sync_with_store()
+            old = [s.name for s in self.segments]
+            self._publish(written)
+            self.store.remove(old)
+        self._merge_event.set()
+        return self.doc_count
+
+    def add_documents(self, documents: List[Any], replace: bool = False) -> range:
+        """Write documents as a new segment, cost depends only on the new documents
+
+        With ``replace`` the live documents of the same Qdrant points are
+        tombstoned in the same manifest update, so no query sees both.
+        """
+        self._require_writer()
+        segment = self._write(documents)
+        with self._write_lock:
+            self._sync_with_store()
+            segments, dropped = list(self.segments), []
+            if replace:
+                select = self._point_selector(str(doc.metadata.get("_id") or "") for doc in documents)
+                if select:
+                    segments, dropped, _ = self._tombstone(segments, select)
+            start = sum(s.doc_count for s in segments)
+            self._publish(segments + [segment])
+            self.store.remove(dropped)
+        self._merge_event.set()
+        return range(start, start + segment.doc_count)
+
+    def is_indexed(self, doc: Any) -> bool:
+        """True if the live document of ``doc``'s Qdrant point has the same text and metadata
+
+        Keys starting with "_" are bookkeeping added by the vector store
+        (point id, collection name) and are not compared.
+        """
+        point_id = str(doc.metadata.get("_id") or "")
+        if not point_id:
+            return False
+        for segment in self.segments:
+            doc_id = segment.find_point(point_id)
+            if doc_id is not None:
+                stored = json.loads(segment.documents.raw(doc_id))
+                return _comparable(stored) == _comparable(json.loads(encode_document(doc)))
+        return False
+
+    def _tombstone(self, segments: List[Segment], select: Callable[[Segment], np.ndarray]
+                   ) -> Tuple[List[Segment], List[str], int]:
+        """(segments with the ``select``-ed documents tombstoned, emptied segment names, count)"""
+        kept, dropped, deleted = [], [], 0
+        for segment in segments:
+            live = segment.live_mask()
+            mask = select(segment) & live
+            count = int(mask.sum())
+            if not count:
+                kept.append(segment)
+            elif count == segment.live_count:
+                dropped.append(segment.name)
+            else:
+                kept.append(segment.with_deletes(np.flatnonzero(mask | ~live).tolist()))
+            deleted += count
+        return kept, dropped, deleted
+
+    def _delete(self, select: Callable[[Segment], np.ndarray]) -> int:
+        """Tombstone the documents ``select`` marks in each segment, returns how many
+
+        Segments left without live documents are dropped right away.
+        """
+        self._require_writer()
+        with self._write_lock:
+            self._sync_with_store()
+            segments, dropped, deleted = self._tombstone(list(self.segments), select)
+            if deleted:
+                self._publish(segments)
+                self.store.remove(dropped)
+        if deleted:
+            self._merge_event.set()
+        return deleted
+
+    def _point_selector(self, point_ids: Iterable[str]) -> Optional[Callable[[Segment], np.ndarray]]:
+        wanted = np.array([p.encode("utf-8") for p in point_ids if p])
+        if not len(wanted):
+            return None
+        return lambda segment: np.isin(segment.point_ids, wanted)
+
+    def delete_points(self, point_ids: Iterable[str]) -> int:
+        """Tombstone the documents of the given Qdrant points"""
+        select = self._point_selector(point_ids)
+        return self._delete(select) if select else 0
+
+    def delete_matching(self, metadata_filter: Dict, keep_points: Iterable[str] = ()) -> int:
+        """Tombstone the documents whose metadata matches every key of the filter
+
+        Documents of the Qdrant points in ``keep_points`` are left alone.
+        """
+        if not metadata_filter:
+            raise ValueError("Refusing to delete with an empty metadata filter")
+        keep = self._point_selector(keep_points)
+
+        def select(segment: Segment) -> np.ndarray:
+            mask, remaining = segment.metadata_index.resolve(metadata_filter, segment.doc_count)
+            if mask is None:
+                mask = np.ones(segment.doc_count, dtype=bool)
+            # Fields without a metadata index are checked on the stored documents
+            for doc_id in (np.flatnonzero(mask).tolist() if remaining else []):
+                metadata = segment.documents[doc_id].metadata
+                mask[doc_id] = all(metadata.get(k) == v for k, v in remaining.items())
+            return mask & ~keep(segment) if keep else mask
+
+        return self._delete(select)
+
+    def clear(self) -> bool:
+        self._require_writer()
+        with self._write_lock:
+            self._set_view([])
+            return self.store.clear()
+
+    # ---- merging -----------------------------------------------------------
+
+    def start_merging(self, interval: float = 30.0):
+        """Start the background merge thread (idempotent, writer only)"""
+        if not self.writer or (self._merge_thread and self._merge_thread.is_alive()):
+            return
+        self._merge_thread = threading.Thread(
+            target=self._merge_loop, args=(interval,), name="bm25-segment-merger", daemon=True
+        )
+        self._merge_thread.start()
+
+    def _merge_loop(self, interval: float):
+        while True:
+            self._merge_event.wait(timeout=interval)
+            self._merge_event.clear()
+            try:
+                while self.merge_once():
+                    pass
+            except Exception as e:
+                print(f"! Error merging BM25 segments: {e}")
+
+    def _tier(self, segment: Segment) -> int:
+        return int(math.log(max(segment.doc_count, 1), self.merge_factor))
+
+    def _same_run(self, a: Segment, b: Segment) -> bool:
+        return self._tier(a) == self._tier(b) and a.tokenizer == b.tokenizer
+
+    def _find_merge(self, segments: Tuple[Segment, ...]) -> Optional[Tuple[int, int]]:
+        """First run of merge_factor adjacent segments of the same size tier"""
+        run_start = 0
+        for i in range(1, len(segments) + 1):
+            if i == len(segments) or not self._same_run(segments[i], segments[run_start]):
+                if i - run_start >= self.merge_factor:
+                    return run_start, run_start + self.merge_factor
+                run_start = i
+        return None
+
+    def merge_once(self) -> bool:
+        """Merge one run of small segments, returns False when nothing to merge"""
+        if not self.writer:
+            return False
+        found = self._find_merge(self.segments)
+        if not found:
+            return False
+        start, end = found
+        to_merge = list(self.segments[start:end])
+
+        # The expensive part runs without the lock, readers keep the old segments
+        path = self.store.new_segment_path()
+        merge_segments(path, to_merge)
+        merged = Segment(path)
+
+        with self._write_lock:
+            self._sync_with_store()
+            segments = list(self.segments)
+            # Writers only append, so the merged run is still at the same position
+            if segments[start:end] != to_merge:
+                self.store.remove([merged.name])
+                return False
+            self._publish(segments[:start] + [merged] + segments[end:])
+            self.store.remove([s.name for s in to_merge])
+        print(f"✓ Merged {len(to_merge)} BM25 segments into one with {merged.doc_count} documents")
+        return True
+
+    # ---- reads -------------------------------------------------------------
+
+    def _term_weights(self, term: str, snapshot: SegmentedDocuments,
+                      avgdl: float) -> Tuple[float, List[Tuple[np.ndarray, np.ndarray]]]:
+        """BM25 weights of every posting of ``term``, one (doc_ids, weights) per segment
+
+        Weights only depend on corpus statistics, so they are computed once
+        per generation and filters are applied on the cached slices.
+        """
+        cached = self._term_cache.get(snapshot.generation, term)
+        if cached is not None:
+            return cached
+        segments = snapshot.segments
+        # Postings of tombstoned documents count neither in df nor in the results
+        postings = [segment.matrix.postings(
+            term, ~segment.deleted if segment.deleted is not None else None) for segment in segments]
+        idf = bm25_idf(sum(len(doc_ids) for doc_ids, _ in postings),
+                       sum(s.live_count for s in segments))
+        slices = []
+        for segment, (doc_ids, tfs) in zip(segments, postings):
+            weights = bm25_weights(tfs, segment.doc_lengths[doc_ids], idf, avgdl, self.k1, self.b)
+            slices.append((doc_ids, weights))
+        self._term_cache.put(snapshot.generation, term, (idf, slices))
+        return idf, slices
+
+    def score(self, query_tokens: List[str], metadata_filter: Optional[Dict] = None,
+              snapshot: Optional[SegmentedDocuments] = None) -> Tuple[np.ndarray, np.ndarray, Dict]:
+        """BM25 scores over all segments with corpus-wide statistics
+
+        Returns (global doc ids, scores, remaining_filter) where
+        remaining_filter holds filter keys that are not metadata-indexed.
+        ``snapshot`` (from ``documents``) pins the segment set to score.
+        """
+        snapshot = snapshot if snapshot is not None else self.documents
+        segments, bases = snapshot.segments, snapshot.bases
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        remaining: Dict = {}
+        if not segments:
+            return (*empty, remaining)
+
+        doc_count = sum(s.live_count for s in segments)
+        avgdl = sum(s.live_length for s in segments) / doc_count if doc_count else 0.0
+        query_terms = Counter(query_tokens)
+        term_slices = {term: self._term_weights(term, snapshot, avgdl)[1] for term in query_terms}
+
+        all_ids, all_scores = [], []
+        for s, (segment, base) in enumerate(zip(segments, bases)):
+            mask, remaining = segment.metadata_index.resolve(metadata_filter, segment.doc_count)
+            if segment.deleted is not None:
+                mask = ~segment.deleted if mask is None else mask & ~segment.deleted
+            if mask is not None and not mask.any():
+                continue
+            ids, weights = [], []
+            for term, qtf in query_terms.items():
+                doc_ids, w = term_slices[term][s]
+                if mask is not None and len(doc_ids):
+                    keep = mask[doc_ids]
+                    doc_ids, w = doc_ids[keep], w[keep]
+                if not len(doc_ids):
+                    continue
+                ids.append(doc_ids)
+                weights.append(w * qtf if qtf > 1 else w)
+            doc_ids, scores = sum_postings(ids, weights)
+            if len(doc_ids):
+                all_ids.append(np.asarray(doc_ids, dtype=np.int64) + base)
+                all_scores.append(scores)
+
+        if not all_ids:
+            return (*empty, remaining)
+        return np.concatenate(all_ids), np.concatenate(all_scores), remaining
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self._term_cache.stats()
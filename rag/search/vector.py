@@ -1,9 +1,10 @@
-from typing import List, Tuple, Dict, Any, Optional
+from typing import Iterator, List, Tuple, Dict, Any, Optional
 from vector_store import VectorStoreManager
+from config import QDRANT_SCROLL_BATCH_SIZE
 
 class VectorSearch:
-    def __init__(self):
-        self.vector_manager = VectorStoreManager()
+    def __init__(self, vector_manager: Optional[VectorStoreManager] = None):
+        self.vector_manager = vector_manager or VectorStoreManager()
         self.vector_store = None
         self._initialize_store()
         self.documents = [] 
@@ -35,15 +36,27 @@ class VectorSearch:
             print(f"Error in vector search: {e}")
             return []
 
+    def iter_document_pages(self, batch_size: int = QDRANT_SCROLL_BATCH_SIZE) -> Iterator[List[Any]]:
+        """Stream all documents of the collection, one scroll page at a time"""
+        return self.vector_manager.scroll_documents(batch_size=batch_size)
+
+    def iter_point_id_pages(self, batch_size: int = QDRANT_SCROLL_BATCH_SIZE) -> Iterator[List[str]]:
+        """Stream all point ids of the collection, one scroll page at a time"""
+        return self.vector_manager.scroll_point_ids(batch_size=batch_size)
+
+    def iter_document_pages_by_ids(self, point_ids: List[str],
+                                   batch_size: int = QDRANT_SCROLL_BATCH_SIZE) -> Iterator[List[Any]]:
+        """Fetch the given points as documents, one page at a time"""
+        return self.vector_manager.retrieve_documents(point_ids, batch_size=batch_size)
+
+    def get_collection_marker(self) -> Optional[Dict[str, Any]]:
+        """State of the collection a BM25 snapshot is compared with, None if unavailable"""
+        return self.vector_manager.get_collection_marker()
+
     def get_all_documents(self) -> List[Any]:
         """Get all documents from vector store"""
-        if not self.vector_store:
-            return []
-            
         try:
-            collection_info = self.vector_manager.get_collection_info()
-            if collection_info and collection_info.get('points_count', 0) > 0:
-                return self.vector_store.similarity_search("", k=collection_info['points_count'])
+            return [doc for page in self.iter_document_pages() for doc in page]
         except Exception as e:
             print(f"Error getting documents: {e}")
         return []
\ No newline at end of file
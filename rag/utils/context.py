@@ -3,8 +3,12 @@ from typing import List, Dict, Any
 class ContextFormatter:
     def format_documents(self, documents: List[Any]) -> str:
         """Format documents thành context cho LLM"""
+        return "\n\n".join(self.format_parts(documents))
+
+    def format_parts(self, documents: List[Any]) -> List[str]:
+        """Context cho LLM, một phần cho mỗi document (để cắt theo token budget)"""
         if not documents:
-            return "Không tìm thấy thông tin liên quan."
+            return ["Không tìm thấy thông tin liên quan."]
         
         context_parts = []
         for i, doc in enumerate(documents, 1):
@@ -13,8 +17,7 @@ class ContextFormatter:
             context_parts.append(
                 f"[Nguồn {i}: {file_name}, trang {page}]\n{doc.page_content}"
             )
-        
-        return "\n\n".join(context_parts)
+        return context_parts
 
     # def extract_sources(self, documents: List[Any]) -> List[Dict]:
     #     """Extract thông tin nguồn từ documents"""
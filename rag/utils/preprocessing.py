@@ -1,11 +1,7 @@
-import re
-import unicodedata
 from typing import List
 
+from .tokenizer import DEFAULT_TOKENIZER
+
 def preprocess_text(text: str) -> List[str]:
     """Tiền xử lý text cho BM25"""
-    text = unicodedata.normalize('NFKC', text)
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
-    tokens = text.split()
-    return tokens
\ No newline at end of file
+    return DEFAULT_TOKENIZER.tokenize(text)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from config import BM25_TOKENIZERS
+
+# Compiled once at import, every call reuses them
+_SEPARATOR = "\ue000"  # private-use char, neither \w nor \s, marks text boundaries in a batch
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_PHRASE_SPLIT_RE = re.compile(r"[^\w\s]+|\n")
+_BATCH_PUNCT_RE = re.compile(rf"[^\w\s{_SEPARATOR}]+")
+_VIETNAMESE_LETTERS = "àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ"
+_VIETNAMESE_RE = re.compile(f"[{_VIETNAMESE_LETTERS}]")
+
+
+def _build_fold_table() -> Dict[int, Optional[str]]:
+    """Precomposed Vietnamese letter -> base letter, combining marks removed"""
+    table: Dict[int, Optional[str]] = {cp: None for cp in range(0x300, 0x370)}
+    for letter in _VIETNAMESE_LETTERS + _VIETNAMESE_LETTERS.upper():
+        base = "".join(c for c in unicodedata.normalize("NFD", letter)
+                       if not 0x300 <= ord(c) < 0x370)
+        table[ord(letter)] = base
+    table[ord("đ")], table[ord("Đ")] = "d", "D"
+    return table
+
+
+# Text is NFKC-composed before folding, so one str.translate does the job
+_FOLD_TABLE = _build_fold_table()
+
+
+class Tokenizer:
+    """Lexical tokenizer for BM25 on bilingual English/Vietnamese text
+
+    Base pipeline (same output as ``preprocess_text``): NFKC, lowercase,
+    punctuation to spaces, whitespace split. Options:
+        fold_diacritics: strip Vietnamese tone/vowel marks ("thành" -> "thanh")
+            so queries typed without diacritics still match
+        join_syllables: also emit "a_b" bigrams for adjacent syllables when
+            either one is Vietnamese, approximating compound words
+            ("thành ngữ" -> "thành", "ngữ", "thành_ngữ")
+    """
+
+    def __init__(self, fold_diacritics: bool = False, join_syllables: bool = False):
+        self.fold_diacritics = fold_diacritics
+        self.join_syllables = join_syllables
+
+    @property
+    def name(self) -> str:
+        """Identifies the token output, stored with index segments"""
+        options = [opt for opt, on in (("fold", self.fold_diacritics),
+                                         ("bigram", self.join_syllables)) if on]
+        return "vi:" + "+".join(options) if options else "default"
+
+    def __call__(self, text: str) -> List[str]:
+        return self.tokenize(text)
+
+    def _normalize(self, text: str) -> str:
+        return unicodedata.normalize("NFKC", text).lower()
+
+    def _fold(self, text: str) -> str:
+        return text.translate(_FOLD_TABLE)
+
+    def _bigrams(self, text: str) -> List[str]:
+        # Bigrams never cross punctuation or line breaks
+        bigrams = []
+        for phrase in _PHRASE_SPLIT_RE.split(text):
+            syllables = phrase.split()
+            if len(syllables) < 2:
+                continue
+            vietnamese = [not s.isascii() and _VIETNAMESE_RE.search(s) is not None
+                          for s in syllables]
+            for i in range(len(syllables) - 1):
+                if vietnamese[i] or vietnamese[i + 1]:
+                    bigrams.append(f"{syllables[i]}_{syllables[i + 1]}")
+        return bigrams
+
+    def tokenize(self, text: str) -> List[str]:
+        text = self._normalize(text)
+        stripped = _PUNCT_RE.sub(" ", text)
+        if self.fold_diacritics:
+            stripped = self._fold(stripped)
+        tokens = stripped.split()
+        if self.join_syllables:
+            bigrams = self._bigrams(text)
+            tokens += self._fold(" ".join(bigrams)).split() if self.fold_diacritics else bigrams
+        return tokens
+
+    def tokenize_batch(self, texts: Iterable[str], batch_size: int = 256) -> List[List[str]]:
+        """Tokenize many texts at once
+
+        Each block of ``batch_size`` texts is joined with a separator so
+        normalization, punctuation stripping and diacritic folding run once
+        per block instead of once per text.
+        """
+        texts = list(texts)
+        results: List[List[str]] = []
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._tokenize_block(texts[start:start + batch_size]))
+        return results
+
+    def _tokenize_block(self, texts: List[str]) -> List[List[str]]:
+        if not texts:
+            return []
+        joined = _SEPARATOR.join(texts)
+        if joined.count(_SEPARATOR) != len(texts) - 1:
+            joined = _SEPARATOR.join(t.replace(_SEPARATOR, " ") for t in texts)
+        joined = self._normalize(joined)
+
+        stripped = _BATCH_PUNCT_RE.sub(" ", joined)
+        if self.fold_diacritics:
+            stripped = self._fold(stripped)
+        tokens = [part.split() for part in stripped.split(_SEPARATOR)]
+        if not self.join_syllables:
+            return tokens
+
+        # Vietnamese detection needs the unfolded text
+        bigrams = [self._bigrams(part) for part in joined.split(_SEPARATOR)]
+        if self.fold_diacritics:
+            # Fold all bigrams of the block in one call
+            folded = self._fold(_SEPARATOR.join(" ".join(b) for b in bigrams))
+            bigrams = [part.split() for part in folded.split(_SEPARATOR)]
+        for doc_tokens, doc_bigrams in zip(tokens, bigrams):
+            doc_tokens.extend(doc_bigrams)
+        return tokens
+
+
+DEFAULT_TOKENIZER = Tokenizer()
+
+
+def get_tokenizer(collection_name: Optional[str] = None,
+                  configs: Optional[Dict[str, Dict]] = None) -> Tokenizer:
+    """Tokenizer configured for a collection (see BM25_TOKENIZERS in config)"""
+    configs = BM25_TOKENIZERS if configs is None else configs
+    options = configs.get(collection_name) if collection_name else None
+    return Tokenizer(**options) if options else DEFAULT_TOKENIZER
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
-from chat.service import ChatService
-from vector_store import VectorStoreManager
+from api_common import idioms_uploaded, job_accepted, job_result, pdf_uploaded, wants_wait
+from services import services
+from chat.history import new_session_id
 from config import PDF_FOLDER
 import os
 
@@ -8,9 +9,7 @@ import os
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
-# Initialize services
-chat_service = ChatService()
-vector_manager = VectorStoreManager()
+# Services are shared with stream_routes and built on first use (services.py)
 
 @api_bp.route("/ai", methods=["POST"])
 def ai_post():
@@ -19,7 +18,7 @@ def ai_post():
     json_content = request.json
     query = json_content.get("query", "")
     
-    response = chat_service.simple_chat(query)
+    response = services.chat_service.simple_chat(query)
     return {"answer": response}
 
 # @api_bp.route("/ask_pdf", methods=["POST"])
@@ -33,74 +32,130 @@ def ai_post():
 #     return result
 @api_bp.route("/idioms", methods=["POST"])
 def idioms_post():
-    """Upload and process idioms PDF file"""
+    """Upload an idioms PDF or CSV/TSV/JSONL file and queue its processing (?wait=true blocks until done)"""
     file = request.files.get("file")
     if not file:
         return {"error": "No file part in the request. Make sure to send 'file' as form-data."}, 400
 
     try:
-        # Process idioms directly from file object (MinIO handling is done inside process_idiom)
+        # The upload is stored now, parsing and embedding run in a background job
         source_name = request.form.get("source_name", "idioms")
-        docs_len, chunks_len, final_count = vector_manager.process_idiom(
-            file,  # Pass file object directly instead of save_file
-            source_name=source_name
-        )
+        job_id = services.ingestion_queue.submit("idiom", file, source_name=source_name)
+        if not wants_wait(request.args.get("wait")):
+            return job_accepted(job_id, file.filename)
 
-        return {
-            "status": "Successfully Uploaded",
-            "filename": file.filename,
-            "source": source_name,
-            "docs": docs_len,
-            "chunks": chunks_len,
-            "final_count": final_count,
-        }
+        result = job_result(services.ingestion_queue.wait(job_id))
+        return idioms_uploaded(file.filename, source_name, result)
 
     except Exception as e:
         return {"error": f"Failed to process idioms: {str(e)}"}, 500
 
 @api_bp.route("/pdf", methods=["POST"])
 def pdf_post():
-    """Upload and process PDF file"""
+    """Upload a PDF file and queue its processing (?wait=true blocks until done)"""
     file = request.files.get("file")
     if not file:
         return {"error": "No file part in the request"}, 400
 
     try:
-        # Process PDF directly from file object
-        doc_len, chunks_len = vector_manager.process_pdf(file)
-        
-        return {
-            "status": "Successfully Uploaded",
-            "filename": file.filename,
-            "doc_len": doc_len,
-            "chunks": chunks_len,
-        }
+        job_id = services.ingestion_queue.submit("pdf", file)
+        if not wants_wait(request.args.get("wait")):
+            return job_accepted(job_id, file.filename)
+
+        result = job_result(services.ingestion_queue.wait(job_id))
+        return pdf_uploaded(file.filename, result)
     except Exception as e:
         return {"error": f"Failed to process PDF: {str(e)}"}, 500
 
+@api_bp.route("/files", methods=["GET"])
+def list_files():
+    """Indexed files with their chunk counts"""
+    try:
+        return {"files": services.vector_manager.list_files()}
+    except Exception as e:
+        return {"error": f"Failed to list files: {str(e)}"}, 500
+
+@api_bp.route("/files/<path:filename>", methods=["DELETE"])
+def delete_file(filename):
+    """Remove one file from Qdrant, BM25 and storage"""
+    try:
+        result = services.vector_manager.delete_file(filename)
+        if not result["points_deleted"] and not result["bm25_deleted"]:
+            return {"error": f"File {filename} is not indexed", **result}, 404
+        return {"status": "Deleted", **result}
+    except Exception as e:
+        return {"error": f"Failed to delete file: {str(e)}"}, 500
+
+@api_bp.route("/files/<path:filename>", methods=["PUT"])
+def replace_file(filename):
+    """Upload a new version of a file; chunks of the old version are removed once it is indexed"""
+    file = request.files.get("file")
+    if not file:
+        return {"error": "No file part in the request"}, 400
+
+    try:
+        kind = request.form.get("type", "pdf")
+        params = {"source_name": request.form.get("source_name", "idioms")} if kind == "idiom" else {}
+        job_id = services.ingestion_queue.submit(kind, file, filename=filename, **params)
+        if not wants_wait(request.args.get("wait")):
+            return job_accepted(job_id, filename)
+
+        result = job_result(services.ingestion_queue.wait(job_id))
+        return {"status": "Replaced", "filename": filename, **result}
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return {"error": f"Failed to replace file: {str(e)}"}, 500
+
+@api_bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Recent ingestion jobs"""
+    limit = request.args.get("limit", 50, type=int)
+    return {"jobs": services.ingestion_queue.store.list(limit)}
+
+@api_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status, progress and result of an ingestion job"""
+    job = services.ingestion_queue.store.get(job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    return job
+
 @api_bp.route("/clear_history", methods=["POST"])
 def clear_history():
-    """Clear chat history"""
-    chat_service.clear_history()
-    return {"status": "Chat history cleared"}
+    """Clear the chat history of one session"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get("session_id")
+    if not session_id:
+        return {"error": "session_id is required"}, 400
+    services.chat_service.clear_history(session_id)
+    return {"status": "Chat history cleared", "session_id": session_id}
 
 @api_bp.route("/health", methods=["GET"])
 def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving requests"""
     return {"status": "healthy"}
 
+@api_bp.route("/ready", methods=["GET"])
+def readiness_check():
+    """Readiness: models and indexes are loaded, 503 while warming up or after a failed warm-up"""
+    state = services.readiness()
+    if not state["ready"]:
+        return {"status": "failed" if state["error"] else "warming_up", **state}, 503
+    return {"status": "ready", **state}
+
 @api_bp.route("/debug/vectorstore", methods=["GET"])
 def debug_vectorstore():
     """Debug vector store information"""
     try:
         # Lấy thông tin collection
-        collection_info = vector_manager.get_collection_info()
+        collection_info = services.vector_manager.get_collection_info()
         if not collection_info:
             return {"status": "error", "error": "Cannot get collection info"}, 500
 
         # Lấy sample metadata từ Qdrant
-        points, _ = vector_manager.client.scroll(
-            collection_name=vector_manager.collection_name,
+        points, _ = services.vector_manager.client.scroll(
+            collection_name=services.vector_manager.collection_name,
             limit=5
         )
         sample_payloads = [p.payload for p in points]
@@ -124,8 +179,8 @@ def debug_search():
     query = json_content.get("query", "test")
     
     try:
-        vector_store = vector_manager.load_vector_store()
-        retriever = vector_manager.get_retriever(vector_store)
+        vector_store = services.vector_manager.load_vector_store()
+        retriever = services.vector_manager.get_retriever(vector_store)
         
         results = retriever.get_relevant_documents(query)
         
@@ -149,7 +204,7 @@ def debug_search():
 def reset_collection():
     """Reset collection (xóa và tạo lại)"""
     try:
-        vector_manager.delete_collection()
+        services.vector_manager.delete_collection()
         return {"status": "success", "message": "Collection reset successfully"}
     except Exception as e:
         return {"status": "error", "error": str(e)}, 500
@@ -182,16 +237,19 @@ def chat():
     data = request.get_json()
     query = data.get("query", "")
     search_type = data.get("search_type", "hybrid")  # default to hybrid
+    session_id = data.get("session_id") or new_session_id()
     
-    result = chat_service.chat_with_history(
+    result = services.chat_service.chat_with_history(
         query=query,
         search_type=search_type,
         k=data.get("k"),
         alpha=data.get("alpha", 0.5),
         metadata_filter=data.get("metadata_filter"),
-        use_rerank=data.get("use_rerank", True)
+        use_rerank=data.get("use_rerank", True),
+        session_id=session_id
     )
-    return result
+    # The client sends it back to continue the conversation
+    return {**result, "session_id": session_id}
 
 # @api_bp.route("/clear_indexes", methods=["POST"])
 # def clear_indexes():
@@ -204,8 +262,8 @@ def chat():
 @api_bp.route("/clear_indexes", methods=["POST"])
 def clear_indexes():
     """Clear search indexes and caches"""
-    success = chat_service.rag_handler.clear_search_indexes()
-    if success:
+    result = services.chat_service.rag_handler.clear_search_indexes()
+    if result["status"] == "success":
         return jsonify({"status": "success", "message": "Indexes and caches cleared"}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to clear indexes/caches"}), 500
@@ -0,0 +1,183 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import QDRANT_HOST, QDRANT_PORT
+
+
+class ServiceContainer:
+    """Process-wide services, each built on first use and shared by every blueprint
+
+    Blueprints, the chat service, the RAG handler and the ingestion queue
+    all get their clients and models from here, so the process holds one
+    Qdrant client, one MinIO client, one embedding client, one reranker and
+    one BM25 index instead of a copy per consumer. ``build_seconds`` records
+    how long each service took to build (including services it pulled in).
+
+    Nothing heavy is imported until a service is built. ``warm_up`` builds
+    everything in a background thread so the server can bind its port
+    right away; ``ready`` flips once it completed.
+    """
+
+    def __init__(self):
+        # Re-entrant: building a service builds its dependencies first
+        self._lock = threading.RLock()
+        self._instances: Dict[str, Any] = {}
+        self.build_seconds: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._warm_up_thread: Optional[threading.Thread] = None
+        self.warm_up_error: Optional[str] = None
+        self.warm_up_seconds: Optional[float] = None
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = factory()
+                    self.build_seconds[name] = time.perf_counter() - start
+                    self._instances[name] = instance
+                    print(f"✓ Built {name} in {self.build_seconds[name]:.2f}s")
+        return instance
+
+    def start(self):
+        """Start background workers: resumes ingestion jobs left unfinished by the previous process"""
+        self.ingestion_queue
+
+    def warm_up(self, background: bool = True):
+        """Build every service and load the models (idempotent while running or done)"""
+        with self._lock:
+            if self._ready.is_set() or (self._warm_up_thread and self._warm_up_thread.is_alive()):
+                return
+            self.warm_up_error = None
+            self._warm_up_thread = threading.Thread(target=self._warm_up, name="services-warm-up",
+                                                    daemon=True)
+        if background:
+            self._warm_up_thread.start()
+        else:
+            self._warm_up_thread.run()
+
+    def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            self.start()
+            self.chat_service
+            self.reranker.warm_up()
+            self.warm_up_seconds = time.perf_counter() - start
+            self._ready.set()
+            print(f"✓ Services ready in {self.warm_up_seconds:.2f}s")
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"! Service warm-up failed: {e}")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def readiness(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warm_up_seconds": self.warm_up_seconds,
+            "error": self.warm_up_error,
+            "built": self.built(),
+        }
+
+    def built(self) -> Dict[str, float]:
+        """Services built so far with their build time in seconds"""
+        return dict(self.build_seconds)
+
+    # ---- clients -----------------------------------------------------------
+
+    @property
+    def qdrant_client(self):
+        def build():
+            from qdrant_client import QdrantClient
+            return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+        return self._get("qdrant_client", build)
+
+    @property
+    def storage(self):
+        def build():
+            from storage.minio_client import MinioClient
+            return MinioClient()
+        return self._get("storage", build)
+
+    @property
+    def embeddings(self):
+        def build():
+            from models import get_embeddings
+            return get_embeddings()
+        return self._get("embeddings", build)
+
+    @property
+    def llm(self):
+        def build():
+            from models import get_llm
+            return get_llm()
+        return self._get("llm", build)
+
+    # ---- search ------------------------------------------------------------
+
+    @property
+    def bm25_search(self):
+        def build():
+            from rag.search.bm25 import BM25Search
+            return BM25Search()
+        return self._get("bm25_search", build)
+
+    @property
+    def vector_manager(self):
+        def build():
+            from vector_store import VectorStoreManager
+            return VectorStoreManager(client=self.qdrant_client, storage=self.storage,
+                                      embedding=self.embeddings, bm25_search=self.bm25_search)
+        return self._get("vector_manager", build)
+
+    @property
+    def reranker(self):
+        def build():
+            from rag.retrieval.reranker import CrossEncoderReranker
+            return CrossEncoderReranker()
+        return self._get("reranker", build)
+
+    @property
+    def rag_handler(self):
+        def build():
+            from rag.handler import RAGHandler
+            from rag.retrieval.retriever import DocumentRetriever
+            from rag.search.vector import VectorSearch
+            return RAGHandler(vector_search=VectorSearch(self.vector_manager),
+                              bm25_search=self.bm25_search, reranker=self.reranker,
+                              retriever=DocumentRetriever(self.llm))
+        return self._get("rag_handler", build)
+
+    # ---- application -------------------------------------------------------
+
+    @property
+    def chat_service(self):
+        def build():
+            from chat.service import ChatService
+            return ChatService(vector_manager=self.vector_manager,
+                               rag_handler=self.rag_handler, llm=self.llm)
+        return self._get("chat_service", build)
+
+    @property
+    def job_store(self):
+        def build():
+            from ingestion.jobs import JobStore
+            return JobStore()
+        return self._get("job_store", build)
+
+    @property
+    def ingestion_queue(self):
+        def build():
+            from ingestion.jobs import IngestionQueue
+            queue = IngestionQueue(self.vector_manager, store=self.job_store)
+            queue.start()
+            return queue
+        return self._get("ingestion_queue", build)
+
+
+services = ServiceContainer()
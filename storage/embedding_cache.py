@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """NFC and collapsed whitespace, so trivially different copies share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store in SQLite
+
+    Rows are keyed by (model name, SHA-256 of the normalized text) and hold
+    the vector as a float32 blob. When the cache grows past ``max_entries``
+    the least recently used rows are evicted down to 90% of the limit.
+    One connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL, PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, model: str, keys: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """Cached vectors of the given keys, missing keys are left out"""
+        found: Dict[bytes, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})", [model, *chunk]
+                ).fetchall()
+                for key, blob in rows:
+                    found[bytes(key)] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[bytes, Sequence[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for key, vector in items.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict(self.max_entries * 9 // 10)
+            self._conn.commit()
+
+    def _evict(self, target: int):
+        excess = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, key) IN ("
+            " SELECT model, key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        print(f"Evicted {excess} embeddings from cache")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": self._count, "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that consults an EmbeddingCache before calling the model
+
+    Used for both ingestion (embed_documents) and retrieval (embed_query).
+    Cache hits and misses return the same float32-rounded values.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(text) for text in texts]
+        found = self.cache.get_many(self.model, keys)
+
+        # Embed each missing text once, even if repeated within the batch
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = {key: np.asarray(vector, dtype=np.float32).tolist()
+                        for key, vector in zip(missing, vectors)}
+            self.cache.put_many(self.model, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(text)
+        found = self.cache.get_many(self.model, [key])
+        if key in found:
+            return found[key]
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32).tolist()
+        self.cache.put_many(self.model, {key: vector})
+        return vector
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str, max_entries: int = 200_000) -> EmbeddingCache:
+    """One EmbeddingCache per file in the process"""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = EmbeddingCache(path, max_entries)
+        return cache
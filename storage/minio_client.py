@@ -49,6 +49,25 @@ class MinioClient:
             print(f"Error uploading file: {e}")
             return False
 
+    def upload_stream(self, stream: BinaryIO, filename: str, length: int = -1,
+                      content_type: str = 'application/pdf') -> bool:
+        """Upload from a forward-only stream, reading it exactly once"""
+        try:
+            self.client.put_object(
+                bucket_name=self.bucket_name,
+                object_name=filename,
+                data=stream,
+                length=length,
+                # Unknown length needs a multipart upload
+                part_size=10 * 1024 * 1024 if length < 0 else 0,
+                content_type=content_type
+            )
+            print(f"File {filename} uploaded successfully")
+            return True
+        except S3Error as e:
+            print(f"Error uploading file: {e}")
+            return False
+
     def get_file(self, filename: str) -> Optional[bytes]:
         """Get a file from MinIO"""
         try:
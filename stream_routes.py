@@ -1,16 +1,12 @@
 from flask import Blueprint, Response, request, stream_with_context
-import json
+import time
 
-from chat.service import ChatService
-from vector_store import VectorStoreManager
+from api_common import job_events as poll_job_events, sse_format
+from services import services
+from chat.history import new_session_id
+from config import INGEST_EVENTS_POLL_INTERVAL
 
-vector_manager = VectorStoreManager()
 stream_bp = Blueprint("stream", __name__)
-chat_service = ChatService()
-
-def sse_format(data: dict):
-    """Format data as SSE event"""
-    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 @stream_bp.route("/chat_stream", methods=["POST"])
 def chat_stream():
@@ -23,20 +19,22 @@ def chat_stream():
     alpha = data.get("alpha", 0.5)
     metadata_filter = data.get("metadata_filter")
     use_rerank = data.get("use_rerank", True)
+    session_id = data.get("session_id") or new_session_id()
 
     def generate():
         try:
             # Gửi event bắt đầu
-            yield sse_format({"event": "start", "msg": "stream_start"})
+            yield sse_format({"event": "start", "msg": "stream_start", "session_id": session_id})
 
             # ChatService cần có hàm stream
-            for chunk in chat_service.chat_with_history_stream(
+            for chunk in services.chat_service.chat_with_history_stream(
                 query=query,
                 search_type=search_type,
                 k=k,
                 alpha=alpha,
                 metadata_filter=metadata_filter,
-                use_rerank=use_rerank
+                use_rerank=use_rerank,
+                session_id=session_id
             ):
                 # print(f"[DEBUG] stream chunk: {chunk}", flush=True)
                 yield sse_format({"text": chunk})
@@ -47,6 +45,22 @@ def chat_stream():
             yield sse_format({"event": "error", "msg": str(e)})
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
+@stream_bp.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Progress of an ingestion job as server-sent events, ends when the job finishes"""
+
+    def generate():
+        seq = None
+        while True:
+            events, seq, ended = poll_job_events(job_id, seq)
+            for event in events:
+                yield sse_format(event)
+            if ended:
+                return
+            time.sleep(INGEST_EVENTS_POLL_INTERVAL)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
 # @stream_bp.route("/idioms_stream", methods=["POST"])
 # def idioms_stream():
 #     file = request.files.get("file")
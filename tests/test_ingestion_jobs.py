@@ -0,0 +1,32 @@
+import threading
+import time
+
+from ingestion.jobs import DONE, QUEUED, IngestionQueue, JobStore
+
+
+class FakeVectorManager:
+    def can_write_index(self):
+        return True
+
+
+def test_wait_follows_a_job_whose_claim_was_lost(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    ingestion_queue = IngestionQueue(FakeVectorManager(), store=store, workers=0)
+    job_id = store.create("pdf", "a.pdf", owner=ingestion_queue.owner)
+    ingestion_queue._enqueue(job_id)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(ingestion_queue.wait(job_id, timeout=10)))
+    waiter.start()
+    time.sleep(0.2)
+
+    # Another process takes the job over before the local worker claims it
+    assert store.take_over(store.get(job_id), "other-host:1:abcdef01")
+    ingestion_queue._run(job_id)
+    assert store.get(job_id)["status"] == QUEUED
+
+    time.sleep(0.3)
+    store.update(job_id, status=DONE, result={"chunks": 3})
+    waiter.join(timeout=10)
+    assert results[0]["status"] == DONE
+    assert results[0]["result"] == {"chunks": 3}
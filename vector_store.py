@@ -1,35 +1,42 @@
-from langchain_qdrant import QdrantVectorStore
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pypdf import PdfReader
-from typing import List
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
-import mlflow
-from langchain.schema import Document
+from qdrant_client.models import (
+    Distance, FieldCondition, Filter, FilterSelector, HasIdCondition, MatchValue, PayloadSchemaType,
+    PointIdsList, VectorParams
+)
+from langchain_core.documents import Document
 
-from models import get_embeddings, get_text_splitter
+from models import get_embeddings
 from config import (
     QDRANT_HOST, 
     QDRANT_PORT,
-    QDRANT_COLLECTION_NAME
+    QDRANT_COLLECTION_NAME,
+    QDRANT_SCROLL_BATCH_SIZE
 )
 import os
 from rag.search.bm25 import BM25Search
+from rag.search.segmented_index import ReadOnlyIndexError
+from ingestion.chunking import build_chunker
+from ingestion.embedding_pipeline import EmbeddingPipeline, chunk_point_id
+from ingestion.idiom_import import idiom_document, idiom_table_format, iter_idiom_rows
+from ingestion.pdf_extraction import extract_pages
+from ingestion.upload import SpooledUpload, TeeReader, stream_length
 from storage.minio_client import MinioClient
 import io
-import tempfile
+import mimetypes
 
 class VectorStoreManager:
-    def __init__(self):
-        self.embedding = get_embeddings()
-        self.text_splitter = get_text_splitter()
-        self.client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    def __init__(self, client: Optional[QdrantClient] = None, storage: Optional[MinioClient] = None,
+                 embedding=None, bm25_search: Optional[BM25Search] = None):
+        """Dependencies not passed in are created here (see services.py for shared ones)"""
+        self.embedding = embedding or get_embeddings()
+        self.client = client or QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
         self.collection_name = QDRANT_COLLECTION_NAME
-        self.storage = MinioClient()
+        self.storage = storage or MinioClient()
         self._ensure_collection_exists()
-        self.bm25_search = BM25Search() 
-        self.documents = []
+        self.embedding_pipeline = EmbeddingPipeline(self.embedding, self.client, self.collection_name)
+        self.bm25_search = bm25_search or BM25Search()
     
     def _ensure_collection_exists(self):
         """Tạo collection nếu chưa tồn tại"""
@@ -53,6 +60,14 @@ class VectorStoreManager:
                 print(f"Collection created with vector size: {vector_size}")
             else:
                 print(f"Collection {self.collection_name} already exists")
+
+            # Chunks are looked up by file for re-ingest and deletion
+            for field in ("metadata.file_name", "metadata.file_hash"):
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field,
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
                 
         except Exception as e:
             print(f"Error ensuring collection exists: {e}")
@@ -60,6 +75,8 @@ class VectorStoreManager:
     
     def load_vector_store(self):
         """Load existing vector store"""
+        # langchain-qdrant is only needed for similarity search, not for ingestion
+        from langchain_qdrant import QdrantVectorStore
         # print("Loading Qdrant vector store...")
         try:
             vector_store = QdrantVectorStore.from_existing_collection(
@@ -89,153 +106,94 @@ class VectorStoreManager:
             )
             return vector_store
     
-    # def process_pdf(self, file):
-    #     """Process PDF file from upload"""
-    #     try:
-    #         # Upload to MinIO first
-    #         filename = file.filename
-    #         if not self.storage.upload_file(file, filename):
-    #             raise Exception("Failed to upload file to storage")
-
-    #         # Get file from MinIO for processing
-    #         pdf_content = self.storage.get_file(filename)
-    #         if not pdf_content:
-    #             raise Exception("Failed to retrieve file from storage")
-
-    #         # Create a temporary file for PDFPlumber
-    #         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-    #             temp_file.write(pdf_content)
-    #             temp_path = temp_file.name
-
-    #         try:
-    #             # Process with PDFPlumberLoader using temp file
-    #             loader = PDFPlumberLoader(temp_path)
-    #             docs = loader.load()
-    #             print(f"Initial docs len={len(docs)}")
-
-    #             if len(docs) == 0:
-    #                 raise ValueError("No documents found in PDF")
-
-    #             # Split into chunks
-    #             chunks = self.text_splitter.split_documents(docs)
-    #             print(f"Chunks len={len(chunks)}")
-
-    #             if len(chunks) == 0:
-    #                 raise ValueError("No chunks created from documents")
-
-    #             # Add metadata
-    #             for i, chunk in enumerate(chunks):
-    #                 chunk.metadata.update({
-    #                     "file_name": filename,
-    #                     "chunk": i + 1,
-    #                     "type": "pdf"
-    #                 })
-
-    #             # Add to vector store
-    #             vector_store = self.load_vector_store()
-    #             vector_store.add_documents(chunks)
-    #             print(f"Added {len(chunks)} chunks to vector store")
-
-    #             return len(docs), len(chunks)
-
-    #         finally:
-    #             # Clean up temp file
-    #             os.unlink(temp_path)
-    #             print("Temporary file cleaned up")
-
-    #     except Exception as e:
-    #         print(f"Error processing PDF: {e}")
-    #         raise e
-
-
-    def process_pdf(self, file):
+    def receive_upload(self, file, filename: Optional[str] = None) -> SpooledUpload:
+        """Tee the incoming upload into MinIO (as ``filename``) and a local spooled buffer"""
+        upload = SpooledUpload()
+        filename = filename or file.filename
         try:
-            filename = file.filename
-            if not self.storage.upload_file(file, filename):
+            tee = TeeReader(file, upload)
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            if not self.storage.upload_stream(tee, filename, length=stream_length(file),
+                                              content_type=content_type):
                 raise Exception("Failed to upload file to storage")
+            tee.drain()
+            return upload
+        except Exception:
+            upload.close()
+            raise
 
-            pdf_content = self.storage.get_file(filename)
-            if not pdf_content:
-                raise Exception("Failed to retrieve file from storage")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_content)
-                temp_path = temp_file.name
-
-            try:
-                reader = PdfReader(temp_path)
-                docs = []
-                for i, page in enumerate(reader.pages):
-                    text = page.extract_text()
-                    if text and text.strip():
-                        docs.append({
-                            "page_content": text,
-                            "metadata": {
-                                "file_name": filename,
-                                "page": i + 1,
-                                "type": "pdf"
-                            }
-                        })
-
-                print(f"Initial docs len={len(docs)}")
-                if len(docs) == 0:
-                    raise ValueError("No text extracted from PDF")
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1200,
-                    chunk_overlap=150,
-                    separators=["\n\n", "\n", " ", ""]
-                )
+    def can_write_index(self) -> bool:
+        """Ingestion writes the BM25 index, which only one process may do"""
+        return self.bm25_search.can_write()
 
-                chunks = []
-                for doc in docs:
-                    content = doc["page_content"]
-
-                    # Heuristic: bảng
-                    if content.count("|") > 5 or "\t" in content:
-                        for line in content.splitlines():
-                            if line.strip():
-                                chunks.append(
-                                    Document(
-                                        page_content=line.strip(),
-                                        metadata={**doc["metadata"]}
-                                    )
-                                )
-                    else:
-                        split_docs = text_splitter.create_documents(
-                            [content], metadatas=[doc["metadata"]]
-                        )
-                        chunks.extend(split_docs)
-
-                print(f"Chunks len={len(chunks)}")
-                if len(chunks) == 0:
-                    raise ValueError("No chunks created from documents")
-
-                for i, chunk in enumerate(chunks):
-                    chunk.metadata.update({"chunk": i + 1})
-
-                vector_store = self.load_vector_store()
-                vector_store.add_documents(chunks)
-                print(f"Added {len(chunks)} chunks to vector store")
-
-                return len(docs), len(chunks)
-
-            finally:
-                os.unlink(temp_path)
-                print("Temporary file cleaned up")
+    def _report(self, progress: Optional[Callable[[dict], None]], **event):
+        if progress:
+            progress(event)
 
+    def process_pdf(self, file):
+        try:
+            # One pass over the upload: stored in MinIO and kept locally for parsing
+            with self.receive_upload(file) as upload:
+                return self.ingest_pdf(upload, file.filename)
         except Exception as e:
             print(f"Error processing PDF: {e}")
             raise e
-        
+
+    def ingest_pdf(self, upload: SpooledUpload, filename: str,
+                   progress: Optional[Callable[[dict], None]] = None):
+        """Extract, chunk, embed and index a received PDF, returns (pages, chunks)
+
+        The chunk size histogram is reported with the "chunk" progress event.
+        """
+        # Table rows stay grouped and tiny fragments are merged, sized in
+        # embedding tokens or characters depending on CHUNK_LENGTH_UNIT
+        chunker = build_chunker()
+
+        # Pages are extracted in parallel and split as they arrive, in order
+        page_count = 0
+        chunks = []
+        for page_num, text in extract_pages(upload.source):
+            self._report(progress, stage="extract", page=page_num)
+            if not (text and text.strip()):
+                continue
+            page_count += 1
+            chunks.extend(chunker.chunk_page(text, {
+                "file_name": filename,
+                "page": page_num,
+                "type": "pdf"
+            }))
+
+        print(f"Initial docs len={page_count}")
+        if page_count == 0:
+            raise ValueError("No text extracted from PDF")
+
+        print(f"Chunks len={len(chunks)}, sizes={chunker.stats.to_dict()['histogram']}")
+        if len(chunks) == 0:
+            raise ValueError("No chunks created from documents")
+        self._report(progress, stage="chunk", stats=chunker.stats.to_dict())
+
+        for i, chunk in enumerate(chunks):
+            chunk.metadata.update({"chunk": i + 1})
+
+        self._assign_point_ids(chunks, filename, upload.sha256)
+        with self.index_write():
+            self.add_documents(chunks, progress=progress)
+            self.remove_stale_chunks(filename, [chunk.metadata["_id"] for chunk in chunks])
+
+        return page_count, len(chunks)
+
     def delete_collection(self):
-        """Xóa collection (để reset dữ liệu)"""
-        try:
+        """Xóa collection và BM25 index (để reset dữ liệu)
+
+        The BM25 segments, manifest and snapshot marker go too, otherwise
+        the index would keep serving documents Qdrant no longer has.
+        """
+        with self.index_write():
             self.client.delete_collection(self.collection_name)
             print(f"Collection {self.collection_name} deleted")
             self._ensure_collection_exists()
-        except Exception as e:
-            print(f"Error deleting collection: {e}")
+            if not self.bm25_search.clear_cache():
+                raise RuntimeError("Could not clear the BM25 index")
     
     def get_collection_info(self):
         """Lấy thông tin về collection"""
@@ -251,14 +209,170 @@ class VectorStoreManager:
             print(f"Error getting collection info: {e}")
             return None
     
-    def add_documents(self, documents):
+    def get_collection_marker(self) -> Optional[Dict[str, Any]]:
+        """State of the collection a BM25 snapshot is compared with, None if unavailable"""
+        info = self.get_collection_info()
+        if not info:
+            return None
+        return {"collection": info["name"], "points_count": info["points_count"]}
+
+    @contextmanager
+    def index_write(self):
+        """Wraps a change of Qdrant and BM25 so the BM25 snapshot marker stays truthful
+
+        The marker is dropped first and saved for the new collection state
+        once both are updated. Refused up front in a process that does not
+        write the BM25 index, before Qdrant is touched.
+        """
+        if not self.can_write_index():
+            raise ReadOnlyIndexError("BM25 index is written by another process, retry there")
+        self.bm25_search.invalidate_snapshot_marker()
+        yield
+        self.bm25_search.save_snapshot_marker(self.get_collection_marker())
+
+    def _point_to_document(self, point) -> Document:
+        """Same Document layout as QdrantVectorStore search results"""
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=payload.get("page_content") or "", metadata=metadata)
+
+    def scroll_documents(self, batch_size: int = QDRANT_SCROLL_BATCH_SIZE,
+                         scroll_filter: Optional[Filter] = None) -> Iterator[List[Document]]:
+        """Stream the collection page by page with scroll (payload only, no vectors)
+
+        Only one page of points is held in memory at a time. Errors are
+        raised so callers never mistake a partial corpus for the full one.
+        """
+        for points in self._scroll(batch_size, scroll_filter, with_payload=True):
+            yield [self._point_to_document(point) for point in points]
+
+    def scroll_point_ids(self, batch_size: int = QDRANT_SCROLL_BATCH_SIZE,
+                         scroll_filter: Optional[Filter] = None) -> Iterator[List[str]]:
+        """Stream only the point ids of the collection, page by page"""
+        for points in self._scroll(batch_size, scroll_filter, with_payload=False):
+            yield [str(point.id) for point in points]
+
+    def retrieve_documents(self, point_ids: List[str],
+                           batch_size: int = QDRANT_SCROLL_BATCH_SIZE) -> Iterator[List[Document]]:
+        """Fetch the given points as Documents, ``batch_size`` points per request"""
+        for start in range(0, len(point_ids), batch_size):
+            points = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids[start:start + batch_size],
+                with_payload=True,
+                with_vectors=False,
+            )
+            yield [self._point_to_document(point) for point in points]
+
+    def _scroll(self, batch_size: int, scroll_filter: Optional[Filter],
+                with_payload: Union[bool, List[str]]):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=False,
+            )
+            if points:
+                yield points
+            if offset is None:
+                break
+
+    def _assign_point_ids(self, documents: List[Document], filename: str, file_hash: str):
+        """Point ids from (file name, content hash, chunk index): re-ingesting a file upserts the same points"""
+        for i, doc in enumerate(documents):
+            doc.metadata["file_hash"] = file_hash
+            doc.metadata["_id"] = chunk_point_id(filename, file_hash, i)
+
+    def _file_filter(self, filename: str) -> Filter:
+        return Filter(must=[FieldCondition(key="metadata.file_name", match=MatchValue(value=filename))])
+
+    def remove_stale_chunks(self, filename: str, point_ids: List[str]) -> List[str]:
+        """Delete points of ``filename`` other than the ``point_ids`` just upserted, returns their ids
+
+        Covers chunks of an older version of the file as well as trailing
+        chunks of the same content when it now splits into fewer chunks.
+        """
+        stale_filter = self._file_filter(filename)
+        stale_filter.must_not = [HasIdCondition(has_id=point_ids)]
+        stale_ids = [point_id for page in self.scroll_point_ids(scroll_filter=stale_filter)
+                     for point_id in page]
+        if stale_ids:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=stale_ids),
+                wait=True,
+            )
+            print(f"Removed {len(stale_ids)} stale chunks of {filename}")
+        # BM25 is matched by file name too, it may hold documents Qdrant no longer has
+        self.bm25_search.delete_file(filename, keep_points=point_ids)
+        return stale_ids
+
+    def list_files(self) -> List[Dict[str, Any]]:
+        """Indexed files with their chunk count, read from the point payloads"""
+        files: Dict[str, Dict[str, Any]] = {}
+        fields = ["metadata.file_name", "metadata.file_hash", "metadata.type"]
+        for points in self._scroll(QDRANT_SCROLL_BATCH_SIZE, None, with_payload=fields):
+            for point in points:
+                metadata = (point.payload or {}).get("metadata") or {}
+                name = metadata.get("file_name")
+                if name is None:
+                    continue
+                entry = files.setdefault(name, {
+                    "file_name": name,
+                    "file_hash": metadata.get("file_hash"),
+                    "type": metadata.get("type"),
+                    "chunks": 0,
+                })
+                entry["chunks"] += 1
+        return sorted(files.values(), key=lambda f: f["file_name"])
+
+    def delete_file(self, filename: str) -> Dict[str, Any]:
+        """Remove one file from Qdrant, BM25 and MinIO without touching the rest"""
+        try:
+            file_filter = self._file_filter(filename)
+            with self.index_write():
+                points = self.client.count(
+                    collection_name=self.collection_name, count_filter=file_filter, exact=True
+                ).count
+                if points:
+                    self.client.delete(
+                        collection_name=self.collection_name,
+                        points_selector=FilterSelector(filter=file_filter),
+                        wait=True,
+                    )
+                bm25_deleted = self.bm25_search.delete_file(filename)
+            stored = self.storage.delete_file(filename)
+            print(f"Deleted {filename}: {points} points, {bm25_deleted} BM25 documents")
+            return {
+                "file_name": filename,
+                "points_deleted": points,
+                "bm25_deleted": bm25_deleted,
+                "storage_deleted": stored,
+            }
+        except Exception as e:
+            print(f"Error deleting file {filename}: {e}")
+            raise e
+
+    def add_documents(self, documents, progress: Optional[Callable[[dict], None]] = None):
         """Thêm documents vào vector store và update BM25"""
         try:
-            vector_store = self.load_vector_store()
-            vector_store.add_documents(documents)
-            print(f"Added {len(documents)} documents to vector store")
+            # Batched, concurrent embedding + upsert; sets metadata["_id"] on
+            # every document so BM25 knows which points it has indexed
+            stats = self.embedding_pipeline.ingest(
+                documents,
+                progress=lambda s: self._report(progress, stage="embed", done=s.chunks,
+                                                total=len(documents))
+            )
+            print(f"Added {stats.chunks} documents to vector store")
 
             #  Update BM25 index bằng instance bm25_search của chính VectorStoreManager
+            self._report(progress, stage="index", total=len(documents))
             self.bm25_search.add_documents(documents)
             print("BM25 index updated incrementally")
             return documents
@@ -269,74 +383,122 @@ class VectorStoreManager:
     def process_idiom(self, file, source_name="idioms"):
         """Process idiom file (PDF) with PyPDF2 and add to Qdrant vector store"""
         try:
-            filename = file.filename
-            if not self.storage.upload_file(file, filename):
-                raise Exception("Failed to upload file to storage")
-
-            pdf_content = self.storage.get_file(filename)
-            if not pdf_content:
-                raise Exception("Failed to retrieve file from storage")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_content)
-                temp_path = temp_file.name
-
-            try:
-                #  Load PDF bằng PyPDF2
-                reader = PdfReader(temp_path)
-                processed_chunks: List[Document] = []
-
-                for page_num, page in enumerate(reader.pages, start=1):
-                    text = page.extract_text()
-                    if not text:
-                        continue
-
-                    for line in text.split("\n"):
-                        line = line.strip()
-                        if not line or " - " not in line:
-                            continue
-
-                        idiom, rest = line.split(" - ", 1)
-                        idiom_doc = Document(
-                            page_content=f"{idiom.strip()} - {rest.strip()}",
-                            metadata={
-                                "file_name": filename,
-                                "page": page_num,
-                                "idiom": idiom.strip(),
-                                "meaning": rest.strip(),
-                                "type": "idiom",
-                                "source": source_name,
-                            }
-                        )
-                        processed_chunks.append(idiom_doc)
-
-                if not processed_chunks:
-                    raise ValueError("No idioms extracted from PDF")
-
-                #  Add vào vector store (BM25 sẽ tự cập nhật)
-                self.add_documents(processed_chunks)
-
-                #  Lấy số lượng points cuối cùng
-                collection_info = self.client.get_collection(self.collection_name)
-                final_count = collection_info.points_count
-
-                print(f" Added {len(processed_chunks)} idioms from {filename}")
-                print(f"Total points in collection: {final_count}")
-
-                return {
-                    "docs": len(reader.pages),
-                    "chunks": len(processed_chunks),
-                    "total_points": final_count,
-                }
-
-            finally:
-                os.unlink(temp_path)
-                print("Temporary file cleaned up")
-
+            # One pass over the upload: stored in MinIO and kept locally for parsing
+            with self.receive_upload(file) as upload:
+                return self.ingest_idiom(upload, file.filename, source_name=source_name)
         except Exception as e:
             print(f"❌ Error processing idioms: {e}")
             raise e
 
+    def ingest_idiom(self, upload: SpooledUpload, filename: str, source_name: str = "idioms",
+                     progress: Optional[Callable[[dict], None]] = None):
+        """Extract idiom lines of a received PDF and add them to Qdrant and BM25
+
+        CSV / TSV / JSONL files go through the bulk importer instead.
+        """
+        fmt = idiom_table_format(filename)
+        if fmt:
+            return self.ingest_idiom_table(upload, filename, fmt, source_name, progress)
+
+        #  Load PDF bằng PyPDF2
+        processed_chunks: List[Document] = []
+        page_count = 0
+
+        for page_num, text in extract_pages(upload.source):
+            self._report(progress, stage="extract", page=page_num)
+            page_count += 1
+            if not text:
+                continue
+
+            for line in text.split("\n"):
+                line = line.strip()
+                if not line or " - " not in line:
+                    continue
+
+                idiom, rest = line.split(" - ", 1)
+                idiom_doc = Document(
+                    page_content=f"{idiom.strip()} - {rest.strip()}",
+                    metadata={
+                        "file_name": filename,
+                        "page": page_num,
+                        "idiom": idiom.strip(),
+                        "meaning": rest.strip(),
+                        "type": "idiom",
+                        "source": source_name,
+                    }
+                )
+                processed_chunks.append(idiom_doc)
+
+        if not processed_chunks:
+            raise ValueError("No idioms extracted from PDF")
+
+        #  Add vào vector store (BM25 sẽ tự cập nhật)
+        self._assign_point_ids(processed_chunks, filename, upload.sha256)
+        with self.index_write():
+            self.add_documents(processed_chunks, progress=progress)
+            self.remove_stale_chunks(filename, [doc.metadata["_id"] for doc in processed_chunks])
+
+        #  Lấy số lượng points cuối cùng
+        collection_info = self.client.get_collection(self.collection_name)
+        final_count = collection_info.points_count
+
+        print(f" Added {len(processed_chunks)} idioms from {filename}")
+        print(f"Total points in collection: {final_count}")
+
+        return {
+            "docs": page_count,
+            "chunks": len(processed_chunks),
+            "total_points": final_count,
+        }
+
+    def ingest_idiom_table(self, upload: SpooledUpload, filename: str, fmt: str,
+                           source_name: str = "idioms",
+                           progress: Optional[Callable[[dict], None]] = None):
+        """Bulk import of a structured idiom list (idiom, meaning[, example] columns)
+
+        Rows are parsed as the embedding pipeline consumes them, so parsing,
+        embedding and upserting overlap. The parsed Documents are still all
+        kept until the end: BM25 gets every row in a single incremental
+        segment and their ids select the stale chunks to remove.
+        """
+        documents: List[Document] = []
+        skipped = 0
+
+        def rows() -> Iterator[Document]:
+            nonlocal skipped
+            for row_num, fields in iter_idiom_rows(upload.source, fmt):
+                if not (fields.get("idiom") and fields.get("meaning")):
+                    skipped += 1
+                    continue
+                doc = idiom_document(fields, row_num, filename, source_name)
+                doc.metadata["file_hash"] = upload.sha256
+                doc.metadata["_id"] = chunk_point_id(filename, upload.sha256, row_num)
+                documents.append(doc)
+                yield doc
+
+        with self.index_write():
+            stats = self.embedding_pipeline.ingest(
+                rows(),
+                progress=lambda s: self._report(progress, stage="embed", done=s.chunks)
+            )
+            if not documents:
+                raise ValueError("No idioms found, expected idiom and meaning columns")
+            print(f"Added {stats.chunks} idioms to vector store, skipped {skipped} rows")
+
+            self._report(progress, stage="index", total=len(documents))
+            self.bm25_search.add_documents(documents)
+            self.remove_stale_chunks(filename, [doc.metadata["_id"] for doc in documents])
+
+        final_count = self.client.get_collection(self.collection_name).points_count
+        print(f" Imported {len(documents)} idioms from {filename}")
+        return {
+            "docs": len(documents) + skipped,
+            "chunks": len(documents),
+            "skipped": skipped,
+            "total_points": final_count,
+            "ingest_stats": stats.to_dict(),
+        }
+
     # def process_idiom_stream(self, file, source_name="idioms"):
     #     """Process idiom file (PDF) with PyPDF2 and stream progress"""
     #     try: